@@ -4,17 +4,115 @@ from typing import Optional, Callable
 from smartcard.System import readers
 from smartcard.util import toHexString
 from smartcard.CardConnection import CardConnection
+from smartcard.scard import (SCardEstablishContext, SCardReleaseContext, SCardGetStatusChange,
+                             SCARD_SCOPE_USER, SCARD_S_SUCCESS, SCARD_STATE_UNAWARE,
+                             SCARD_STATE_PRESENT, SCARD_STATE_CHANGED, SCARD_SHARE_SHARED,
+                             SCARD_LEAVE_CARD)
 import smartcard
 
+from idempotency import TapDeduplicator
+from reader_transport import CardAbsentError, card_type_from_atr
+
+# Pseudo-APDU del ACR122U
+APDU_GET_UID = [0xFF, 0xCA, 0x00, 0x00, 0x00]
+APDU_BUZZER_ON_DETECTION = [0xFF, 0x00, 0x52, 0xFF, 0x00]
+APDU_BUZZER_OFF_DETECTION = [0xFF, 0x00, 0x52, 0x00, 0x00]
+
+
+def led_buzzer_apdu(success: bool, buzzer: bool = True) -> list:
+    """LED (verde/rojo parpadeando) y pitido opcional en un único APDU"""
+    led_state = 0xAA if success else 0x55
+    repetitions = 0x01 if success else 0x03
+    return [0xFF, 0x00, 0x40, led_state, 0x04, 0x02, 0x02, repetitions, 0x01 if buzzer else 0x00]
+
+
+class PCSCTransport:
+    """Acceso PC/SC persistente a un lector.
+
+    El contexto PC/SC y el objeto de conexión se crean una sola vez; cuando
+    la tarjeta se retira solo se desconecta (dejando la tarjeta sin
+    reiniciar) y la siguiente lectura reconecta sobre el mismo contexto. La
+    espera de tarjeta usa ``SCardGetStatusChange`` en lugar de sondear con
+    ``connect``.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.name = str(reader)
+        self.connection = reader.createConnection()
+        self.connected = False
+        hresult, self._hcontext = SCardEstablishContext(SCARD_SCOPE_USER)
+        if hresult != SCARD_S_SUCCESS:
+            self._hcontext = None
+
+    def wait_for_card(self, timeout: float) -> bool:
+        if self._hcontext is None:
+            return True  # sin contexto de estado: que decida connect()
+        hresult, states = SCardGetStatusChange(self._hcontext, 0, [(self.name, SCARD_STATE_UNAWARE)])
+        if hresult != SCARD_S_SUCCESS:
+            return True
+        current = states[0][1] & ~SCARD_STATE_CHANGED
+        if current & SCARD_STATE_PRESENT:
+            return True
+        hresult, states = SCardGetStatusChange(self._hcontext, int(timeout * 1000), [(self.name, current)])
+        return hresult == SCARD_S_SUCCESS and bool(states[0][1] & SCARD_STATE_PRESENT)
+
+    def connect(self):
+        try:
+            self.connection.connect(CardConnection.T1_protocol, SCARD_SHARE_SHARED, SCARD_LEAVE_CARD)
+        except smartcard.Exceptions.NoCardException:
+            raise CardAbsentError()
+        self.connected = True
+        return tuple(self.connection.getATR())
+
+    def transmit(self, apdu):
+        try:
+            return self.connection.transmit(apdu)
+        except (smartcard.Exceptions.NoCardException, smartcard.Exceptions.CardConnectionException):
+            self.disconnect()
+            raise CardAbsentError()
+
+    def disconnect(self):
+        if self.connected:
+            self.connected = False
+            try:
+                self.connection.disconnect()
+            except smartcard.Exceptions.CardConnectionException:
+                pass
+
+    def close(self):
+        self.disconnect()
+        if self._hcontext is not None:
+            SCardReleaseContext(self._hcontext)
+            self._hcontext = None
+
+
 class ACR122UReader:
-    def __init__(self):
+    def __init__(self, user_directory=None, dedup_window: float = 10.0, transport=None,
+                 buzzer_on_detection: bool = False, poll_interval: float = 0.1, removal_misses: int = 3):
         self.reader = None
+        self.transport = transport
         self.connection = None
+        self.card_info = None
+        self.buzzer_on_detection = buzzer_on_detection
+        self.poll_interval = poll_interval
+        self.last_tap_ms = None
+        self.apdu_timings = {}
+        self._atr_cache = {}
+        self._feedback_configured = False
+        self._next_connect = 0.0
         self.monitoring = False
         self.current_card_uid = None
         self.card_removed_callback = None
+        # Una tarjeta que sigue apoyada no se entrega dos veces seguidas; una
+        # lectura fallida aislada (ruido de RF) no cuenta como retirada
+        self.tap_dedup = TapDeduplicator(dedup_window)
+        self.removal_misses = removal_misses
+        self._missed_reads = 0
         
-        # Base de datos de usuarios
+        # Réplica sincronizada del directorio (UserDirectoryReplica); si no hay,
+        # se usa la lista local de respaldo
+        self.user_directory = user_directory
         self.registered_users = {
             "04A1B2C3D4E5": "Ana Lopez",
             "04F6G7H8I9J0": "Carlos Ruiz", 
@@ -30,11 +128,19 @@ class ACR122UReader:
 
     def _get_user_name(self, uid: str) -> str:
         """Obtener nombre del usuario sin mostrar el UID"""
+        if self.user_directory is not None:
+            user = self.user_directory.get(uid)
+            if user:
+                return user['full_name']
         return self.registered_users.get(uid, "Usuario No Registrado")
 
     # ---------- setup ----------
     def initialize_reader(self) -> bool:
         """Detecta el lector y selecciona el primero disponible."""
+        if self.transport is not None:
+            self.reader = self.transport.name
+            print(f"✅ Lector NFC detectado")
+            return True
         try:
             available_readers = readers()
             if not available_readers:
@@ -43,26 +149,85 @@ class ACR122UReader:
 
             print(f"✅ Lector NFC detectado")
             self.reader = available_readers[0]
+            self.transport = PCSCTransport(self.reader)
             return True
         except Exception as e:
             print(f"❌ Error inicializando lector: {e}")
             return False
 
     def connect_to_reader(self) -> bool:
-        """Conecta al lector ACR122U usando T=1 (contactless)."""
+        """Conecta con la tarjeta presente usando T=1 (contactless) sobre el contexto ya abierto."""
+        if not self.transport:
+            print("❌ Lector no inicializado")
+            return False
+        now = time.monotonic()
+        if now < self._next_connect:
+            return False
         try:
-            if not self.reader:
-                print("❌ Lector no inicializado")
-                return False
-
-            self.connection = self.reader.createConnection()
-            self.connection.connect(CardConnection.T1_protocol)
-            return True
-
-        except smartcard.Exceptions.NoCardException:
+            start = time.perf_counter()
+            atr = self.transport.connect()
+            self._record_timing("connect", time.perf_counter() - start)
+        except CardAbsentError:
+            self._next_connect = now + self.poll_interval
             return False
         except Exception as e:
+            # Fallo del lector (no ausencia de tarjeta): espaciar los reintentos
             print(f"❌ Error conectando al lector: {e}")
+            self._next_connect = now + 1.0
+            return False
+
+        self.connection = self.transport
+        self._on_card_connected(atr)
+        return True
+
+    def _on_card_connected(self, atr):
+        card_info = self._atr_cache.get(atr)
+        if card_info is None:
+            card_info = self._atr_cache[atr] = {"atr": toHexString(list(atr)),
+                                                "card_type": card_type_from_atr(atr)}
+        self.card_info = card_info
+
+        if not self._feedback_configured:
+            # Ajuste persistente en el lector: un único APDU por sesión
+            apdu = APDU_BUZZER_ON_DETECTION if self.buzzer_on_detection else APDU_BUZZER_OFF_DETECTION
+            try:
+                self._transmit("buzzer_config", apdu)
+                self._feedback_configured = True
+            except CardAbsentError:
+                self.connection = None
+
+    # ---------- APDU ----------
+    def _transmit(self, name: str, apdu: list):
+        start = time.perf_counter()
+        try:
+            return self.transport.transmit(apdu)
+        finally:
+            self._record_timing(name, time.perf_counter() - start)
+
+    def _record_timing(self, name: str, elapsed: float):
+        stats = self.apdu_timings.get(name)
+        if stats is None:
+            stats = self.apdu_timings[name] = [0, 0.0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+        stats[3] = elapsed
+
+    def get_apdu_timings(self) -> dict:
+        """Tiempos de ida y vuelta por operación, en milisegundos"""
+        return {name: {"count": count, "avg_ms": round(total / count * 1000, 3),
+                       "max_ms": round(worst * 1000, 3), "last_ms": round(last * 1000, 3)}
+                for name, (count, total, worst, last) in self.apdu_timings.items()}
+
+    def signal_result(self, success: bool, buzzer: bool = True) -> bool:
+        """Indicar el resultado con LED y pitido en una sola ida y vuelta"""
+        if not self.connection:
+            return False
+        try:
+            _, sw1, sw2 = self._transmit("led_buzzer", led_buzzer_apdu(success, buzzer))
+            return (sw1, sw2) == (0x90, 0x00)
+        except CardAbsentError:
+            self.connection = None
             return False
 
     # ---------- lectura ----------
@@ -74,8 +239,7 @@ class ACR122UReader:
                     return None
 
             # APDU para obtener UID (ACR122U)
-            get_uid = [0xFF, 0xCA, 0x00, 0x00, 0x00]
-            data, sw1, sw2 = self.connection.transmit(get_uid)
+            data, sw1, sw2 = self._transmit("get_uid", APDU_GET_UID)
 
             if (sw1, sw2) == (0x90, 0x00):
                 uid_hex = self._normalize_uid(data)
@@ -83,9 +247,9 @@ class ACR122UReader:
             else:
                 return None
 
-        except smartcard.Exceptions.NoCardException:
-            return None
-        except smartcard.Exceptions.CardConnectionException as e:
+        except CardAbsentError:
+            # Tarjeta ausente o fallo de RF puntual: se conserva el contexto, solo se
+            # reconectará. La retirada la decide wait_for_card (fallos seguidos o PC/SC)
             self.connection = None
             return None
         except Exception as e:
@@ -99,6 +263,7 @@ class ACR122UReader:
         
         start_time = time.time()
         last_progress = 0
+        held_notice = False
         
         while time.time() - start_time < timeout:
             elapsed = int(time.time() - start_time)
@@ -109,21 +274,41 @@ class ACR122UReader:
                 print(f"⏰ Tiempo restante: {remaining} segundos...")
                 last_progress = elapsed
             
-            # Intentar conectar si no hay conexión
+            # Esperar el evento de tarjeta presente y conectar si no hay conexión
+            tap_started = time.perf_counter()
             if not self.connection:
+                if self.transport and not self.transport.wait_for_card(1.0):
+                    # El estado PC/SC sí es fiable: sin tarjeta en el campo
+                    self._missed_reads = 0
+                    self.tap_dedup.card_left(str(self.reader))
+                    continue
+                tap_started = time.perf_counter()
                 if not self.connect_to_reader():
-                    time.sleep(0.5)
+                    time.sleep(self.poll_interval if self.transport else 0.5)
                     continue
 
             # Intentar leer tarjeta
             uid = self.read_nfc_card()
             if uid:
+                self._missed_reads = 0
+            else:
+                self._missed_reads += 1
+                if self._missed_reads >= self.removal_misses:
+                    self.tap_dedup.card_left(str(self.reader))
+            if uid and self.tap_dedup.is_duplicate(uid, str(self.reader)):
+                if not held_notice:
+                    print("   (Retire la tarjeta y vuelva a acercarla)")
+                    held_notice = True
+                time.sleep(0.3)
+                continue
+            if uid:
+                self.last_tap_ms = (time.perf_counter() - tap_started) * 1000
                 user_name = self._get_user_name(uid)
                 print(f"✅ Tarjeta detectada: {user_name}")
                 self.current_card_uid = uid
                 return uid
 
-            time.sleep(0.3)  # Pequeña pausa entre intentos
+            time.sleep(self.poll_interval)  # Pequeña pausa entre intentos
 
         print(f"⏰ Timeout: No se detectó tarjeta en {timeout} segundos")
         return None
@@ -181,18 +366,19 @@ class ACR122UReader:
         """Prueba de conexión básica"""
         if not self.reader:
             return False
-        try:
-            self.connection = self.reader.createConnection()
-            self.connection.connect()
-            return True
-        except:
-            return False
+        return self.connection is not None or self.connect_to_reader()
 
     def disconnect(self):
         try:
             if self.connection:
-                self.connection.disconnect()
+                self.transport.disconnect()
                 self.connection = None
                 self.stop_monitoring()
         except:
             pass
+
+    def close(self):
+        """Desconectar y liberar el contexto PC/SC"""
+        self.disconnect()
+        if self.transport:
+            self.transport.close()
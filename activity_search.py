@@ -0,0 +1,78 @@
+import re
+
+# unicode61 sin diacríticos: "sesion" encuentra "Sesión" y "informacion" encuentra "Información"
+FTS_TOKENIZE = "unicode61 remove_diacritics 2"
+SNIPPET_OPEN, SNIPPET_CLOSE, SNIPPET_ELLIPSIS = "<mark>", "</mark>", "…"
+
+_TERM = re.compile(r'"([^"]+)"|(\S+)')
+# Palabras vacías: aparecen en casi todas las filas y en un AND no filtran nada
+STOPWORDS = frozenset("a al con de del e el en la las lo los o para por que se su un una y".split())
+
+
+def fts_query(text: str):
+    """Convertir lo que escribe el investigador en una expresión MATCH segura.
+
+    Cada palabra se cita (los términos se combinan con AND y no se
+    interpretan operadores ni sintaxis de columnas); ``"frase exacta"`` se
+    respeta y ``palabra*`` busca por prefijo. Las palabras vacías sueltas se
+    omiten salvo que no haya otra cosa. Devuelve None si no queda ningún
+    término.
+    """
+    terms, stopwords = [], []
+    for phrase, word in _TERM.findall(text or ""):
+        if phrase:
+            terms.append('"' + phrase.strip() + '"')
+            continue
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', "")
+        if not word:
+            continue
+        term = '"' + word + '"' + ("*" if prefix else "")
+        (stopwords if not prefix and word.lower() in STOPWORDS else terms).append(term)
+    return " ".join(terms or stopwords) or None
+
+
+def create_fts_index(cursor, table: str, columns: tuple, fts_table: str = None):
+    """Índice FTS5 de contenido externo sobre ``table`` mantenido por triggers.
+
+    El índice no duplica el texto (lo lee de ``table`` por rowid) y los
+    triggers lo mantienen al día con cualquier escritor, incluidos los
+    inserts por lotes y otros procesos. La primera vez se indexan las filas
+    que ya existían. Devuelve el nombre de la tabla FTS.
+    """
+    fts_table = fts_table or f"{table}_fts"
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                            (fts_table,)).fetchone()
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+            {column_list}, content='{table}', content_rowid='id', tokenize='{FTS_TOKENIZE}'
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{fts_table}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{fts_table}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{fts_table}_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    ''')
+    if not exists:
+        cursor.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+    return fts_table
+
+
+def snippet_sql(fts_table: str, column: int, tokens: int = 12) -> str:
+    """Expresión ``snippet()`` con las marcas comunes de la API y el cliente"""
+    return (f"snippet({fts_table}, {column}, '{SNIPPET_OPEN}', '{SNIPPET_CLOSE}', "
+            f"'{SNIPPET_ELLIPSIS}', {tokens})")
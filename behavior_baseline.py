@@ -0,0 +1,378 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+SLOTS = 168  # horas de la semana en UTC; 0 = lunes 00:00
+EPOCH_SLOT = 72  # 1970-01-01 00:00 UTC fue jueves
+DEVICE_BITS = 20
+# Con el umbral por defecto (0.7) basta una hora y un día nunca vistos, o una
+# hora rara en un lector nuevo; un lector nuevo a una hora habitual no alerta
+HOUR_WEIGHT, DAY_WEIGHT, DEVICE_WEIGHT = 0.45, 0.3, 0.25
+
+SOURCES = {
+    'auth_logs': '''
+        SELECT user_id, device_id, auth_timestamp FROM auth_logs
+        WHERE id > ? AND id <= ? AND auth_success = 1 AND user_id > 0
+    ''',
+    'session_activities': '''
+        SELECT us.user_id, NULL, sa.timestamp FROM session_activities sa
+        JOIN user_sessions us ON us.id = sa.session_id
+        WHERE sa.id > ? AND sa.id <= ? AND us.user_id > 0
+    ''',
+}
+TOUCHED_USERS = {
+    'auth_logs': '''
+        SELECT DISTINCT user_id FROM auth_logs
+        WHERE id > ? AND id <= ? AND auth_success = 1 AND user_id > 0
+    ''',
+    'session_activities': '''
+        SELECT DISTINCT us.user_id FROM session_activities sa
+        JOIN user_sessions us ON us.id = sa.session_id
+        WHERE sa.id > ? AND sa.id <= ? AND us.user_id > 0
+    ''',
+}
+
+
+def hour_of_week(epoch_hours):
+    return (epoch_hours + EPOCH_SLOT) % SLOTS
+
+
+class BehaviorBaselines:
+    """Líneas base de comportamiento por usuario y puntuación de anomalías.
+
+    Cada usuario tiene un histograma de horas de la semana (168 huecos,
+    UTC) con decaimiento exponencial de ``half_life_days``, alimentado por
+    sus fichajes correctos y, con peso ``activity_weight``, por sus
+    actividades de sesión, más el conjunto de lectores donde ha fichado.
+    ``refresh`` lee solo las filas nuevas de ``auth_logs`` y
+    ``session_activities`` (cursores por id) con operaciones NumPy por
+    lotes y guarda los usuarios modificados en SQLite (histograma float16
+    comprimido, unos cientos de bytes por usuario).
+
+    Tras cada refresco se precalcula por usuario la rareza de cada hora de
+    la semana, así que ``score`` es una búsqueda en un array más un
+    ``searchsorted`` para el lector: unos µs. La puntuación está en [0, 1]
+    (hora inusual, día inusual, lector nuevo) y se atenúa para usuarios con
+    menos de ``min_events`` fichajes.
+    """
+
+    def __init__(self, db_path: str, half_life_days: float = 30.0, min_events: float = 20.0,
+                 activity_weight: float = 0.2, chunk_size: int = 100000, clock=time.time):
+        self.db_path = db_path
+        self.half_life_hours = half_life_days * 24.0
+        self.min_events = min_events
+        self.activity_weight = activity_weight
+        self.chunk_size = chunk_size
+        self.clock = clock
+        self._index = {}  # user_id -> fila
+        self._user_ids = []
+        self._hours = np.zeros((0, SLOTS), np.float32)
+        self._time_score = np.zeros((0, SLOTS), np.float16)
+        self._confidence = np.zeros(0, np.float32)
+        self._device_index = {}  # device_id -> código
+        self._device_names = []
+        self._devices = (np.zeros(0, np.int64), np.zeros(0, np.int64))  # (fila << 20 | código, fichajes)
+        self._cursors = dict.fromkeys(SOURCES, 0)
+        self._as_of = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_refresh = None
+        self._create_tables()
+        self._load()
+
+    # ---------- persistencia ----------
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _create_tables(self):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS behavior_baselines (
+                    user_id INTEGER PRIMARY KEY,
+                    hours BLOB NOT NULL,
+                    as_of REAL NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS behavior_devices (
+                    user_id INTEGER NOT NULL,
+                    device_id TEXT NOT NULL,
+                    seen INTEGER NOT NULL,
+                    PRIMARY KEY (user_id, device_id)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS behavior_cursors (
+                    source TEXT PRIMARY KEY,
+                    last_id INTEGER NOT NULL
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _load(self):
+        """Cargar las líneas base guardadas, envejecidas hasta ahora"""
+        now = self.clock() / 3600.0
+        conn = self._connect()
+        try:
+            self._cursors.update(conn.execute('SELECT source, last_id FROM behavior_cursors').fetchall())
+            stored = conn.execute('SELECT user_id, hours, as_of FROM behavior_baselines').fetchall()
+            devices = conn.execute('SELECT user_id, device_id, seen FROM behavior_devices').fetchall()
+        finally:
+            conn.close()
+        if stored:
+            rows = self._rows_for([user_id for user_id, _, _ in stored])
+            for row, (_, blob, as_of) in zip(rows.tolist(), stored):
+                hours = np.frombuffer(zlib.decompress(blob), np.float16).astype(np.float32)
+                self._hours[row] = hours * np.float32(self._decay(now - as_of))
+        if devices:
+            rows = self._rows_for([user_id for user_id, _, _ in devices])
+            codes = np.array([self._device_code(device_id) for _, device_id, _ in devices], np.int64)
+            keys = (rows << DEVICE_BITS) | codes
+            order = np.argsort(keys)
+            self._devices = (keys[order], np.array([seen for _, _, seen in devices], np.int64)[order])
+        self._as_of = now
+        self._update_scores(np.arange(len(self._user_ids)))
+
+    def _persist(self, conn, high: dict):
+        """Guardar los usuarios con eventos posteriores a los cursores almacenados.
+
+        Con varios workers cada uno refresca en memoria; solo escribe quien
+        llega más lejos que lo guardado, y escribe todos los usuarios con
+        eventos desde el cursor almacenado (no desde el suyo) para que el
+        estado persistido sea coherente con el cursor.
+        """
+        conn.execute('BEGIN IMMEDIATE')
+        stored = dict.fromkeys(SOURCES, 0)
+        stored.update(conn.execute('SELECT source, last_id FROM behavior_cursors').fetchall())
+        if all(stored[source] >= high[source] for source in SOURCES):
+            conn.rollback()
+            return 0
+        users = set()
+        for source, sql in TOUCHED_USERS.items():
+            if stored[source] < high[source]:
+                users.update(row[0] for row in conn.execute(sql, (stored[source], high[source])))
+        users = [user_id for user_id in users if user_id in self._index]
+        keys, counts = self._devices
+        names = self._device_names
+        baselines, devices = [], []
+        for user_id in users:
+            row = self._index[user_id]
+            blob = zlib.compress(self._hours[row].astype(np.float16).tobytes(), 1)
+            baselines.append((user_id, blob, self._as_of))
+            start, end = np.searchsorted(keys, [row << DEVICE_BITS, (row + 1) << DEVICE_BITS])
+            codes = (keys[start:end] & ((1 << DEVICE_BITS) - 1)).tolist()
+            devices.extend((user_id, names[code], seen) for code, seen in zip(codes, counts[start:end].tolist()))
+        conn.executemany('''
+            INSERT OR REPLACE INTO behavior_baselines (user_id, hours, as_of, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', baselines)
+        conn.executemany('INSERT OR REPLACE INTO behavior_devices (user_id, device_id, seen) VALUES (?, ?, ?)',
+                         devices)
+        conn.executemany('INSERT OR REPLACE INTO behavior_cursors (source, last_id) VALUES (?, ?)',
+                         [(source, max(stored[source], high[source])) for source in SOURCES])
+        conn.commit()
+        return len(baselines)
+
+    # ---------- construcción ----------
+    def _decay(self, age_hours):
+        return 0.5 ** (age_hours / self.half_life_hours)
+
+    def _device_code(self, device_id: str) -> int:
+        code = self._device_index.get(device_id)
+        if code is None:
+            code = len(self._device_names)
+            self._device_names.append(device_id)
+            self._device_index[device_id] = code
+        return code
+
+    def _rows_for(self, user_ids) -> np.ndarray:
+        """Fila de cada usuario; los nuevos se añaden tras ampliar los arrays"""
+        unique, inverse = np.unique(np.asarray(user_ids, np.int64), return_inverse=True)
+        new = [user_id for user_id in unique.tolist() if user_id not in self._index]
+        if new:
+            size = len(self._user_ids) + len(new)
+            if size > len(self._hours):
+                capacity = max(size, 2 * len(self._hours), 64)
+                hours = np.zeros((capacity, SLOTS), np.float32)
+                hours[:len(self._hours)] = self._hours
+                time_score = np.zeros((capacity, SLOTS), np.float16)
+                time_score[:len(self._time_score)] = self._time_score
+                confidence = np.zeros(capacity, np.float32)
+                confidence[:len(self._confidence)] = self._confidence
+                self._hours, self._time_score, self._confidence = hours, time_score, confidence
+            for user_id in new:
+                self._index[user_id] = len(self._user_ids)
+                self._user_ids.append(user_id)
+        rows = np.fromiter((self._index[user_id] for user_id in unique.tolist()), np.int64, len(unique))
+        return rows[inverse]
+
+    def _update_scores(self, rows: np.ndarray):
+        """Rareza precalculada por hora de la semana (hora con vecinas + día) de ``rows``"""
+        n = len(self._user_ids)
+        self._confidence[:n] = np.minimum(1.0, self._hours[:n].sum(axis=1) / self.min_events)
+        if not len(rows):
+            return
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows[start:start + self.chunk_size]
+            hours = self._hours[chunk]
+            total = np.maximum(hours.sum(axis=1, keepdims=True), 1e-6)
+            smooth = (0.5 * hours + 0.25 * np.roll(hours, 1, axis=1) + 0.25 * np.roll(hours, -1, axis=1)) / total
+            hour_rarity = 1.0 / (1.0 + 4.0 * SLOTS * smooth)
+            day_share = hours.reshape(len(chunk), 7, 24).sum(axis=2) / total
+            day_rarity = np.repeat(1.0 / (1.0 + 4.0 * 7 * day_share), 24, axis=1)
+            self._time_score[chunk] = (HOUR_WEIGHT * hour_rarity + DAY_WEIGHT * day_rarity).astype(np.float16)
+
+    def refresh(self) -> dict:
+        """Incorporar los eventos nuevos y guardar los usuarios afectados"""
+        with self._refresh_lock:
+            started = time.perf_counter()
+            now = self.clock() / 3600.0
+            conn = self._connect()
+            try:
+                high = {source: conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {source}').fetchone()[0]
+                        for source in SOURCES}
+                if self._as_of is not None and len(self._user_ids):
+                    self._hours[:len(self._user_ids)] *= np.float32(self._decay(max(0.0, now - self._as_of)))
+                self._as_of = now
+
+                touched, pairs, events = [], [], dict.fromkeys(SOURCES, 0)
+                for source, sql in SOURCES.items():
+                    weight = 1.0 if source == 'auth_logs' else self.activity_weight
+                    cursor = conn.execute(sql, (self._cursors[source], high[source]))
+                    while True:
+                        batch = cursor.fetchmany(self.chunk_size)
+                        if not batch:
+                            break
+                        user_ids, device_ids, stamps = zip(*batch)
+                        rows = self._rows_for(user_ids)
+                        epoch_hours = np.array(stamps, dtype='datetime64[s]').astype('datetime64[h]').astype(np.int64)
+                        weights = weight * self._decay(np.maximum(now - epoch_hours, 0.0))
+                        np.add.at(self._hours, (rows, hour_of_week(epoch_hours)), weights.astype(np.float32))
+                        if source == 'auth_logs':
+                            codes = {device_id: self._device_code(device_id) for device_id in set(device_ids)}
+                            pairs.append((rows << DEVICE_BITS)
+                                         | np.fromiter((codes[d] for d in device_ids), np.int64, len(device_ids)))
+                        touched.append(rows)
+                        events[source] += len(batch)
+                    self._cursors[source] = high[source]
+
+                if pairs:
+                    self._merge_devices(np.concatenate(pairs))
+                touched = np.unique(np.concatenate(touched)) if touched else np.zeros(0, np.int64)
+                self._update_scores(touched)
+                persisted = self._persist(conn, high)
+            finally:
+                conn.close()
+            self.last_refresh = time.time()
+            return {'auth_events': events['auth_logs'], 'activity_events': events['session_activities'],
+                    'users_touched': len(touched), 'users': len(self._user_ids),
+                    'devices': len(self._device_names), 'persisted': persisted,
+                    'memory_mb': round(self.memory_bytes() / 1e6, 1),
+                    'seconds': round(time.perf_counter() - started, 3)}
+
+    def _merge_devices(self, pairs: np.ndarray):
+        keys, counts = self._devices
+        new_keys, new_counts = np.unique(pairs, return_counts=True)
+        merged, inverse = np.unique(np.concatenate([keys, new_keys]), return_inverse=True)
+        merged_counts = np.zeros(len(merged), np.int64)
+        np.add.at(merged_counts, inverse, np.concatenate([counts, new_counts]))
+        self._devices = (merged, merged_counts)
+
+    # ---------- puntuación ----------
+    def score(self, user_id: int, device_id: str, timestamp: float = None):
+        """Puntuación de anomalía en [0, 1] de un fichaje, o None si el usuario no tiene línea base"""
+        row = self._index.get(user_id)
+        if row is None:
+            return None
+        slot = (int((timestamp if timestamp is not None else self.clock()) // 3600) + EPOCH_SLOT) % SLOTS
+        device_penalty = DEVICE_WEIGHT
+        code = self._device_index.get(device_id)
+        if code is not None:
+            keys = self._devices[0]
+            key = (row << DEVICE_BITS) | code
+            position = keys.searchsorted(key)
+            if position < len(keys) and keys[position] == key:
+                device_penalty = 0.0
+        return float(self._confidence[row]) * (float(self._time_score[row, slot]) + device_penalty)
+
+    def explain(self, user_id: int, device_id: str, timestamp: float = None) -> dict:
+        """Desglose de la puntuación (para el detalle de las alertas)"""
+        row = self._index.get(user_id)
+        if row is None:
+            return {'score': None, 'reason': 'sin línea base'}
+        timestamp = timestamp if timestamp is not None else self.clock()
+        slot = (int(timestamp // 3600) + EPOCH_SLOT) % SLOTS
+        hours = self._hours[row]
+        total = max(float(hours.sum()), 1e-6)
+        smooth = (0.5 * hours[slot] + 0.25 * hours[slot - 1] + 0.25 * hours[(slot + 1) % SLOTS]) / total
+        day_share = float(hours[slot - slot % 24:slot - slot % 24 + 24].sum()) / total
+        keys = self._devices[0]
+        code = self._device_index.get(device_id)
+        key = (row << DEVICE_BITS) | code if code is not None else None
+        position = keys.searchsorted(key) if key is not None else len(keys)
+        new_device = not (position < len(keys) and keys[position] == key)
+        return {'score': round(self.score(user_id, device_id, timestamp), 3),
+                'hour_rarity': round(1.0 / (1.0 + 4.0 * SLOTS * float(smooth)), 3),
+                'day_rarity': round(1.0 / (1.0 + 4.0 * 7 * day_share), 3),
+                'new_device': new_device,
+                'confidence': round(float(self._confidence[row]), 3),
+                'hour_of_week': slot}
+
+    def memory_bytes(self) -> int:
+        return (self._hours.nbytes + self._time_score.nbytes + self._confidence.nbytes
+                + self._devices[0].nbytes + self._devices[1].nbytes)
+
+    def __len__(self):
+        return len(self._user_ids)
+
+    # ---------- refresco periódico ----------
+    def start(self, interval: float = 300.0):
+        """Refrescar en segundo plano cada ``interval`` segundos (el primero, al arrancar)"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def _run(self, interval: float):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except (sqlite3.Error, ValueError) as e:
+                print(f"⚠️ Error refrescando líneas base de comportamiento: {e}")
+            self._stop.wait(interval)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Líneas base de comportamiento por usuario")
+    parser.add_argument("--db", default=os.environ.get("NFC_DB_PATH", "nfc_auth_system.db"))
+    parser.add_argument("--half-life-days", type=float, default=30.0)
+    parser.add_argument("--score", nargs=2, metavar=("USER_ID", "DEVICE_ID"),
+                        help="Desglosar la puntuación de un fichaje de ahora (o de --at)")
+    parser.add_argument("--at", help="Fecha y hora UTC del fichaje a puntuar (ISO 8601)")
+    args = parser.parse_args()
+
+    baselines = BehaviorBaselines(args.db, half_life_days=args.half_life_days)
+    stats = baselines.refresh()
+    print(f"✅ Líneas base actualizadas: {stats}")
+    if args.score:
+        at = None
+        if args.at:
+            at = float(np.datetime64(args.at.replace(' ', 'T'), 's').astype(np.int64))
+        print(f"🔍 {baselines.explain(int(args.score[0]), args.score[1], at)}")
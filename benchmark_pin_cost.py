@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from pin_hasher import PinHasher, PinVerifier, DEFAULT_SCRYPT_R, DEFAULT_SCRYPT_P
+
+
+def percentile(values, pct: float) -> float:
+    """Percentil por rango más cercano"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def measure_cost(n: int, r: int, p: int, requests: int, concurrency: int, workers: int):
+    """Medir latencia de verificación bajo carga concurrente para un coste dado"""
+    hasher = PinHasher(n=n, r=r, p=p)
+    verifier = PinVerifier(hasher, max_workers=workers, max_pending=max(concurrency, workers))
+    stored = hasher.hash_pin("1234")
+    latencies = []
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            start = time.perf_counter()
+            await verifier.verify("1234", stored)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall = time.perf_counter() - wall_start
+    verifier.shutdown()
+
+    return {
+        "n": n, "r": r, "p": p,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "throughput_per_s": round(requests / wall, 1),
+    }
+
+
+async def size_cost(target_p99_ms: float, r: int, p: int, requests: int,
+                    concurrency: int, workers: int, max_log_n: int):
+    """Probar N = 2^10 .. 2^max_log_n y elegir el mayor que cumple el p99 objetivo"""
+    results = []
+    chosen = None
+    for log_n in range(10, max_log_n + 1):
+        result = await measure_cost(2 ** log_n, r, p, requests, concurrency, workers)
+        results.append(result)
+        print(f"   N=2^{log_n:<2} p50={result['p50_ms']:>8.2f} ms  p99={result['p99_ms']:>8.2f} ms  "
+              f"{result['throughput_per_s']:>8.1f} verif/s")
+        if result["p99_ms"] > target_p99_ms:
+            break
+        chosen = result
+    return chosen, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dimensionar el coste scrypt para un p99 objetivo")
+    parser.add_argument("--target-p99-ms", type=float, default=50.0)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--r", type=int, default=DEFAULT_SCRYPT_R)
+    parser.add_argument("--p", type=int, default=DEFAULT_SCRYPT_P)
+    parser.add_argument("--max-log-n", type=int, default=18)
+    parser.add_argument("--json", help="Guardar resultados en este fichero JSON")
+    args = parser.parse_args()
+
+    print(f"⏱️  Dimensionando coste de PIN para p99 <= {args.target_p99_ms} ms "
+          f"({args.concurrency} concurrentes, {args.workers} workers)")
+    chosen, results = asyncio.run(size_cost(args.target_p99_ms, args.r, args.p, args.requests,
+                                            args.concurrency, args.workers, args.max_log_n))
+
+    if chosen:
+        print(f"\n✅ Coste recomendado: NFC_PIN_SCRYPT_N={chosen['n']} "
+              f"NFC_PIN_SCRYPT_R={chosen['r']} NFC_PIN_SCRYPT_P={chosen['p']}")
+    else:
+        print("\n❌ Ningún coste probado cumple el objetivo; aumente workers o el p99 objetivo")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"target_p99_ms": args.target_p99_ms, "chosen": chosen, "results": results}, f, indent=2)
+        print(f"📄 Resultados guardados en {args.json}")
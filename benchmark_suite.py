@@ -0,0 +1,532 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from synthetic_data import synthetic_nfc_id, SYNTHETIC_PIN, ACTIVITY_TEXTS
+
+# ------------------- Utilidades -------------------
+
+def summarize(name: str, group: str, latencies: list, wall: float) -> dict:
+    """Estadísticas de latencia en microsegundos"""
+    ordered = sorted(latencies)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+    return {
+        "name": name,
+        "group": group,
+        "iterations": len(ordered),
+        "mean_us": round(statistics.fmean(ordered) * 1e6, 2),
+        "p50_us": round(pick(50) * 1e6, 2),
+        "p95_us": round(pick(95) * 1e6, 2),
+        "p99_us": round(pick(99) * 1e6, 2),
+        "max_us": round(ordered[-1] * 1e6, 2),
+        "ops_per_s": round(len(ordered) / wall, 1) if wall > 0 else None,
+    }
+
+
+def run_timed(fn, iterations: int, warmup: int):
+    """Ejecutar ``fn(i)`` midiendo cada llamada"""
+    for i in range(warmup):
+        fn(i)
+    latencies = []
+    wall_start = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies, time.perf_counter() - wall_start
+
+
+@contextlib.contextmanager
+def quiet(enabled: bool = True):
+    """Silenciar los print() del sistema durante la medición"""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+async def asgi_request(app, method: str, path: str, body: dict = None, headers: dict = None):
+    """Cliente ASGI mínimo en proceso: devuelve ``(status, headers, body)``"""
+    path, _, query = path.partition("?")
+    payload = json.dumps(body).encode() if body is not None else b""
+    raw_headers = [(b"host", b"benchmark"), (b"content-length", str(len(payload)).encode())]
+    if body is not None:
+        raw_headers.append((b"content-type", b"application/json"))
+    for key, value in (headers or {}).items():
+        raw_headers.append((key.lower().encode(), str(value).encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": query.encode(), "root_path": "", "headers": raw_headers,
+        "client": ("127.0.0.1", 50000), "server": ("benchmark", 80),
+    }
+    pending = [{"type": "http.request", "body": payload, "more_body": False}]
+    done = asyncio.Event()
+    response = {"status": None, "headers": {}, "body": b""}
+
+    async def receive():
+        if pending:
+            return pending.pop(0)
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode(): v.decode() for k, v in message.get("headers", [])}
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+            if not message.get("more_body"):
+                done.set()
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], response["body"]
+
+
+# ------------------- Contexto -------------------
+
+class BenchmarkContext:
+    """Estado compartido por los benchmarks sobre una base de datos sintética"""
+
+    def __init__(self, db_name: str, seed: int = 7):
+        from database import DatabaseManager
+
+        self.db_name = db_name
+        self.rng = random.Random(seed)
+        with quiet():
+            self.db = DatabaseManager(db_name)
+        conn = sqlite3.connect(db_name)
+        try:
+            self.user_count = conn.execute(
+                "SELECT COUNT(*) FROM nfc_users WHERE nfc_id LIKE '5E%'").fetchone()[0]
+            self.session_tokens = [row[0] for row in conn.execute(
+                "SELECT session_token FROM user_sessions ORDER BY RANDOM() LIMIT 1000")]
+            self.row_counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                               for table in ("nfc_users", "auth_logs", "user_sessions", "session_activities")}
+        finally:
+            conn.close()
+        if not self.user_count:
+            raise SystemExit("❌ La base de datos no tiene usuarios sintéticos; ejecute synthetic_data.py")
+
+    def random_nfc_id(self) -> str:
+        return synthetic_nfc_id(self.rng.randrange(self.user_count))
+
+
+# ------------------- Benchmarks -------------------
+# Cada benchmark recibe (ctx, iterations, warmup) y devuelve un resumen.
+
+def bench_get_user_by_nfc(ctx, iterations, warmup):
+    ids = [ctx.random_nfc_id() for _ in range(iterations + warmup)]
+    latencies, wall = run_timed(lambda i: ctx.db.get_user_by_nfc(ids[i]), iterations, warmup)
+    return summarize("get_user_by_nfc", "micro", latencies, wall)
+
+
+def bench_get_user_by_nfc_miss(ctx, iterations, warmup):
+    latencies, wall = run_timed(lambda i: ctx.db.get_user_by_nfc(f"FF{i:08X}"), iterations, warmup)
+    return summarize("get_user_by_nfc_miss", "micro", latencies, wall)
+
+
+def bench_log_auth_attempt(ctx, iterations, warmup):
+    def one(i):
+        ctx.db.log_auth_attempt(1, ctx.random_nfc_id(), "ACR122U-BENCH", i % 10 != 0,
+                                f"0xbench{i:014x}", None if i % 10 else "PIN incorrecto")
+    with quiet():
+        latencies, wall = run_timed(one, iterations, warmup)
+    return summarize("log_auth_attempt", "micro", latencies, wall)
+
+
+def bench_get_auth_logs(ctx, iterations, warmup):
+    latencies, wall = run_timed(lambda i: ctx.db.get_auth_logs(50), iterations, warmup)
+    return summarize("get_auth_logs", "micro", latencies, wall)
+
+
+def bench_get_session_activities(ctx, iterations, warmup):
+    if not ctx.session_tokens:
+        return None
+    tokens = ctx.session_tokens
+    latencies, wall = run_timed(lambda i: ctx.db.get_session_activities(tokens[i % len(tokens)]),
+                                iterations, warmup)
+    return summarize("get_session_activities", "micro", latencies, wall)
+
+
+def _search_queries(ctx, count: int) -> list:
+    """Mezcla de términos frecuentes ("USB", "confidencial") y de búsquedas concretas con número"""
+    common = ["USB", "confidencial", "informe semanal", "correo adjunto", "descarga masiva",
+              "acceso restringido", "copia seguridad", "expediente"]
+    queries = []
+    for i in range(count):
+        if i % 2:
+            text = ACTIVITY_TEXTS[ctx.rng.randrange(len(ACTIVITY_TEXTS))].format(n=ctx.rng.randrange(100000))
+            queries.append(text.split(" ", 1)[1] if i % 4 == 1 else text)
+        else:
+            queries.append(common[ctx.rng.randrange(len(common))])
+    return queries
+
+
+def bench_activity_search(ctx, iterations, warmup):
+    """Búsqueda FTS5 ordenada por relevancia (bm25) con fragmentos"""
+    if not ctx.row_counts["session_activities"]:
+        return None
+    queries = _search_queries(ctx, iterations + warmup)
+    latencies, wall = run_timed(lambda i: ctx.db.search_session_activities(queries[i], limit=20),
+                                iterations, warmup)
+    return summarize("activity_search", "micro", latencies, wall)
+
+
+def bench_activity_search_recent(ctx, iterations, warmup):
+    """Búsqueda FTS5 de las coincidencias más recientes"""
+    if not ctx.row_counts["session_activities"]:
+        return None
+    queries = _search_queries(ctx, iterations + warmup)
+    latencies, wall = run_timed(
+        lambda i: ctx.db.search_session_activities(queries[i], order="recent", limit=20), iterations, warmup)
+    return summarize("activity_search_recent", "micro", latencies, wall)
+
+
+def bench_activity_search_like(ctx, iterations, warmup):
+    """Referencia: LIKE '%texto%' (recorrido completo); limitado a 50 iteraciones"""
+    if not ctx.row_counts["session_activities"]:
+        return None
+    iterations, warmup = min(iterations, 50), min(warmup, 2)
+    queries = _search_queries(ctx, iterations + warmup)
+    conn = sqlite3.connect(ctx.db_name)
+    one = lambda i: conn.execute('''
+        SELECT id, activity_type, activity_description, timestamp FROM session_activities
+        WHERE activity_description LIKE ? ORDER BY timestamp DESC LIMIT 20
+    ''', (f"%{queries[i]}%",)).fetchall()
+    try:
+        latencies, wall = run_timed(one, iterations, warmup)
+    finally:
+        conn.close()
+    return summarize("activity_search_like", "micro", latencies, wall)
+
+
+def _report_ranges(ctx, count: int) -> list:
+    """Rangos de 1 a 30 días dentro del periodo sintético"""
+    end = datetime(2025, 11, 1)
+    ranges = []
+    for _ in range(count):
+        days = ctx.rng.randint(1, 30)
+        start = end - timedelta(days=ctx.rng.randint(days, 90))
+        ranges.append((start.strftime('%Y-%m-%d %H:%M:%S'),
+                       (start + timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')))
+    return ranges
+
+
+def _report_device(ctx) -> str:
+    return f"ACR122U-SIM-{ctx.rng.randrange(200):03d}"
+
+
+def bench_report_auth_by_device(ctx, iterations, warmup):
+    """Fallos por hora de un dispositivo (panel de dashboard) desde rollup_auth_device_hourly"""
+    ranges = _report_ranges(ctx, iterations + warmup)
+    devices = [_report_device(ctx) for _ in ranges]
+    latencies, wall = run_timed(
+        lambda i: ctx.db.get_rollup_report("auth_by_device", *ranges[i], key=devices[i], granularity="hour"),
+        iterations, warmup)
+    return summarize("report_auth_by_device", "micro", latencies, wall)
+
+
+def bench_report_auth_by_device_scan(ctx, iterations, warmup):
+    """Referencia: el mismo informe agregando auth_logs; limitado a 50 iteraciones"""
+    iterations, warmup = min(iterations, 50), min(warmup, 2)
+    ranges = _report_ranges(ctx, iterations + warmup)
+    devices = [_report_device(ctx) for _ in ranges]
+    conn = sqlite3.connect(ctx.db_name)
+    one = lambda i: conn.execute('''
+        SELECT substr(auth_timestamp, 1, 13) AS hour, COUNT(*), SUM(NOT auth_success)
+        FROM auth_logs WHERE auth_timestamp >= ? AND auth_timestamp < ? AND device_id = ?
+        GROUP BY hour ORDER BY hour
+    ''', ranges[i] + (devices[i],)).fetchall()
+    try:
+        latencies, wall = run_timed(one, iterations, warmup)
+    finally:
+        conn.close()
+    return summarize("report_auth_by_device_scan", "micro", latencies, wall)
+
+
+def bench_report_auth_by_department(ctx, iterations, warmup):
+    """Autenticaciones por departamento y día desde rollup_auth_department_daily"""
+    ranges = _report_ranges(ctx, iterations + warmup)
+    latencies, wall = run_timed(lambda i: ctx.db.get_rollup_report("auth_by_department", *ranges[i]),
+                                iterations, warmup)
+    return summarize("report_auth_by_department", "micro", latencies, wall)
+
+
+def bench_report_sessions_by_department(ctx, iterations, warmup):
+    """Duración media de sesión por departamento y día desde rollup_sessions_daily"""
+    ranges = _report_ranges(ctx, iterations + warmup)
+    latencies, wall = run_timed(lambda i: ctx.db.get_rollup_report("sessions_by_department", *ranges[i]),
+                                iterations, warmup)
+    return summarize("report_sessions_by_department", "micro", latencies, wall)
+
+
+def bench_anomaly_score(ctx, iterations, warmup):
+    """Puntuación de un fichaje frente a la línea base del usuario (construida antes de medir)"""
+    try:
+        from behavior_baseline import BehaviorBaselines
+    except ImportError:
+        return None
+    baselines = BehaviorBaselines(ctx.db_name)
+    baselines.refresh()
+    if not len(baselines):
+        return None
+    user_ids = list(baselines._index)
+    samples = [(ctx.rng.choice(user_ids), _report_device(ctx), 1700000000.0 + ctx.rng.randrange(604800))
+               for _ in range(iterations + warmup)]
+    latencies, wall = run_timed(lambda i: baselines.score(*samples[i]), iterations, warmup)
+    return summarize("anomaly_score", "micro", latencies, wall)
+
+
+def bench_ledger_append(ctx, iterations, warmup):
+    from blockchain_simulated import BlockchainSimulated
+
+    with quiet():
+        ledger = BlockchainSimulated()
+        latencies, wall = run_timed(
+            lambda i: ledger.record_auth_attempt(f"user{i}", 1700000000.0 + i, "ACR122U-BENCH",
+                                                 synthetic_nfc_id(i), True),
+            iterations, warmup)
+    ctx.ledger = ledger
+    return summarize("ledger_append", "micro", latencies, wall)
+
+
+def bench_ledger_verify(ctx, iterations, warmup):
+    ledger = getattr(ctx, "ledger", None)
+    if not ledger or not ledger.records:
+        return None
+    hashes = [record['tx_hash'] for record in ledger.records]
+    latencies, wall = run_timed(lambda i: ledger.verify_transaction(hashes[ctx.rng.randrange(len(hashes))]),
+                                iterations, warmup)
+    return summarize("ledger_verify", "micro", latencies, wall)
+
+
+def bench_reader_tap_to_uid(ctx, iterations, warmup):
+    """Toque → UID con el transporte simulado: contexto persistente y un solo APDU"""
+    from reader_transport import SimulatedTransport
+    try:
+        from acr122u_reader import ACR122UReader  # importa pyscard
+    except ImportError:
+        return None
+
+    transport = SimulatedTransport()
+    with quiet():
+        reader = ACR122UReader(transport=transport, dedup_window=0)
+
+    def one(i):
+        transport.place_card(synthetic_nfc_id(i))
+        if reader.wait_for_card(5) is None:
+            raise RuntimeError("El lector simulado no devolvió UID")
+        transport.remove_card()
+        reader.read_nfc_card()
+
+    with quiet():
+        latencies, wall = run_timed(one, iterations, warmup)
+    return summarize("reader_tap_to_uid", "micro", latencies, wall)
+
+
+def bench_reader_tap_to_uid_legacy(ctx, iterations, warmup):
+    """Referencia: ruta anterior (contexto PC/SC nuevo en cada reconexión)"""
+    from reader_transport import SimulatedTransport
+
+    transport = SimulatedTransport()
+
+    def one(i):
+        transport.place_card(synthetic_nfc_id(i))
+        transport.open()
+        transport.connect()
+        transport.transmit([0xFF, 0xCA, 0x00, 0x00, 0x00])
+        transport.remove_card()
+
+    latencies, wall = run_timed(one, iterations, warmup)
+    return summarize("reader_tap_to_uid_legacy", "micro", latencies, wall)
+
+
+def _bench_sessions(ctx, count: int) -> list:
+    """Sesiones activas nuevas para los benchmarks de ingesta"""
+    tokens = [f"bench{ctx.rng.getrandbits(64):016x}{i:08x}" for i in range(count)]
+    with quiet():
+        for token in tokens:
+            ctx.db.create_session(1, "ACR122U-BENCH", token)
+    return tokens
+
+
+def bench_session_activity_ingest(ctx, iterations, warmup):
+    """Actividades por la cola en lotes; el tiempo total incluye vaciar la cola (eventos/s sostenidos)"""
+    import tempfile
+    from ledger_store import SQLiteLedger
+    from session_ingest import SessionIngest
+
+    tokens = _bench_sessions(ctx, 100)
+    with quiet():
+        ingest = SessionIngest(ctx.db, SQLiteLedger(os.path.join(tempfile.mkdtemp(), "ledger.db"), "sessions"),
+                               max_queue=iterations + warmup)
+        one = lambda i: ingest.submit_activity(tokens[i % len(tokens)], "FILE_ACCESS", f"documento_{i}.pdf")
+        latencies, wall = run_timed(one, iterations, warmup)
+        started = time.perf_counter()
+        ingest.flush()
+        wall += time.perf_counter() - started
+        ingest.stop()
+    return summarize("session_activity_ingest", "macro", latencies, wall)
+
+
+def bench_session_activity_legacy(ctx, iterations, warmup):
+    """Referencia: SessionManager.log_activity (append al ledger e INSERT por evento)"""
+    import tempfile
+    from ledger_store import SQLiteLedger
+    from session_manager import SessionManager
+
+    tokens = _bench_sessions(ctx, 100)
+    with quiet():
+        manager = SessionManager(ctx.db, SQLiteLedger(os.path.join(tempfile.mkdtemp(), "ledger.db"), "sessions"))
+        latencies, wall = run_timed(
+            lambda i: manager.log_activity(tokens[i % len(tokens)], "FILE_ACCESS", f"documento_{i}.pdf"),
+            iterations, warmup)
+    return summarize("session_activity_legacy", "macro", latencies, wall)
+
+
+def _load_app(ctx):
+    """Importar main.py apuntando a la base de datos sintética"""
+    os.environ["NFC_DB_PATH"] = ctx.db_name
+    with quiet():
+        import main
+        if main.behavior is not None:
+            main.behavior.refresh()  # que la construcción inicial no compita con las mediciones
+    return main.app
+
+
+def bench_authenticate_endpoint(ctx, iterations, warmup):
+    app = _load_app(ctx)
+    loop = asyncio.new_event_loop()
+
+    def one(i):
+        body = {"pin": SYNTHETIC_PIN, "nfc_id": ctx.random_nfc_id(), "device_id": f"ACR122U-BENCH-{i % 1000:03d}"}
+        status, _, _ = loop.run_until_complete(asgi_request(app, "POST", "/authenticate", body))
+        if status != 200:
+            raise RuntimeError(f"/authenticate devolvió {status}")
+
+    try:
+        with quiet():
+            latencies, wall = run_timed(one, iterations, warmup)
+    finally:
+        loop.close()
+    return summarize("authenticate_endpoint", "macro", latencies, wall)
+
+
+def bench_authenticate_unknown_card(ctx, iterations, warmup):
+    app = _load_app(ctx)
+    loop = asyncio.new_event_loop()
+
+    def one(i):
+        body = {"pin": "0000", "nfc_id": f"FF{i:08X}", "device_id": f"ACR122U-BENCH-{i % 1000:03d}"}
+        loop.run_until_complete(asgi_request(app, "POST", "/authenticate", body))
+
+    try:
+        with quiet():
+            latencies, wall = run_timed(one, iterations, warmup)
+    finally:
+        loop.close()
+    return summarize("authenticate_unknown_card", "macro", latencies, wall)
+
+
+BENCHMARKS = {
+    "get_user_by_nfc": bench_get_user_by_nfc,
+    "get_user_by_nfc_miss": bench_get_user_by_nfc_miss,
+    "log_auth_attempt": bench_log_auth_attempt,
+    "get_auth_logs": bench_get_auth_logs,
+    "get_session_activities": bench_get_session_activities,
+    "activity_search": bench_activity_search,
+    "activity_search_recent": bench_activity_search_recent,
+    "activity_search_like": bench_activity_search_like,
+    "report_auth_by_device": bench_report_auth_by_device,
+    "report_auth_by_device_scan": bench_report_auth_by_device_scan,
+    "report_auth_by_department": bench_report_auth_by_department,
+    "report_sessions_by_department": bench_report_sessions_by_department,
+    "anomaly_score": bench_anomaly_score,
+    "ledger_append": bench_ledger_append,
+    "ledger_verify": bench_ledger_verify,
+    "reader_tap_to_uid": bench_reader_tap_to_uid,
+    "reader_tap_to_uid_legacy": bench_reader_tap_to_uid_legacy,
+    "session_activity_ingest": bench_session_activity_ingest,
+    "session_activity_legacy": bench_session_activity_legacy,
+    "authenticate_endpoint": bench_authenticate_endpoint,
+    "authenticate_unknown_card": bench_authenticate_unknown_card,
+}
+
+
+# ------------------- Ejecución y comparación -------------------
+
+def run_suite(db_name: str, selected=None, iterations: int = 1000, warmup: int = 50) -> dict:
+    ctx = BenchmarkContext(db_name)
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if selected and name not in selected:
+            continue
+        print(f"⏱️  {name}...", flush=True)
+        result = bench(ctx, iterations, warmup)
+        if result:
+            results[name] = result
+            print(f"   p50={result['p50_us']:>10.1f} µs  p99={result['p99_us']:>10.1f} µs  "
+                  f"{result['ops_per_s']:>10.1f} ops/s")
+        else:
+            print("   (omitido: faltan datos)")
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": {"python": sys.version.split()[0], "platform": platform.platform(),
+                        "sqlite": sqlite3.sqlite_version, "cpus": os.cpu_count()},
+        "dataset": ctx.row_counts,
+        "iterations": iterations,
+        "results": results,
+    }
+
+
+def compare_with_baseline(current: dict, baseline: dict, tolerance: float) -> list:
+    """Devuelve los benchmarks cuyo p50 empeoró más de ``tolerance`` (0.2 = 20 %)"""
+    regressions = []
+    print("\n📊 Comparación con la línea base (p50)")
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            print(f"   {name:<28} (sin línea base)")
+            continue
+        change = (result["p50_us"] - base["p50_us"]) / base["p50_us"] if base["p50_us"] else 0.0
+        flag = "❌" if change > tolerance else "✅"
+        print(f"   {flag} {name:<28} {base['p50_us']:>10.1f} → {result['p50_us']:>10.1f} µs ({change:+.1%})")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks del sistema NFC sobre datos sintéticos")
+    parser.add_argument("--db", default="bench_nfc_auth_system.db")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="Ejecutar solo estos benchmarks")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = run_suite(args.db, args.only, args.iterations, args.warmup)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"📄 Resultados guardados en {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_with_baseline(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ Regresiones: {', '.join(regressions)}")
+            sys.exit(1)
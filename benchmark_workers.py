@@ -0,0 +1,119 @@
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic_data import synthetic_nfc_id, SYNTHETIC_PIN
+from benchmark_suite import summarize
+
+
+def _client_loop(args):
+    """Proceso cliente: peticiones secuenciales con conexión keep-alive"""
+    port, duration, user_count, client_id = args
+    rng = random.Random(client_id)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + duration
+    i = 0
+    while time.perf_counter() < deadline:
+        body = json.dumps({"pin": SYNTHETIC_PIN, "nfc_id": synthetic_nfc_id(rng.randrange(user_count)),
+                           "device_id": f"BENCH-{client_id:03d}-{i % 500:03d}"})
+        start = time.perf_counter()
+        try:
+            conn.request("POST", "/authenticate", body, {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            status = 0
+        latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+        i += 1
+    conn.close()
+    return latencies, statuses
+
+
+def _wait_until_ready(port: int, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.3)
+    raise SystemExit(f"❌ El servidor no respondió en el puerto {port}")
+
+
+def run_workers(db_name: str, workers: int, clients: int, duration: float, port: int, user_count: int) -> dict:
+    """Arrancar main.py con ``workers`` procesos y cargarlo con ``clients`` procesos cliente"""
+    state_dir = tempfile.mkdtemp(prefix="nfc_bench_")
+    env = dict(os.environ, NFC_DB_PATH=db_name, NFC_WORKERS=str(workers), NFC_LEDGER_BACKEND="sqlite",
+               NFC_LEDGER_PATH=os.path.join(state_dir, "ledger.db"))
+    server = subprocess.Popen([sys.executable, "main.py", "--port", str(port), "--workers", str(workers)],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_until_ready(port)
+        with multiprocessing.Pool(clients) as pool:
+            started = time.perf_counter()
+            results = pool.map(_client_loop, [(port, duration, user_count, c) for c in range(clients)])
+            wall = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latencies = [value for client_latencies, _ in results for value in client_latencies]
+    statuses = {}
+    for _, client_statuses in results:
+        for status, count in client_statuses.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    summary = summarize(f"authenticate_{workers}w", "throughput", latencies, wall)
+    summary.update(workers=workers, clients=clients, statuses=statuses,
+                   ok_per_s=round(statuses.get("200", 0) / wall, 1))
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Escalado de /authenticate con varios workers uvicorn")
+    parser.add_argument("--db", default="bench_nfc_auth_system.db",
+                        help="Base de datos sintética (synthetic_data.py)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=max(4, (os.cpu_count() or 2) * 2))
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="Guardar los resultados en JSON")
+    args = parser.parse_args()
+
+    import sqlite3
+    conn = sqlite3.connect(args.db)
+    try:
+        user_count = conn.execute("SELECT COUNT(*) FROM nfc_users WHERE nfc_id LIKE '5E%'").fetchone()[0]
+    finally:
+        conn.close()
+    if not user_count:
+        raise SystemExit("❌ La base de datos no tiene usuarios sintéticos; ejecute synthetic_data.py")
+
+    print(f"⏱️  /authenticate con {args.clients} clientes durante {args.duration:.0f} s "
+          f"({os.cpu_count()} CPUs, {user_count:,} usuarios)")
+    rows = []
+    for workers in args.workers:
+        result = run_workers(args.db, workers, args.clients, args.duration, args.port, user_count)
+        rows.append(result)
+        base = rows[0]["ok_per_s"] or 1
+        print(f"   {workers:>2} workers: {result['ok_per_s']:>9.1f} ok/s  (x{result['ok_per_s'] / base:.2f})  "
+              f"p50={result['p50_us'] / 1000:.1f} ms  p99={result['p99_us'] / 1000:.1f} ms  "
+              f"estados={result['statuses']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"cpus": os.cpu_count(), "results": rows}, f, indent=2)
+        print(f"📄 Resultados guardados en {args.output}")
@@ -9,6 +9,7 @@ class BlockchainSimulated:
     def __init__(self):
         print("🔗 Blockchain SIMULADA iniciada")
         self.records = []
+        self._by_hash = {}  # tx_hash -> registro (verificación O(1))
     
     def record_auth_attempt(self, user_id: str, timestamp: float, 
                           device_id: str, nfc_id: str, success: bool):
@@ -29,16 +30,25 @@ class BlockchainSimulated:
         }
         
         self.records.append(record)
+        self._by_hash[record['tx_hash']] = record
         print(f"✅ Registro en blockchain simulada: {record['tx_hash']}")
         
         return record['tx_hash']
     
+    def record_auth_attempts(self, attempts: list) -> list:
+        """Registrar varios intentos ``(user_id, timestamp, device_id, nfc_id, success)``"""
+        return [self.record_auth_attempt(*attempt) for attempt in attempts]
+    
     def verify_transaction(self, tx_hash: str):
         """Verificar transacción"""
-        for record in self.records:
-            if record['tx_hash'] == tx_hash:
-                return True
-        return False
+        return tx_hash in self._by_hash
+    
+    def iter_records(self, after_block: int = 0, batch_size: int = 1000):
+        """Misma interfaz que SQLiteLedger.iter_records"""
+        return iter(self.records[after_block:])
+    
+    def __len__(self):
+        return len(self.records)
 
 # Prueba rápida
 if __name__ == "__main__":
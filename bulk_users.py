@@ -0,0 +1,245 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import DatabaseManager
+from pin_hasher import PinHasher
+
+DEFAULT_PIN = "0000"
+EXPORT_FIELDS = ["nfc_id", "username", "full_name", "department", "security_level", "is_admin"]
+_UID_SEPARATORS = re.compile(r"[\s:\-]")
+_UID_PATTERN = re.compile(r"^[0-9A-Z]{4,32}$")
+_PIN_PATTERN = re.compile(r"^\d{4,8}$")
+_TRUE_VALUES = {"1", "true", "t", "s", "si", "sí", "y", "yes"}
+
+
+class RecordError(ValueError):
+    """Registro de entrada inválido"""
+
+
+def normalize_uid(value) -> str:
+    """Quitar separadores y pasar a mayúsculas (``04:a1:b2`` -> ``04A1B2``)"""
+    uid = _UID_SEPARATORS.sub("", str(value or "")).upper()
+    if not _UID_PATTERN.match(uid):
+        raise RecordError(f"UID inválido: {value!r}")
+    return uid
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in _TRUE_VALUES
+
+
+def read_records(path: str, file_format: str = None):
+    """Leer CSV o JSONL en streaming; devuelve ``(numero_linea, dict)``"""
+    file_format = file_format or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if file_format == "csv":
+            for line_number, row in enumerate(csv.DictReader(f), start=2):
+                yield line_number, row
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except json.JSONDecodeError as e:
+                        yield line_number, RecordError(f"JSON inválido: {e}")
+
+
+class BulkUserImporter:
+    """Alta masiva de usuarios NFC por lotes.
+
+    Valida y normaliza cada registro, hashea los PIN explícitos en paralelo
+    (scrypt libera el GIL), reutiliza un único hash para los usuarios con
+    el PIN por defecto y acepta ``pin_hash`` ya calculado (p. ej. de una
+    exportación). Un registro sin PIN conserva el de la tarjeta si ya
+    existía; solo las altas nuevas reciben ``DEFAULT_PIN``. Cada lote se
+    escribe con ``executemany`` en una transacción.
+    """
+
+    def __init__(self, db: DatabaseManager, batch_size: int = 5000,
+                 update_existing: bool = True, workers: int = None, show_progress: bool = True):
+        self.db = db
+        self.batch_size = batch_size
+        self.update_existing = update_existing
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.show_progress = show_progress
+        self._default_hash = None
+
+    def _validate(self, record: dict):
+        """Devuelve ``(fila, pin_en_claro)`` (PIN None si no hay que hashearlo); lanza RecordError si no es válido"""
+        if isinstance(record, Exception):
+            raise record
+        nfc_id = normalize_uid(record.get("nfc_id"))
+        full_name = str(record.get("full_name") or "").strip()
+        if not full_name:
+            raise RecordError("full_name requerido")
+        username = str(record.get("username") or "").strip() or full_name.lower().replace(" ", "")
+        department = str(record.get("department") or "").strip() or "General"
+        try:
+            security_level = int(record.get("security_level") or 1)
+        except (TypeError, ValueError):
+            raise RecordError(f"security_level inválido: {record.get('security_level')!r}")
+        if security_level not in (1, 2, 3):
+            raise RecordError(f"security_level fuera de rango: {security_level}")
+        is_admin = _parse_bool(record.get("is_admin"))
+
+        pin_hash = str(record.get("pin_hash") or "").strip()
+        pin = str(record.get("pin") or "").strip()
+        if pin_hash:
+            if not PinHasher.is_hashed(pin_hash):
+                raise RecordError("pin_hash con formato desconocido")
+            pin = None
+        elif not pin:
+            pin = None
+        elif not _PIN_PATTERN.match(pin):
+            raise RecordError("El PIN debe tener entre 4 y 8 dígitos")
+        return [nfc_id, username, full_name, department, security_level, is_admin, pin_hash or None], pin
+
+    def _hash_pins(self, rows: list, pins: list, executor: ThreadPoolExecutor):
+        pending = [(row, pin) for row, pin in zip(rows, pins) if pin is not None]
+        if self._default_hash is None and any(pin == DEFAULT_PIN or row[6] is None for row, pin in zip(rows, pins)):
+            self._default_hash = self.db.pin_hasher.hash_pin(DEFAULT_PIN)
+        explicit = [(row, pin) for row, pin in pending if pin != DEFAULT_PIN]
+        for row, pin_hash in zip((row for row, _ in explicit),
+                                 executor.map(self.db.pin_hasher.hash_pin, (pin for _, pin in explicit))):
+            row[6] = pin_hash
+        for row, pin in pending:
+            if pin == DEFAULT_PIN:
+                row[6] = self._default_hash
+
+    def _flush(self, batch: list, report: dict, executor: ThreadPoolExecutor):
+        rows = [row for _, row, _ in batch]
+        self._hash_pins(rows, [pin for _, _, pin in batch], executor)
+        existing = self.db.upsert_users_batch([tuple(row) for row in rows], self.update_existing,
+                                              default_pin_hash=self._default_hash)
+        for line_number, row, _ in batch:
+            if row[0] in existing:
+                report["updated" if self.update_existing else "skipped"] += 1
+                report["conflicts"].append({"line": line_number, "nfc_id": row[0],
+                                            "status": "updated" if self.update_existing else "skipped",
+                                            "reason": "La tarjeta ya estaba registrada"})
+            else:
+                report["inserted"] += 1
+
+    def import_records(self, records) -> dict:
+        """Importar un iterable de ``(numero_linea, dict)`` o de dicts"""
+        report = {"inserted": 0, "updated": 0, "skipped": 0, "invalid": 0, "conflicts": []}
+        seen = set()
+        batch = []
+        started = time.perf_counter()
+        processed = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pin-hash") as executor:
+            for item in records:
+                line_number, record = item if isinstance(item, tuple) else (processed + 1, item)
+                processed += 1
+                try:
+                    row, pin = self._validate(record)
+                    if row[0] in seen:
+                        raise RecordError("UID duplicado en el fichero")
+                except RecordError as e:
+                    report["invalid"] += 1
+                    report["conflicts"].append({"line": line_number, "nfc_id": record.get("nfc_id")
+                                                if isinstance(record, dict) else None,
+                                                "status": "invalid", "reason": str(e)})
+                    continue
+                seen.add(row[0])
+                batch.append((line_number, row, pin))
+
+                if len(batch) >= self.batch_size:
+                    self._flush(batch, report, executor)
+                    batch = []
+                    self._progress(processed, started)
+
+            if batch:
+                self._flush(batch, report, executor)
+            self._progress(processed, started, final=True)
+
+        report["processed"] = processed
+        report["seconds"] = round(time.perf_counter() - started, 2)
+        return report
+
+    def import_file(self, path: str, file_format: str = None) -> dict:
+        return self.import_records(read_records(path, file_format))
+
+    def _progress(self, processed: int, started: float, final: bool = False):
+        if not self.show_progress:
+            return
+        rate = processed / max(time.perf_counter() - started, 1e-9)
+        print(f"   📥 {processed:,} registros procesados ({rate:,.0f}/s)", end="\n" if final else "\r", flush=True)
+
+
+def export_users(db: DatabaseManager, path: str, file_format: str = None,
+                 include_inactive: bool = False, include_pin_hash: bool = False) -> int:
+    """Exportar usuarios en streaming a CSV o JSONL; devuelve el número de filas"""
+    file_format = file_format or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    fields = EXPORT_FIELDS + (["is_active"] if include_inactive else []) + (["pin_hash"] if include_pin_hash else [])
+    count = 0
+    out = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+    try:
+        writer = csv.DictWriter(out, fieldnames=fields, extrasaction="ignore") if file_format == "csv" else None
+        if writer:
+            writer.writeheader()
+        for user in db.iter_users(include_inactive=include_inactive):
+            if writer:
+                writer.writerow(user)
+            else:
+                out.write(json.dumps({k: user[k] for k in fields}, ensure_ascii=False) + "\n")
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return count
+
+
+def write_conflict_report(conflicts: list, path: str):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["line", "nfc_id", "status", "reason"])
+        writer.writeheader()
+        writer.writerows(conflicts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importación/exportación masiva de usuarios NFC")
+    parser.add_argument("--db", default=os.environ.get("NFC_DB_PATH", "nfc_auth_system.db"))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    imp = sub.add_parser("import", help="Importar usuarios desde CSV/JSONL")
+    imp.add_argument("path")
+    imp.add_argument("--format", choices=["csv", "jsonl"])
+    imp.add_argument("--batch-size", type=int, default=5000)
+    imp.add_argument("--on-conflict", choices=["update", "skip"], default="update")
+    imp.add_argument("--report", help="Guardar el informe de conflictos en este CSV")
+
+    exp = sub.add_parser("export", help="Exportar usuarios a CSV/JSONL ('-' para stdout)")
+    exp.add_argument("path")
+    exp.add_argument("--format", choices=["csv", "jsonl"])
+    exp.add_argument("--include-inactive", action="store_true")
+    exp.add_argument("--with-pin-hash", action="store_true", help="Incluir hashes de PIN (para migraciones)")
+    args = parser.parse_args()
+
+    db = DatabaseManager(args.db)
+    if args.command == "import":
+        importer = BulkUserImporter(db, batch_size=args.batch_size,
+                                    update_existing=args.on_conflict == "update")
+        result = importer.import_file(args.path, args.format)
+        print(f"✅ Importación completada en {result['seconds']} s")
+        print(f"   ➕ Insertados: {result['inserted']}  🔄 Actualizados: {result['updated']}  "
+              f"⏭️  Omitidos: {result['skipped']}  ❌ Inválidos: {result['invalid']}")
+        if args.report:
+            write_conflict_report(result["conflicts"], args.report)
+            print(f"📄 Informe de conflictos: {args.report}")
+        else:
+            for conflict in result["conflicts"][:20]:
+                print(f"   ⚠️  línea {conflict['line']}: {conflict['nfc_id']} - {conflict['reason']}")
+    else:
+        total = export_users(db, args.path, args.format, args.include_inactive, args.with_pin_hash)
+        if args.path != "-":
+            print(f"✅ {total} usuarios exportados a {args.path}")
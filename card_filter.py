@@ -0,0 +1,244 @@
+import base64
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+import requests
+
+
+class CardBloomFilter:
+    """Filtro de Bloom de UIDs NFC.
+
+    Sin falsos negativos: si ``nfc_id not in filtro`` la tarjeta seguro no
+    está registrada. Los falsos positivos (``error_rate``) simplemente
+    siguen el camino normal contra el servidor. Los índices salen de un
+    único blake2b con doble hashing (h1 + i*h2).
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        self.bits = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.count = 0
+        self._data = bytearray((self.bits + 7) // 8)
+
+    def _indexes(self, nfc_id: str):
+        digest = hashlib.blake2b(nfc_id.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, nfc_id: str):
+        for index in self._indexes(nfc_id):
+            self._data[index >> 3] |= 1 << (index & 7)
+        self.count += 1
+
+    def __contains__(self, nfc_id: str) -> bool:
+        data = self._data
+        return all(data[index >> 3] & (1 << (index & 7)) for index in self._indexes(nfc_id))
+
+    def __len__(self):
+        return self.count
+
+    def to_dict(self) -> dict:
+        return {"bits": self.bits, "hashes": self.hashes, "count": self.count,
+                "capacity": self.capacity, "error_rate": self.error_rate,
+                "data": base64.b64encode(bytes(self._data)).decode()}
+
+    @classmethod
+    def from_dict(cls, document: dict) -> "CardBloomFilter":
+        bloom = cls.__new__(cls)
+        bloom.bits = document["bits"]
+        bloom.hashes = document["hashes"]
+        bloom.count = document["count"]
+        bloom.capacity = document.get("capacity", document["count"])
+        bloom.error_rate = document.get("error_rate")
+        bloom._data = bytearray(base64.b64decode(document["data"]))
+        if len(bloom._data) != (bloom.bits + 7) // 8:
+            raise ValueError("Tamaño del filtro inconsistente")
+        return bloom
+
+
+class ActiveCardFilter:
+    """Filtro de tarjetas activas mantenido por el servidor.
+
+    La versión es la secuencia del registro ``nfc_user_changes``. Cada
+    ``refresh()`` aplica solo los cambios nuevos: las altas se añaden al
+    filtro y las bajas se cuentan como bits obsoletos (un Bloom no admite
+    borrados; solo generan falsos positivos). Se reconstruye entero cuando
+    las bajas acumuladas o las altas superan el margen previsto.
+    """
+
+    def __init__(self, database, error_rate: float = 0.01, headroom: float = 1.5,
+                 max_stale_ratio: float = 0.1):
+        self.database = database
+        self.error_rate = error_rate
+        self.headroom = headroom
+        self.max_stale_ratio = max_stale_ratio
+        self.filter = None
+        self.version = None
+        self.stale = 0
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+
+    def _rebuild(self, latest_seq: int):
+        nfc_ids = [user["nfc_id"] for user in self.database.iter_users()]
+        bloom = CardBloomFilter(max(1024, int(len(nfc_ids) * self.headroom)), self.error_rate)
+        for nfc_id in nfc_ids:
+            bloom.add(nfc_id)
+        self.filter, self.version, self.stale = bloom, latest_seq, 0
+        self.rebuilds += 1
+
+    def refresh(self) -> CardBloomFilter:
+        """Poner el filtro al día con el registro de cambios; devuelve el filtro vigente"""
+        latest_seq = self.database.get_latest_user_change_seq()
+        with self._lock:
+            if self.filter is None or latest_seq < self.version:
+                self._rebuild(latest_seq)
+                return self.filter
+            while self.version < latest_seq:
+                delta = self.database.get_user_changes(self.version, 10000)
+                if delta["reset"]:
+                    self._rebuild(latest_seq)
+                    break
+                for change in delta["changes"]:
+                    if change["op"] == "upsert":
+                        # Una tarjeta ya presente (edición de nombre, PIN...) no cambia el filtro
+                        if change["nfc_id"] not in self.filter:
+                            self.filter.add(change["nfc_id"])
+                    else:
+                        self.stale += 1
+                if delta["latest_seq"] <= self.version:
+                    break
+                self.version = delta["latest_seq"]
+                if not delta["has_more"]:
+                    break
+            if (self.filter.count > self.filter.capacity
+                    or self.stale > self.max_stale_ratio * max(1, self.filter.count)):
+                self._rebuild(latest_seq)
+            return self.filter
+
+
+class ReaderCardFilter:
+    """Pre-filtro de tarjetas en el lector.
+
+    Descarga ``/users/filter`` y descarta al instante las tarjetas que seguro
+    no están registradas, sin pedir PIN ni ir al servidor. Si no hay filtro
+    o es más antiguo que ``max_age`` no descarta nada (falla abierto). Los
+    rechazos locales se agregan por tarjeta y se envían periódicamente a
+    ``/users/filter/rejections`` (autenticado con el secreto edge) para que
+    queden en la auditoría.
+    """
+
+    def __init__(self, api_url: str, device_id: str, state_dir: str = ".",
+                 max_age: float = 3600.0, max_tracked: int = 1000, timeout: float = 5.0,
+                 secret: str = None):
+        self.api_url = api_url.rstrip("/")
+        self.device_id = device_id
+        self.secret = secret or os.environ.get("NFC_EDGE_SECRET", "")
+        self.max_age = max_age
+        self.max_tracked = max_tracked
+        self.timeout = timeout
+        self.path = os.path.join(state_dir, f"card_filter_{device_id}.json")
+        self.filter = None
+        self.version = None
+        self.fetched_at = None
+        self._rejections = {}
+        self._dropped = 0
+        self._window_start = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._load_file()
+
+    def _headers(self):
+        return {"X-Edge-Token": self.secret, "X-Edge-Device": self.device_id}
+
+    # ---------- filtro ----------
+    def _install(self, document: dict):
+        self.filter = CardBloomFilter.from_dict(document)
+        self.version = document["version"]
+        self.fetched_at = document.get("fetched_at", time.time())
+
+    def _load_file(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._install(json.load(f))
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def refresh(self) -> bool:
+        """Descargar el filtro si cambió; devuelve True si hay uno vigente"""
+        params = {"since_version": self.version} if self.version is not None else {}
+        response = requests.get(f"{self.api_url}/users/filter", params=params, timeout=self.timeout)
+        if response.status_code == 304:
+            self.fetched_at = time.time()
+            return True
+        response.raise_for_status()
+        document = dict(response.json(), fetched_at=time.time())
+        self._install(document)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(document, f)
+        os.replace(tmp_path, self.path)
+        return True
+
+    def is_definitely_unregistered(self, nfc_id: str) -> bool:
+        """True solo si el filtro vigente garantiza que la tarjeta no existe"""
+        bloom = self.filter
+        if bloom is None or time.time() - self.fetched_at > self.max_age:
+            return False
+        return nfc_id not in bloom
+
+    # ---------- auditoría agregada ----------
+    def record_rejection(self, nfc_id: str):
+        with self._lock:
+            if nfc_id in self._rejections or len(self._rejections) < self.max_tracked:
+                self._rejections[nfc_id] = self._rejections.get(nfc_id, 0) + 1
+            else:
+                self._dropped += 1
+
+    def flush_rejections(self) -> int:
+        """Enviar los rechazos agregados; si falla se conservan para el siguiente intento"""
+        with self._lock:
+            counts, dropped, window_start = self._rejections, self._dropped, self._window_start
+            self._rejections, self._dropped, self._window_start = {}, 0, time.time()
+        if not counts and not dropped:
+            return 0
+        report = {"report_id": uuid.uuid4().hex, "device_id": self.device_id,
+                  "filter_version": self.version, "window_start": window_start,
+                  "window_end": time.time(), "counts": counts, "dropped": dropped}
+        try:
+            response = requests.post(f"{self.api_url}/users/filter/rejections", json=report,
+                                     headers=self._headers(), timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException:
+            with self._lock:
+                for nfc_id, count in counts.items():
+                    self._rejections[nfc_id] = self._rejections.get(nfc_id, 0) + count
+                self._dropped += dropped
+                self._window_start = window_start
+            raise
+        return sum(counts.values()) + dropped
+
+    def start_background_refresh(self, interval: float = 60.0):
+        """Refrescar el filtro y enviar la auditoría periódicamente"""
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.refresh()
+                    self.flush_rejections()
+                except Exception:
+                    pass
+                self._stop.wait(interval)
+
+        self._stop.clear()
+        threading.Thread(target=loop, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
@@ -67,8 +67,11 @@ def check_multiple_cards():
     print("\n🧪 VERIFICANDO TARJETAS DE PRUEBA")
     print("=" * 50)
     
+    # Una sola consulta para todas las tarjetas
+    usuarios = db.get_users_by_nfc_ids(tarjetas_prueba)
+    
     for tarjeta in tarjetas_prueba:
-        usuario = db.get_user_by_nfc(tarjeta)
+        usuario = usuarios[tarjeta]
         
         if usuario:
             admin_status = " 🔑 ADMIN" if usuario['is_admin'] else ""
@@ -76,7 +79,7 @@ def check_multiple_cards():
         else:
             print(f"❌ {tarjeta}: NO REGISTRADA")
     
-    print(f"\n📊 Resumen: {len([t for t in tarjetas_prueba if db.get_user_by_nfc(t)])} registradas de {len(tarjetas_prueba)}")
+    print(f"\n📊 Resumen: {sum(1 for u in usuarios.values() if u)} registradas de {len(tarjetas_prueba)}")
 
 def show_all_users():
     """Mostrar todos los usuarios registrados (solo para verificación)"""
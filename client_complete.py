@@ -2,21 +2,46 @@ import requests
 import time
 from datetime import datetime
 from acr122u_reader import ACR122UReader
+from user_directory_sync import UserDirectoryReplica
+from edge_auth import EdgeAuthenticator
+from card_filter import ReaderCardFilter
+from device_registry import HeartbeatSender
 
 class CompleteAuthClient:
     def __init__(self, api_url: str, device_id: str):
-        self.api_url = api_url
+        self.api_url = api_url.rstrip("/")
         self.device_id = device_id
-        self.nfc_reader = ACR122UReader()
+        self.user_directory = UserDirectoryReplica(self.api_url)
+        self.user_directory.start_background_sync()
+        self.nfc_reader = ACR122UReader(self.user_directory)
+        # Respaldo offline: snapshot firmado + cola durable de decisiones
+        self.edge_auth = EdgeAuthenticator(self.api_url, device_id)
+        self.edge_auth.start_background_maintenance()
+        # Filtro de Bloom: descarta tarjetas ajenas sin ir al servidor
+        self.card_filter = ReaderCardFilter(self.api_url, device_id)
+        self.card_filter.start_background_refresh()
+        # Heartbeat: el servidor sabe que este lector está vivo y cuánto tiene en cola offline
+        self.heartbeat = HeartbeatSender(self.api_url, device_id, self._heartbeat_status)
+        self.heartbeat.start()
+    
+    def _heartbeat_status(self) -> dict:
+        snapshot_age = self.edge_auth.snapshot_age()
+        return {"reader_status": "ok" if self.nfc_reader.transport is not None else "sin_lector",
+                "queue_depth": self.edge_auth.pending_count(),
+                "details": {"snapshot_age": round(snapshot_age) if snapshot_age != float("inf") else None,
+                            "filter_version": self.card_filter.version,
+                            "last_tap_ms": self.nfc_reader.last_tap_ms}}
     
     def start_auth_flow(self):
         print("\n" + "="*60)
         print("       SISTEMA DE AUTENTICACIÓN MFA COMPLETO")
         print("="*60)
          
-        # Verificar conexión con servidor
+        # Verificar conexión con servidor (sin servidor se usa el snapshot local)
         if not self.check_server_health():
-            return False
+            if not self.edge_auth.users:
+                return False
+            print("⚠️  Modo offline: se validará con el directorio local firmado")
         
         # Paso 1: Lectura NFC FÍSICA
         print("\n🎫 COLOCAR TARJETA NFC EN EL LECTOR ACR122U...")
@@ -27,7 +52,7 @@ class CompleteAuthClient:
             return False
         
         # Obtener información del usuario
-        user_info = self.get_user_info(nfc_id)
+        user_info = self.get_user_info(nfc_id) or self.edge_auth.users.get(nfc_id)
         if not user_info:
             print("❌ Tarjeta no registrada en el sistema")
             return False
@@ -46,6 +71,7 @@ class CompleteAuthClient:
         # Paso 3: Autenticación COMPLETA
         print("\n⏳ VERIFICANDO CREDENCIALES...")
         auth_result = self.authenticate(pin, nfc_id)
+        self.nfc_reader.signal_result(bool(auth_result.get('success')))
         
         if auth_result.get('success'):
             self.show_success_message(auth_result)
@@ -59,7 +85,10 @@ class CompleteAuthClient:
         try:
             response = requests.get(f"{self.api_url}/health", timeout=5)
             if response.status_code == 200:
-                print("✅ Servidor conectado correctamente")
+                if response.json().get("status") == "degraded":
+                    print("⚠️  Servidor conectado pero degradado")
+                else:
+                    print("✅ Servidor conectado correctamente")
                 return True
             else:
                 print("❌ Servidor no responde correctamente")
@@ -70,6 +99,12 @@ class CompleteAuthClient:
             return False
     
     def get_user_info(self, nfc_id: str):
+        if self.card_filter.is_definitely_unregistered(nfc_id):
+            self.card_filter.record_rejection(nfc_id)
+            return None
+        user = self.user_directory.get(nfc_id)
+        if user:
+            return user
         try:
             response = requests.get(f"{self.api_url}/user/{nfc_id}", timeout=5)
             if response.status_code == 200:
@@ -80,19 +115,8 @@ class CompleteAuthClient:
     
     def authenticate(self, pin: str, nfc_id: str):
         try:
-            auth_data = {
-                "pin": pin,
-                "nfc_id": nfc_id,
-                "device_id": self.device_id
-            }
-            
-            response = requests.post(
-                f"{self.api_url}/authenticate",
-                json=auth_data,
-                timeout=10
-            )
-            
-            return response.json()
+            # Online con timeout corto; si el servidor no responde, decisión local
+            return self.edge_auth.authenticate(pin, nfc_id)
             
         except Exception as e:
             return {"success": False, "message": f"Error de conexión: {str(e)}"}
@@ -104,7 +128,10 @@ class CompleteAuthClient:
         print(f"   👤 Usuario: {auth_result['user']['full_name']}")
         print(f"   🏢 Departamento: {auth_result['user']['department']}")
         print(f"   🔐 Nivel Seguridad: {auth_result['user']['security_level']}")
-        print(f"   🔗 Blockchain: {auth_result['blockchain_tx']}")
+        if auth_result.get('offline'):
+            print("   📴 Decisión offline - se conciliará con el servidor al reconectar")
+        else:
+            print(f"   🔗 Blockchain: {auth_result['blockchain_tx']}")
         print(f"   🕐 Hora: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print("\n   🚀 ACCESO CONCEDIDO AL SISTEMA")
     
@@ -136,3 +163,7 @@ if __name__ == "__main__":
     
     except KeyboardInterrupt:
         print("\n\n⏹️  Aplicación interrumpida por el usuario")
+    finally:
+        # Parada ordenada de los hilos de fondo (espera la pasada en curso)
+        client.heartbeat.stop()
+        client.edge_auth.stop()
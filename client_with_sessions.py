@@ -9,13 +9,25 @@ import os
 import sys
 import select
 import hashlib
+import json
+import uuid
 from acr122u_reader import ACR122UReader
+from user_directory_sync import UserDirectoryReplica
+from card_filter import ReaderCardFilter
+from activity_search import create_fts_index, fts_query, snippet_sql
+from device_registry import HeartbeatSender
 
 class SessionAuthClient:
     def __init__(self, api_url: str, device_id: str):
-        self.api_url = api_url
+        self.api_url = api_url.rstrip("/")
         self.device_id = device_id
-        self.nfc_reader = ACR122UReader()
+        self.user_directory = UserDirectoryReplica(self.api_url)
+        self.user_directory.start_background_sync()
+        self.nfc_reader = ACR122UReader(self.user_directory)
+        self.card_filter = ReaderCardFilter(self.api_url, device_id)
+        self.card_filter.start_background_refresh()
+        self.heartbeat = HeartbeatSender(self.api_url, device_id, self._heartbeat_status)
+        self.heartbeat.start()
         self.current_session = None
         self.current_user = None
         self.monitor_thread = None
@@ -80,6 +92,7 @@ class SessionAuthClient:
                     FOREIGN KEY (session_token) REFERENCES sessions (session_token)
                 )
             ''')
+            create_fts_index(cursor, 'activities', ('activity_type', 'description'))
             
             # Tabla de alertas de seguridad
             cursor.execute('''
@@ -100,12 +113,23 @@ class SessionAuthClient:
         except Exception as e:
             print(f"❌ Error inicializando base de datos: {e}")
 
+    def _heartbeat_status(self) -> dict:
+        """Estado del lector para el heartbeat (la cola local son los rechazos del filtro sin enviar)"""
+        return {"reader_status": "ok" if self.nfc_reader.transport is not None else "sin_lector",
+                "queue_depth": len(self.card_filter._rejections),
+                "details": {"session_active": self.session_active,
+                            "filter_version": self.card_filter.version,
+                            "last_tap_ms": self.nfc_reader.last_tap_ms}}
+
     def check_server_health(self):
         """Verificar que el servidor esté funcionando"""
         try:
             response = requests.get(f"{self.api_url}/health", timeout=5)
             if response.status_code == 200:
-                print("✅ Sistema listo")
+                if response.json().get("status") == "degraded":
+                    print("⚠️  Sistema listo (servidor degradado)")
+                else:
+                    print("✅ Sistema listo")
                 return True
             else:
                 print("❌ Servidor no disponible")
@@ -116,7 +140,13 @@ class SessionAuthClient:
             return False
 
     def get_user_info(self, nfc_id: str):
-        """Obtener información del usuario desde la base de datos"""
+        """Obtener información del usuario (réplica local primero, luego el servidor)"""
+        if self.card_filter.is_definitely_unregistered(nfc_id):
+            self.card_filter.record_rejection(nfc_id)
+            return None
+        user = self.user_directory.get(nfc_id)
+        if user:
+            return user
         try:
             response = requests.get(f"{self.api_url}/user/{nfc_id}", timeout=5)
             if response.status_code == 200:
@@ -126,25 +156,39 @@ class SessionAuthClient:
             return None
 
     def start_session(self, pin: str, nfc_id: str):
-        """Iniciar sesión en el servidor"""
+        """Iniciar sesión en el servidor (un reintento con la misma Idempotency-Key)"""
         try:
             auth_data = {
                 "pin": pin,
                 "nfc_id": nfc_id,
                 "device_id": self.device_id
             }
+            headers = {"Idempotency-Key": uuid.uuid4().hex}
             
-            response = requests.post(
-                f"{self.api_url}/session/start",
-                json=auth_data,
-                timeout=10
-            )
+            try:
+                response = requests.post(f"{self.api_url}/session/start", json=auth_data,
+                                         headers=headers, timeout=10)
+            except (requests.Timeout, requests.ConnectionError):
+                response = requests.post(f"{self.api_url}/session/start", json=auth_data,
+                                         headers=headers, timeout=10)
             
             return response.json()
             
         except Exception as e:
             return {"success": False, "message": f"Error: {str(e)}"}
 
+    def emergency_logout(self):
+        """Cerrar la sesión en el servidor (tarjeta retirada o interrupción)"""
+        token, self.current_session = self.current_session, None
+        self.session_active = False
+        if not token:
+            return
+        try:
+            requests.post(f"{self.api_url}/session/logout", json={"session_token": token}, timeout=3)
+            self._stealth_log(f"Sesión cerrada: {token[:8]}...")
+        except Exception:
+            pass
+
     def card_removed_handler(self):
         """Manejador cuando se detecta que la tarjeta fue removida"""
         if self.session_active:
@@ -352,10 +396,103 @@ class SessionAuthClient:
 
     # ... [El resto del código se mantiene igual] ...
 
+def search_local_activities(query: str, since: str = None, until: str = None, user_name: str = None,
+                            limit: int = 20, db_path: str = 'sessions.db'):
+    """Buscar en las actividades guardadas en este equipo (FTS5, sin distinguir acentos)"""
+    match = fts_query(query)
+    if match is None:
+        return []
+    conditions, parameters = ["activities_fts MATCH ?"], [match]
+    for clause, value in (("a.timestamp >= ?", since), ("a.timestamp <= ?", until),
+                          ("s.user_name = ?", user_name)):
+        if value:
+            conditions.append(clause)
+            parameters.append(value)
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            cursor = conn.cursor()
+            create_fts_index(cursor, 'activities', ('activity_type', 'description'))
+            cursor.execute(f'''
+                SELECT a.timestamp, s.user_name, a.activity_type, a.is_suspicious,
+                       {snippet_sql('activities_fts', 1)}
+                FROM activities_fts
+                JOIN activities a ON a.id = activities_fts.rowid
+                LEFT JOIN sessions s ON s.session_token = a.session_token
+                WHERE {" AND ".join(conditions)}
+                ORDER BY rank
+                LIMIT ?
+            ''', parameters + [limit])
+            return [{'timestamp': row[0], 'user_name': row[1], 'activity_type': row[2],
+                     'suspicious': bool(row[3]), 'snippet': row[4]} for row in cursor.fetchall()]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"❌ Error buscando actividades locales: {e}")
+        return []
+
+def local_activity_search():
+    """Búsqueda interactiva en sessions.db"""
+    while True:
+        query = input("\n🔍 Buscar (vacío = salir): ").strip()
+        if not query:
+            return
+        results = search_local_activities(query)
+        if not results:
+            print("   Sin resultados")
+        for item in results:
+            flag = "⚠️" if item['suspicious'] else "  "
+            print(f"{flag} {item['timestamp']} {item['user_name'] or '-':<16} {item['activity_type']:<20} "
+                  f"{item['snippet'].replace('<mark>', '[').replace('</mark>', ']')}")
+
+EVENT_ICONS = {"auth": "🔑", "session_start": "🟢", "session_activity": "📝",
+               "security_alert": "🚨", "session_end": "🔴"}
+
+def admin_monitor(api_url: str = "https://nfcblockchain.vercel.app/"):
+    """Monitor en vivo: eventos del servidor por SSE (sin consultar la base de datos; secreto NFC_EDGE_SECRET)"""
+    devices = input("Filtrar por dispositivos (separados por comas, vacío = todos): ").strip()
+    departments = input("Filtrar por departamentos (vacío = todos): ").strip()
+    params = {key: value for key, value in (("devices", devices), ("departments", departments)) if value}
+
+    while True:
+        try:
+            with requests.get(f"{api_url.rstrip('/')}/events/stream", params=params, stream=True,
+                              headers={"X-Edge-Token": os.environ.get("NFC_EDGE_SECRET", "")},
+                              timeout=(5, 60)) as response:
+                response.raise_for_status()
+                print("📡 Conectado al flujo de eventos (Ctrl+C para salir)")
+                event_name = None
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event:"):
+                        event_name = line[6:].strip()
+                    elif line.startswith("data:") and event_name == "dropped":
+                        print("⚠️ El servidor cortó el monitor por ir retrasado; reconectando...")
+                        break
+                    elif line.startswith("data:"):
+                        event = json.loads(line[5:])
+                        when = datetime.fromtimestamp(event.pop("timestamp")).strftime('%H:%M:%S')
+                        kind = event.pop("type")
+                        print(f"{when} {EVENT_ICONS.get(kind, '•')} {kind:<16} "
+                              f"{event.pop('device_id', '-') or '-':<22} {event.pop('department', '-') or '-':<16} "
+                              f"{', '.join(f'{k}={v}' for k, v in event.items() if v is not None)}")
+                    elif not line:
+                        event_name = None
+        except KeyboardInterrupt:
+            print("\nMonitor detenido")
+            return
+        except (requests.RequestException, ValueError) as e:
+            print(f"⚠️ Conexión perdida ({e}); reintentando en 3 s")
+            try:
+                time.sleep(3)
+            except KeyboardInterrupt:
+                print("\nMonitor detenido")
+                return
+
 if __name__ == "__main__":
     print("🔒 SISTEMA DE ACCESO SEGURO")
     print("1. Iniciar sesión de trabajo")
     print("2. Monitor de administración")
+    print("3. Buscar en actividades locales")
     
     opcion = input("\nSeleccione opción: ").strip()
     
@@ -384,5 +521,8 @@ if __name__ == "__main__":
     elif opcion == "2":
         admin_monitor()
         
+    elif opcion == "3":
+        local_activity_search()
+        
     else:
         print("❌ Opción no válida")
@@ -0,0 +1,238 @@
+import argparse
+import json
+import math
+import os
+import sqlite3
+import time
+from collections import OrderedDict, deque
+
+
+def load_device_locations(path: str) -> dict:
+    """``{"device_id": [x, y]}`` en metros sobre un plano común del recinto"""
+    with open(path, encoding="utf-8") as f:
+        return {device_id: tuple(position) for device_id, position in json.load(f).items()}
+
+
+class FailureCorrelator:
+    """Correlación en memoria de intentos de autenticación entre dispositivos.
+
+    Detecta, con ventanas que caducan y coste O(1) amortizado por evento:
+
+    * ``FUERZA_BRUTA``: ``card_failures`` fallos de una misma tarjeta en
+      ``window`` segundos (ALTA si repartidos entre varias puertas).
+    * ``SPRAY_DISPOSITIVO`` / ``SPRAY_DEPARTAMENTO``: un lector, o los
+      usuarios de un departamento, con fallos de ``device_cards`` /
+      ``department_cards`` tarjetas distintas en la ventana. Las tarjetas
+      descartadas por el filtro del lector (``observe_rejection``) solo
+      cuentan para el spray del lector.
+    * ``TARJETA_CLONADA``: el mismo UID en dos lectores distintos en menos
+      tiempo del necesario para ir de uno a otro a ``max_speed`` m/s según
+      ``locations``. Solo se comprueba si se conoce la posición de ambos
+      lectores; los contiguos (entrada/salida de una misma puerta) deben
+      tener la misma posición. Se compara con la lectura más reciente de la
+      tarjeta: un evento edge atrasado no la sustituye.
+
+    Cada índice (tarjeta, dispositivo, departamento) guarda como mucho
+    ``max_keys`` claves, en orden de uso; las inactivas se purgan y, si
+    sigue lleno, se expulsan las más antiguas. Cada alerta se silencia
+    ``window`` segundos para su clave. Con varios workers cada proceso solo
+    correlaciona sus propias peticiones.
+    """
+
+    def __init__(self, window: float = 300.0, card_failures: int = 5, device_cards: int = 10,
+                 department_cards: int = 25, max_speed: float = 3.0,
+                 locations: dict = None, max_keys: int = 100000, clock=time.time):
+        self.window = window
+        self.card_failures = card_failures
+        self.device_cards = device_cards
+        self.department_cards = department_cards
+        self.max_speed = max_speed
+        self.locations = locations or {}
+        self.max_keys = max_keys
+        self.clock = clock
+        self._card_failures = OrderedDict()  # nfc_id -> deque[(instante, device_id)] de card_failures
+        self._device_cards = OrderedDict()  # device_id -> OrderedDict(nfc_id -> instante)
+        self._department_cards = OrderedDict()  # departamento -> OrderedDict(nfc_id -> instante)
+        self._last_seen = OrderedDict()  # nfc_id -> (instante, device_id)
+        self._silenced = OrderedDict()  # (tipo, clave) -> silenciada hasta
+        self.events = 0
+        self.alerts = 0
+
+    # ---------- índices acotados ----------
+    def _touch(self, index: OrderedDict, key, factory, now: float):
+        """Entrada de ``key`` movida al final (más reciente); crea con ``factory`` si falta"""
+        entry = index.pop(key, None)
+        if entry is None:
+            if len(index) >= self.max_keys:
+                self._evict(index, now)
+            entry = factory()
+        index[key] = entry
+        return entry
+
+    def _evict(self, index: OrderedDict, now: float):
+        """Expulsar la clave menos reciente y, tras ella, las que ya no tienen actividad en la ventana"""
+        cutoff = now - self.window
+        index.popitem(last=False)
+        while index and self._last_activity(next(iter(index.values()))) < cutoff:
+            index.popitem(last=False)
+
+    @staticmethod
+    def _last_activity(entry) -> float:
+        if isinstance(entry, deque):
+            return entry[-1][0] if entry else 0.0
+        if isinstance(entry, OrderedDict):
+            return next(reversed(entry.values())) if entry else 0.0
+        if isinstance(entry, tuple):
+            return entry[0]
+        return entry
+
+    def _distinct(self, index: OrderedDict, key, nfc_id: str, now: float, limit: int) -> int:
+        """Tarjetas distintas de ``key`` en la ventana tras añadir ``nfc_id``"""
+        cards = self._touch(index, key, OrderedDict, now)
+        cards.pop(nfc_id, None)
+        cards[nfc_id] = now
+        cutoff = now - self.window
+        while cards and (next(iter(cards.values())) < cutoff or len(cards) > limit):
+            cards.popitem(last=False)
+        return len(cards)
+
+    def _raise(self, alerts: list, alert_type: str, key, now: float, **alert):
+        until = self._silenced.get((alert_type, key))
+        if until is not None and until > now:
+            return
+        self._touch(self._silenced, (alert_type, key), float, now)
+        self._silenced[(alert_type, key)] = now + self.window
+        alert['alert_type'] = alert_type
+        alerts.append(alert)
+        self.alerts += 1
+
+    # ---------- eventos ----------
+    def observe(self, nfc_id: str, device_id: str, success: bool, department: str = None,
+                timestamp: float = None) -> list:
+        """Incorporar un intento; devuelve las alertas nuevas (normalmente ninguna)"""
+        now = timestamp if timestamp is not None else self.clock()
+        self.events += 1
+        alerts = []
+
+        previous = self._last_seen.get(nfc_id)
+        self._touch(self._last_seen, nfc_id, tuple, now)
+        if previous is None or now >= previous[0]:
+            self._last_seen[nfc_id] = (now, device_id)
+        else:
+            self._last_seen[nfc_id] = previous
+        if previous is not None and previous[1] != device_id:
+            gap = abs(now - previous[0])
+            travel = self._travel_time(previous[1], device_id)
+            if travel is not None and gap < travel:
+                self._raise(alerts, "TARJETA_CLONADA", nfc_id, now, severity="CRITICA", nfc_id=nfc_id,
+                            device_id=device_id, department=department,
+                            details={"devices": [previous[1], device_id], "seconds_apart": round(gap, 1)})
+
+        if success:
+            return alerts
+
+        failures = self._touch(self._card_failures, nfc_id,
+                               lambda: deque(maxlen=self.card_failures), now)
+        failures.append((now, device_id))
+        if len(failures) == self.card_failures and failures[0][0] >= now - self.window:
+            devices = sorted({device for _, device in failures})
+            self._raise(alerts, "FUERZA_BRUTA", nfc_id, now,
+                        severity="ALTA" if len(devices) > 1 else "MEDIA", nfc_id=nfc_id,
+                        device_id=device_id, department=department,
+                        details={"failures": len(failures), "devices": devices,
+                                 "seconds": round(now - failures[0][0], 1)})
+
+        self._check_device_spray(alerts, nfc_id, device_id, department, now)
+
+        if department:
+            cards = self._distinct(self._department_cards, department, nfc_id, now, self.department_cards)
+            if cards >= self.department_cards:
+                self._raise(alerts, "SPRAY_DEPARTAMENTO", department, now, severity="ALTA", nfc_id=nfc_id,
+                            device_id=device_id, department=department,
+                            details={"distinct_cards": cards, "window_seconds": self.window})
+        return alerts
+
+    def observe_rejection(self, nfc_id: str, device_id: str, timestamp: float = None) -> list:
+        """Tarjeta descartada en el lector (filtro local, sin PIN): solo cuenta para el spray del lector"""
+        now = timestamp if timestamp is not None else self.clock()
+        self.events += 1
+        alerts = []
+        self._check_device_spray(alerts, nfc_id, device_id, None, now)
+        return alerts
+
+    def _check_device_spray(self, alerts: list, nfc_id: str, device_id: str, department, now: float):
+        cards = self._distinct(self._device_cards, device_id, nfc_id, now, self.device_cards)
+        if cards >= self.device_cards:
+            self._raise(alerts, "SPRAY_DISPOSITIVO", device_id, now, severity="ALTA", nfc_id=nfc_id,
+                        device_id=device_id, department=department,
+                        details={"distinct_cards": cards, "window_seconds": self.window})
+
+    def _travel_time(self, device_a: str, device_b: str):
+        """Segundos mínimos para llevar la tarjeta de un lector a otro (None si falta alguna posición)"""
+        a, b = self.locations.get(device_a), self.locations.get(device_b)
+        if a is None or b is None:
+            return None
+        return math.dist(a, b) / self.max_speed
+
+    def tracked_keys(self) -> dict:
+        return {"nfc_id": len(self._card_failures), "device_id": len(self._device_cards),
+                "department": len(self._department_cards), "last_seen": len(self._last_seen)}
+
+
+def replay(db_path: str, correlator: FailureCorrelator, since: str = None) -> list:
+    """Pasar auth_logs (en orden de id) por el correlador para ajustar umbrales"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute('''
+            SELECT al.nfc_id, al.device_id, al.auth_success, u.department,
+                   CAST(strftime('%s', al.auth_timestamp) AS REAL), al.auth_source = 'edge-filter'
+            FROM auth_logs al
+            LEFT JOIN nfc_users u ON u.id = al.user_id
+            WHERE al.auth_timestamp >= COALESCE(?, '')
+            ORDER BY al.id
+        ''', (since,))
+        alerts = []
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for nfc_id, device_id, success, department, timestamp, rejected in rows:
+                if rejected:
+                    if nfc_id != "*":  # "*" agrupa las lecturas sin detalle por tarjeta
+                        alerts.extend(correlator.observe_rejection(nfc_id, device_id, timestamp))
+                else:
+                    alerts.extend(correlator.observe(nfc_id, device_id, bool(success), department, timestamp))
+        return alerts
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproducir auth_logs por el correlador de fallos")
+    parser.add_argument("--db", default=os.environ.get("NFC_DB_PATH", "nfc_auth_system.db"))
+    parser.add_argument("--since", help="Desde esta fecha (AAAA-MM-DD[ HH:MM:SS], UTC)")
+    parser.add_argument("--locations", default=os.environ.get("NFC_DEVICE_LOCATIONS"),
+                        help="JSON con la posición de cada lector en metros")
+    parser.add_argument("--window", type=float, default=300.0)
+    parser.add_argument("--card-failures", type=int, default=5)
+    parser.add_argument("--device-cards", type=int, default=10)
+    parser.add_argument("--department-cards", type=int, default=25)
+    parser.add_argument("--max-speed", type=float, default=3.0,
+                        help="Velocidad máxima entre lectores (m/s) para detectar clones")
+    args = parser.parse_args()
+
+    correlator = FailureCorrelator(
+        window=args.window, card_failures=args.card_failures, device_cards=args.device_cards,
+        department_cards=args.department_cards, max_speed=args.max_speed,
+        locations=load_device_locations(args.locations) if args.locations else None)
+    started = time.perf_counter()
+    alerts = replay(args.db, correlator, args.since)
+    elapsed = time.perf_counter() - started
+    print(f"✅ {correlator.events} eventos en {elapsed:.1f} s "
+          f"({correlator.events / max(elapsed, 1e-9):.0f}/s), {len(alerts)} alertas")
+    by_type = {}
+    for alert in alerts:
+        by_type[alert['alert_type']] = by_type.get(alert['alert_type'], 0) + 1
+    for alert_type, count in sorted(by_type.items()):
+        print(f"⚠️ {alert_type}: {count}")
+    print(f"📝 Claves en memoria: {correlator.tracked_keys()}")
@@ -1,16 +1,160 @@
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import hashlib
 import os
+import time
+
+from activity_search import create_fts_index, fts_query, snippet_sql
+from pin_hasher import PinHasher
+from rollups import GRANULARITY_LENGTH, REPORTS, create_rollup_tables
+
+class _InstrumentedCursor(sqlite3.Cursor):
+    """Cursor que mide cada sentencia incluyendo la lectura de sus filas.
+
+    Las sentencias sin resultado se notifican al terminar. En las consultas
+    la notificación se difiere hasta agotar sus filas (``fetchall``, último
+    ``fetchone``/``fetchmany`` o iteración completa) para informar del
+    tiempo total y de las filas devueltas; si no se leen todas, se notifica
+    en la siguiente sentencia o al cerrar el cursor o la conexión.
+    """
+
+    _pending = None
+
+    def _flush(self):
+        pending, self._pending = self._pending, None
+        if pending:
+            sql, parameters, elapsed, fetched = pending
+            rows = fetched if fetched is not None else self.rowcount
+            self.connection.notify(sql, parameters, elapsed, rows)
+
+    def _timed(self, method, sql, parameters, is_many=False):
+        self._flush()
+        start = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        finally:
+            is_query = not is_many and self.description is not None
+            self._pending = [sql, None if is_many else parameters,
+                             time.perf_counter() - start, 0 if is_query else None]
+            if not is_query:
+                self._flush()
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, sql, seq_of_parameters, is_many=True)
+
+    def _timed_fetch(self, method, *args, exhausted):
+        start = time.perf_counter()
+        result = method(*args)
+        pending = self._pending
+        if pending:
+            pending[2] += time.perf_counter() - start
+            if pending[3] is not None:
+                pending[3] += len(result) if isinstance(result, list) else int(result is not None)
+            if exhausted(result):
+                self._flush()
+        return result
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone, exhausted=lambda row: row is None)
+
+    def fetchmany(self, size=None):
+        size = size if size is not None else self.arraysize
+        return self._timed_fetch(super().fetchmany, size, exhausted=lambda rows: len(rows) < size)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall, exhausted=lambda rows: True)
+
+    def __next__(self):
+        try:
+            return self._timed_fetch(super().__next__, exhausted=lambda row: False)
+        except StopIteration:
+            self._flush()
+            raise
+
+    def close(self):
+        self._flush()
+        super().close()
+
+class _InstrumentedConnection(sqlite3.Connection):
+    """Conexión cuyos cursores están instrumentados"""
+    observers = ()
+
+    def cursor(self, factory=_InstrumentedCursor):
+        cursor = super().cursor(factory)
+        self.__dict__.setdefault('_cursors', []).append(cursor)
+        return cursor
+
+    def notify(self, sql, parameters, elapsed, rows):
+        for observer in self.observers:
+            observer(sql, parameters, elapsed, rows)
+
+    def close(self):
+        for cursor in self.__dict__.pop('_cursors', ()):
+            cursor._flush()
+        super().close()
+
+def _normalize_timestamp(value):
+    """``2025-10-01`` o ISO 8601 -> formato de CURRENT_TIMESTAMP (None se mantiene)"""
+    if not value:
+        return None
+    return datetime.fromisoformat(str(value).replace('Z', '')).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _period_floor(value, period_column: str):
+    """Inicio de la hora (``bucket``) o del día (``day``) que contiene ``value``"""
+    value = _normalize_timestamp(value)
+    if value is None:
+        return None
+    return value[:13] + ':00:00' if period_column == 'bucket' else value[:10]
+
 
 class DatabaseManager:
-    def __init__(self, db_name="nfc_auth_system.db"):
+    # Desorden máximo esperado entre id y timestamp de session_activities
+    activity_timestamp_skew = timedelta(minutes=10)
+
+    def __init__(self, db_name="nfc_auth_system.db", pin_hasher: PinHasher = None):
         self.db_name = db_name
+        self.pin_hasher = pin_hasher or PinHasher()
+        self.query_observers = []
         self.init_database()
     
+    def add_query_observer(self, observer):
+        """Registrar ``observer(sql, parametros, segundos, filas)`` para cada sentencia ejecutada"""
+        if observer not in self.query_observers:
+            self.query_observers.append(observer)
+    
+    def remove_query_observer(self, observer):
+        """Quitar un observador; sin observadores las conexiones no se instrumentan"""
+        if observer in self.query_observers:
+            self.query_observers.remove(observer)
+    
+    def enable_wal(self) -> str:
+        """Activar WAL (persistente en el fichero): lectores concurrentes con un escritor entre procesos"""
+        conn = self._connect()
+        
+        try:
+            return conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error activando WAL: {e}")
+            return None
+        finally:
+            conn.close()
+    
+    def _connect(self):
+        """Abrir conexión; solo se instrumenta si hay observadores registrados"""
+        if not self.query_observers:
+            return sqlite3.connect(self.db_name)
+        conn = sqlite3.connect(self.db_name, factory=_InstrumentedConnection)
+        conn.observers = tuple(self.query_observers)
+        return conn
+    
     def init_database(self):
         """Inicializar la base de datos con todas las tablas"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # Tabla de usuarios NFC (versión actualizada CON PIN)
@@ -49,6 +193,42 @@ class DatabaseManager:
             )
         ''')
         
+        # Origen de la decisión (online / edge-offline) e id de evento para conciliar sin duplicados
+        self._add_column_if_not_exists(cursor, 'auth_logs', 'auth_source', "TEXT DEFAULT 'online'")
+        self._add_column_if_not_exists(cursor, 'auth_logs', 'edge_event_id', 'TEXT')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_auth_logs_edge_event
+            ON auth_logs (edge_event_id) WHERE edge_event_id IS NOT NULL
+        ''')
+        # Recorrido en orden temporal (conciliación con el ledger)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_auth_logs_timestamp ON auth_logs (auth_timestamp, id)')
+        # Puntuación de anomalía frente a la línea base del usuario (behavior_baseline)
+        self._add_column_if_not_exists(cursor, 'auth_logs', 'anomaly_score', 'REAL')
+        
+        # Alertas de seguridad generadas en el servidor
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS security_alerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                alert_type TEXT NOT NULL,
+                severity TEXT NOT NULL,
+                nfc_id TEXT,
+                user_id INTEGER,
+                device_id TEXT,
+                score REAL,
+                details TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_security_alerts_created ON security_alerts (created_at, id)')
+        
+        # Fila única que reescribe la comprobación de salud (latencia real de escritura)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS health_probe (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                probed_at TIMESTAMP NOT NULL
+            )
+        ''')
+        
         # Tabla de sesiones de usuario
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS user_sessions (
@@ -75,16 +255,106 @@ class DatabaseManager:
                 FOREIGN KEY (session_id) REFERENCES user_sessions (id)
             )
         ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_session_activities_timestamp
+            ON session_activities (timestamp, id)
+        ''')
+        # Búsqueda de texto completo (FTS5, insensible a acentos) mantenida por triggers
+        create_fts_index(cursor, 'session_activities', ('activity_type', 'activity_description'))
+        # Agregados para informes, mantenidos por triggers
+        create_rollup_tables(cursor)
+        
+        self._create_user_directory_objects(cursor)
         
         conn.commit()
         
         # Insertar usuarios de prueba después de crear las tablas
         self._insert_test_users(cursor)
+        self._hash_plaintext_pins(cursor)
         
         conn.commit()
         conn.close()
         print("✅ Base de datos inicializada correctamente")
     
+    def _create_user_directory_objects(self, cursor):
+        """Contador de generación de nfc_users (mantenido por triggers) e índice de paginación"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO table_versions (table_name, version) VALUES ('nfc_users', 0)")
+        
+        # Los triggers cubren también escrituras de otros procesos (bulk_users.py, scripts)
+        bump = "UPDATE table_versions SET version = version + 1 WHERE table_name = 'nfc_users';"
+        # SQLite dispara UPDATE OF aunque el valor no cambie (p. ej. _insert_test_users en cada arranque)
+        changed = lambda *cols: " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in cols)
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_nfc_users_version_insert
+            AFTER INSERT ON nfc_users BEGIN {bump} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_nfc_users_version_update
+            AFTER UPDATE OF nfc_id, username, full_name, department, security_level, is_active, is_admin, updated_at
+            ON nfc_users
+            WHEN {changed('nfc_id', 'username', 'full_name', 'department', 'security_level',
+                          'is_active', 'is_admin', 'updated_at')}
+            BEGIN {bump} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_nfc_users_version_delete
+            AFTER DELETE ON nfc_users BEGIN {bump} END
+        ''')
+        
+        # Registro de cambios con número de secuencia para sincronización incremental
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS nfc_user_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                nfc_id TEXT NOT NULL,
+                operation TEXT NOT NULL,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_nfc_users_change_insert
+            AFTER INSERT ON nfc_users BEGIN
+                INSERT INTO nfc_user_changes (nfc_id, operation) VALUES (NEW.nfc_id, 'insert');
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_nfc_users_change_update
+            AFTER UPDATE OF nfc_id, username, full_name, department, security_level, is_active, is_admin, pin
+            ON nfc_users
+            WHEN NOT (OLD.is_active AND NOT NEW.is_active)
+                AND ({changed('nfc_id', 'username', 'full_name', 'department', 'security_level',
+                              'is_active', 'is_admin', 'pin')})
+            BEGIN
+                INSERT INTO nfc_user_changes (nfc_id, operation) VALUES (NEW.nfc_id, 'update');
+                INSERT INTO nfc_user_changes (nfc_id, operation)
+                    SELECT OLD.nfc_id, 'delete' WHERE OLD.nfc_id <> NEW.nfc_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_nfc_users_change_deactivate
+            AFTER UPDATE OF is_active ON nfc_users
+            WHEN OLD.is_active AND NOT NEW.is_active BEGIN
+                INSERT INTO nfc_user_changes (nfc_id, operation) VALUES (NEW.nfc_id, 'deactivate');
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_nfc_users_change_delete
+            AFTER DELETE ON nfc_users BEGIN
+                INSERT INTO nfc_user_changes (nfc_id, operation) VALUES (OLD.nfc_id, 'delete');
+            END
+        ''')
+        
+        # Paginación por clave (full_name, nfc_id) sobre usuarios activos
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_nfc_users_active_name
+            ON nfc_users (full_name, nfc_id) WHERE is_active = TRUE
+        ''')
+    
     def _add_column_if_not_exists(self, cursor, table_name, column_name, column_definition):
         """Agregar columna si no existe en la tabla"""
         try:
@@ -98,6 +368,16 @@ class DatabaseManager:
         except sqlite3.Error as e:
             print(f"⚠️  Error verificando/agregando columna {column_name}: {e}")
     
+    def _hash_plaintext_pins(self, cursor):
+        """Migrar a hash los PIN heredados en texto plano (también los de usuarios que no inician sesión)"""
+        cursor.execute("SELECT id, pin FROM nfc_users WHERE pin IS NOT NULL AND substr(pin, 1, 7) <> 'scrypt$'")
+        legacy = cursor.fetchall()
+        for user_id, pin in legacy:
+            cursor.execute('UPDATE nfc_users SET pin = ? WHERE id = ? AND pin = ?',
+                           (self.pin_hasher.hash_pin(pin), user_id, pin))
+        if legacy:
+            print(f"🔐 {len(legacy)} PIN en texto plano migrados a hash")
+    
     def _insert_test_users(self, cursor):
         """Insertar usuarios de prueba"""
         test_users = [
@@ -114,18 +394,19 @@ class DatabaseManager:
                 existing_user = cursor.fetchone()
                 
                 if existing_user:
-                    # Actualizar usuario existente
+                    # Actualizar usuario existente (el PIN se conserva)
                     cursor.execute('''
                         UPDATE nfc_users 
-                        SET username = ?, full_name = ?, department = ?, security_level = ?, is_admin = ?, pin = ?
+                        SET username = ?, full_name = ?, department = ?, security_level = ?, is_admin = ?
                         WHERE nfc_id = ?
-                    ''', (username, full_name, department, security_level, is_admin, pin, nfc_id))
+                    ''', (username, full_name, department, security_level, is_admin, nfc_id))
                 else:
                     # Insertar nuevo usuario
                     cursor.execute('''
                         INSERT INTO nfc_users (nfc_id, username, full_name, department, security_level, is_admin, pin)
                         VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (nfc_id, username, full_name, department, security_level, is_admin, pin))
+                    ''', (nfc_id, username, full_name, department, security_level, is_admin,
+                          self.pin_hasher.hash_pin(pin)))
                     
             except sqlite3.Error as e:
                 print(f"⚠️  Error insertando usuario {full_name}: {e}")
@@ -139,14 +420,15 @@ class DatabaseManager:
                                  department: str, security_level: int = 1, 
                                  is_admin: bool = False, pin: str = "0000") -> bool:
         """Registrar nuevo usuario NFC CON PIN"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
             cursor.execute('''
                 INSERT INTO nfc_users (nfc_id, username, full_name, department, security_level, is_admin, pin)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (nfc_id, username, full_name, department, security_level, is_admin, pin))
+            ''', (nfc_id, username, full_name, department, security_level, is_admin,
+                  self.pin_hasher.hash_pin(pin)))
             
             conn.commit()
             admin_status = " (ADMIN)" if is_admin else ""
@@ -163,9 +445,103 @@ class DatabaseManager:
         finally:
             conn.close()
     
+    def upsert_users_batch(self, users: list, update_existing: bool = True,
+                           default_pin_hash: str = None) -> set:
+        """Insertar un lote de usuarios en una única transacción.
+
+        ``users`` son tuplas ``(nfc_id, username, full_name, department,
+        security_level, is_admin, pin_hash)``. Con ``pin_hash`` None un
+        usuario existente conserva su PIN y uno nuevo recibe
+        ``default_pin_hash`` (hash de "0000" si no se indica). Devuelve el
+        conjunto de nfc_id que ya existían (actualizados o ignorados según
+        ``update_existing``).
+        """
+        if not users:
+            return set()
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            existing = set()
+            nfc_ids = [user[0] for user in users]
+            for start in range(0, len(nfc_ids), 900):
+                chunk = nfc_ids[start:start + 900]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(f"SELECT nfc_id FROM nfc_users WHERE nfc_id IN ({placeholders})", chunk)
+                existing.update(row[0] for row in cursor.fetchall())
+            
+            if any(user[6] is None and user[0] not in existing for user in users):
+                default_pin_hash = default_pin_hash or self.pin_hasher.hash_pin("0000")
+                users = [user if user[6] is not None or user[0] in existing
+                         else tuple(user[:6]) + (default_pin_hash,) for user in users]
+            
+            if update_existing:
+                cursor.executemany('''
+                    INSERT INTO nfc_users (nfc_id, username, full_name, department, security_level, is_admin, pin)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(nfc_id) DO UPDATE SET
+                        username = excluded.username,
+                        full_name = excluded.full_name,
+                        department = excluded.department,
+                        security_level = excluded.security_level,
+                        is_admin = excluded.is_admin,
+                        pin = COALESCE(excluded.pin, nfc_users.pin),
+                        is_active = TRUE,
+                        updated_at = CURRENT_TIMESTAMP
+                ''', users)
+            else:
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO nfc_users (nfc_id, username, full_name, department, security_level, is_admin, pin)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', users)
+            
+            conn.commit()
+            return existing
+            
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"❌ Error en carga masiva de usuarios: {e}")
+            raise
+        finally:
+            conn.close()
+    
+    def iter_users(self, include_inactive: bool = False, batch_size: int = 5000):
+        """Recorrer usuarios en streaming (sin cargar la tabla en memoria).
+
+        ``pin_hash`` es None si el PIN guardado no es un hash: un PIN en
+        texto plano nunca sale de la base de datos (exportaciones, edge).
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(f'''
+                SELECT nfc_id, username, full_name, department, security_level, is_active, is_admin, pin
+                FROM nfc_users
+                {"" if include_inactive else "WHERE is_active = TRUE"}
+                ORDER BY id
+            ''')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield {
+                        'nfc_id': row[0],
+                        'username': row[1],
+                        'full_name': row[2],
+                        'department': row[3],
+                        'security_level': row[4],
+                        'is_active': bool(row[5]),
+                        'is_admin': bool(row[6]),
+                        'pin_hash': row[7] if PinHasher.is_hashed(row[7]) else None
+                    }
+        finally:
+            conn.close()
+    
     def get_user_by_nfc(self, nfc_id: str):
         """Obtener usuario por ID NFC"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -197,9 +573,54 @@ class DatabaseManager:
         finally:
             conn.close()
     
+    def get_users_by_nfc_ids(self, nfc_ids) -> dict:
+        """Resolver varios ID NFC con una consulta indexada por lote.
+
+        Devuelve un dict ``nfc_id -> usuario`` con todas las claves pedidas;
+        las tarjetas no registradas o inactivas quedan con valor ``None``.
+        """
+        users = dict.fromkeys(nfc_ids)
+        if not users:
+            return users
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            keys = list(users)
+            # SQLite limita los parámetros por sentencia; se consulta en bloques
+            for start in range(0, len(keys), 900):
+                chunk = keys[start:start + 900]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(f'''
+                    SELECT id, nfc_id, username, full_name, department, security_level, is_active, is_admin, pin
+                    FROM nfc_users 
+                    WHERE nfc_id IN ({placeholders}) AND is_active = TRUE
+                ''', chunk)
+                
+                for result in cursor.fetchall():
+                    users[result[1]] = {
+                        'id': result[0],
+                        'nfc_id': result[1],
+                        'username': result[2],
+                        'full_name': result[3],
+                        'department': result[4],
+                        'security_level': result[5],
+                        'is_active': bool(result[6]),
+                        'is_admin': bool(result[7]),
+                        'pin': result[8]
+                    }
+            
+            return users
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error consultando usuarios: {e}")
+            return users
+        finally:
+            conn.close()
+    
     def update_user_pin(self, nfc_id: str, new_pin: str) -> bool:
         """Actualizar PIN de usuario"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -207,7 +628,7 @@ class DatabaseManager:
                 UPDATE nfc_users 
                 SET pin = ?, updated_at = CURRENT_TIMESTAMP
                 WHERE nfc_id = ? AND is_active = TRUE
-            ''', (new_pin, nfc_id))
+            ''', (self.pin_hasher.hash_pin(new_pin), nfc_id))
             
             success = cursor.rowcount > 0
             conn.commit()
@@ -225,21 +646,43 @@ class DatabaseManager:
         finally:
             conn.close()
     
+    def update_user_pin_hash(self, nfc_id: str, expected_hash: str, new_hash: str) -> bool:
+        """Sustituir el hash del PIN (rehash en login) si no cambió entretanto"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                UPDATE nfc_users 
+                SET pin = ?
+                WHERE nfc_id = ? AND pin = ?
+            ''', (new_hash, nfc_id, expected_hash))
+            
+            success = cursor.rowcount > 0
+            conn.commit()
+            return success
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error actualizando hash de PIN: {e}")
+            return False
+        finally:
+            conn.close()
+    
     def get_user_pin(self, nfc_id: str) -> str:
-        """Obtener PIN de usuario"""
+        """Obtener credencial de PIN almacenada (hash)"""
         user = self.get_user_by_nfc(nfc_id)
-        return user['pin'] if user and 'pin' in user else "0000"
+        return user['pin'] if user and 'pin' in user else None
     
     def verify_pin(self, nfc_id: str, pin: str) -> bool:
         """Verificar si el PIN es correcto"""
         user = self.get_user_by_nfc(nfc_id)
         if user and 'pin' in user:
-            return user['pin'] == pin
+            return self.pin_hasher.verify(pin, user['pin'])
         return False
     
     def update_user_as_admin(self, nfc_id: str, full_name: str, department: str = "Administración"):
         """Actualizar usuario como administrador"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -267,7 +710,7 @@ class DatabaseManager:
     
     def get_admin_users(self):
         """Obtener todos los usuarios administradores"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -298,17 +741,17 @@ class DatabaseManager:
     
     def log_auth_attempt(self, user_id: int, nfc_id: str, device_id: str, 
                         success: bool, blockchain_tx_hash: str = None, 
-                        failure_reason: str = None):
+                        failure_reason: str = None, anomaly_score: float = None):
         """Registrar intento de autenticación"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
             cursor.execute('''
                 INSERT INTO auth_logs 
-                (user_id, nfc_id, device_id, auth_success, blockchain_tx_hash, failure_reason)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, nfc_id, device_id, success, blockchain_tx_hash, failure_reason))
+                (user_id, nfc_id, device_id, auth_success, blockchain_tx_hash, failure_reason, anomaly_score)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, nfc_id, device_id, success, blockchain_tx_hash, failure_reason, anomaly_score))
             
             conn.commit()
             status = "EXITOSA" if success else "FALLIDA"
@@ -319,9 +762,142 @@ class DatabaseManager:
         finally:
             conn.close()
     
+    def log_security_alert(self, alert_type: str, severity: str, details: str, nfc_id: str = None,
+                           user_id: int = None, device_id: str = None, score: float = None):
+        """Registrar una alerta de seguridad del servidor"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                INSERT INTO security_alerts 
+                (alert_type, severity, nfc_id, user_id, device_id, score, details)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (alert_type, severity, nfc_id, user_id, device_id, score, details))
+            
+            conn.commit()
+            return cursor.lastrowid
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error registrando alerta de seguridad: {e}")
+            return None
+        finally:
+            conn.close()
+    
+    def probe_write_latency(self):
+        """Segundos de una escritura con commit en health_probe (None si falla)"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            started = time.perf_counter()
+            cursor.execute('INSERT OR REPLACE INTO health_probe (id, probed_at) VALUES (1, CURRENT_TIMESTAMP)')
+            conn.commit()
+            return time.perf_counter() - started
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error en la escritura de prueba: {e}")
+            return None
+        finally:
+            conn.close()
+    
+    def get_security_alerts(self, limit: int = 100, alert_type: str = None, since: str = None):
+        """Últimas alertas de seguridad del servidor"""
+        conditions, parameters = [], []
+        for clause, value in (("alert_type = ?", alert_type), ("created_at >= ?", _normalize_timestamp(since))):
+            if value is not None:
+                conditions.append(clause)
+                parameters.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(f'''
+                SELECT id, alert_type, severity, nfc_id, user_id, device_id, score, details, created_at
+                FROM security_alerts
+                {where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            ''', parameters + [limit])
+            
+            columns = ('id', 'alert_type', 'severity', 'nfc_id', 'user_id', 'device_id', 'score',
+                       'details', 'created_at')
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error obteniendo alertas de seguridad: {e}")
+            return []
+        finally:
+            conn.close()
+    
+    def get_existing_edge_events(self, event_ids: list) -> set:
+        """Ids de eventos edge que ya están en auth_logs"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            existing = set()
+            for start in range(0, len(event_ids), 900):
+                chunk = event_ids[start:start + 900]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(f"SELECT edge_event_id FROM auth_logs WHERE edge_event_id IN ({placeholders})", chunk)
+                existing.update(row[0] for row in cursor.fetchall())
+            return existing
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error consultando eventos edge: {e}")
+            return set()
+        finally:
+            conn.close()
+    
+    def log_edge_auth_attempts(self, attempts: list, source: str = 'edge-offline') -> int:
+        """Registrar en lote decisiones tomadas en el lector.
+
+        ``attempts`` son tuplas ``(user_id, nfc_id, device_id, success,
+        auth_timestamp, blockchain_tx_hash, failure_reason, edge_event_id)``;
+        los eventos ya conciliados se ignoran. ``source`` queda en
+        ``auth_source`` (``edge-offline`` o ``edge-filter``).
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.executemany('''
+                INSERT OR IGNORE INTO auth_logs 
+                (user_id, nfc_id, device_id, auth_success, auth_timestamp, blockchain_tx_hash,
+                 failure_reason, edge_event_id, auth_source)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [tuple(attempt) + (source,) for attempt in attempts])
+            
+            conn.commit()
+            print(f"📝 {cursor.rowcount} decisiones del lector conciliadas ({source})")
+            return cursor.rowcount
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error conciliando autenticaciones offline: {e}")
+            raise
+        finally:
+            conn.close()
+    
+    def get_latest_user_change_seq(self) -> int:
+        """Última secuencia del registro de cambios de nfc_users"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM nfc_user_changes')
+            return cursor.fetchone()[0]
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error obteniendo secuencia de cambios: {e}")
+            return -1
+        finally:
+            conn.close()
+    
     def get_auth_logs(self, limit: int = 50):
         """Obtener últimos registros de autenticación"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -366,7 +942,7 @@ class DatabaseManager:
     
     def create_session(self, user_id: int, device_id: str, session_token: str):
         """Crear nueva sesión para usuario"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -387,7 +963,7 @@ class DatabaseManager:
     def log_session_activity(self, session_id: int, activity_type: str, 
                            description: str, blockchain_tx_hash: str = None):
         """Registrar actividad durante la sesión"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -406,16 +982,63 @@ class DatabaseManager:
         finally:
             conn.close()
     
+    def log_session_activities(self, activities: list) -> int:
+        """Registrar actividades en lote.
+
+        ``activities`` son tuplas ``(session_id, activity_type,
+        activity_description, timestamp, blockchain_tx_hash)``.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.executemany('''
+                INSERT INTO session_activities 
+                (session_id, activity_type, activity_description, timestamp, blockchain_tx_hash)
+                VALUES (?, ?, ?, ?, ?)
+            ''', activities)
+            
+            conn.commit()
+            return cursor.rowcount
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error registrando actividades: {e}")
+            raise
+        finally:
+            conn.close()
+    
+    def close_sessions(self, logouts: list) -> int:
+        """Cerrar sesiones en lote; ``logouts`` son tuplas ``(logout_time, session_token)``"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.executemany('''
+                UPDATE user_sessions 
+                SET logout_time = ?, is_active = FALSE
+                WHERE session_token = ? AND is_active = TRUE
+            ''', logouts)
+            
+            conn.commit()
+            return cursor.rowcount
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error cerrando sesiones: {e}")
+            raise
+        finally:
+            conn.close()
+    
     def get_session_by_token(self, session_token: str):
         """Obtener sesión por token"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
             cursor.execute('''
-                SELECT id, user_id, device_id, login_time, is_active
-                FROM user_sessions 
-                WHERE session_token = ?
+                SELECT us.id, us.user_id, us.device_id, us.login_time, us.is_active, nu.department
+                FROM user_sessions us
+                LEFT JOIN nfc_users nu ON us.user_id = nu.id
+                WHERE us.session_token = ?
             ''', (session_token,))
             
             result = cursor.fetchone()
@@ -426,7 +1049,8 @@ class DatabaseManager:
                     'user_id': result[1],
                     'device_id': result[2],
                     'login_time': result[3],
-                    'is_active': bool(result[4])
+                    'is_active': bool(result[4]),
+                    'department': result[5]
                 }
             return None
             
@@ -438,7 +1062,7 @@ class DatabaseManager:
     
     def close_session(self, session_token: str):
         """Cerrar sesión"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -460,7 +1084,7 @@ class DatabaseManager:
     
     def get_session_activities(self, session_token: str):
         """Obtener todas las actividades de una sesión"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -493,9 +1117,207 @@ class DatabaseManager:
         finally:
             conn.close()
 
+    def search_session_activities(self, query: str, since: str = None, until: str = None,
+                                  nfc_id: str = None, department: str = None, device_id: str = None,
+                                  order: str = "rank", limit: int = 50, offset: int = 0,
+                                  rank_window: int = 20000):
+        """Buscar en las actividades de sesión con el índice FTS5.
+
+        ``query`` admite palabras (AND), ``"frases"`` y ``prefijo*``, sin
+        distinguir mayúsculas ni acentos. ``order`` es ``rank`` (bm25) o
+        ``recent`` (más nuevas primero, sin ``score``). bm25 cuesta unos µs por
+        coincidencia, así que con ``rank`` solo se puntúan las
+        ``rank_window`` coincidencias más recientes que cumplen los filtros
+        (None = todas).
+        ``since``/``until`` se traducen además a un rango de ids para no
+        recorrer coincidencias fuera del periodo.
+        """
+        match = fts_query(query)
+        if match is None:
+            return []
+        since, until = _normalize_timestamp(since), _normalize_timestamp(until)
+        conn = self._connect()
+        cursor = conn.cursor()
+
+        try:
+            low, high = self._activity_id_range(cursor, since, until)
+
+            # Los JOIN únicamente si hay filtros que los necesitan
+            joins = ""
+            if since or until or nfc_id or department or device_id:
+                joins = "JOIN session_activities sa ON sa.id = session_activities_fts.rowid"
+            if nfc_id or department or device_id:
+                joins += (" JOIN user_sessions us ON us.id = sa.session_id"
+                          " LEFT JOIN nfc_users u ON u.id = us.user_id")
+            filters, filter_parameters = [], []
+            for clause, value in (("sa.timestamp >= ?", since), ("sa.timestamp <= ?", until),
+                                  ("u.nfc_id = ?", nfc_id), ("u.department = ?", department),
+                                  ("us.device_id = ?", device_id)):
+                if value is not None:
+                    filters.append(clause)
+                    filter_parameters.append(value)
+
+            def where(low, high):
+                # FTS5 solo aprovecha una cota por lado: se pasa la más ajustada
+                conditions, parameters = ["session_activities_fts MATCH ?"], [match]
+                for clause, value in (("session_activities_fts.rowid >= ?", low),
+                                      ("session_activities_fts.rowid <= ?", high)):
+                    if value is not None:
+                        conditions.append(clause)
+                        parameters.append(value)
+                return " AND ".join(conditions + filters), parameters + filter_parameters
+
+            # La ventana se cuenta sobre las coincidencias ya filtradas: contarla
+            # antes de los filtros dejaría fuera filas que sí los cumplen
+            if order != "recent" and rank_window:
+                conditions, parameters = where(low, high)
+                cursor.execute(f'''
+                    SELECT session_activities_fts.rowid
+                    FROM session_activities_fts {joins}
+                    WHERE {conditions}
+                    ORDER BY session_activities_fts.rowid DESC LIMIT 1 OFFSET ?
+                ''', parameters + [rank_window])
+                row = cursor.fetchone()
+                if row is not None:
+                    low = row[0] + 1
+
+            # Paso 1: solo ids ordenados
+            conditions, parameters = where(low, high)
+            # Con recent no se pide rank: bm25 contaría antes todas las coincidencias de cada término
+            if order == "recent":
+                score, order_by = "NULL", "session_activities_fts.rowid DESC"
+            else:
+                score, order_by = "rank", "rank"
+            cursor.execute(f'''
+                SELECT session_activities_fts.rowid, {score}
+                FROM session_activities_fts {joins}
+                WHERE {conditions}
+                ORDER BY {order_by}
+                LIMIT ? OFFSET ?
+            ''', parameters + [limit, offset])
+            ranks = dict(cursor.fetchall())
+            if not ranks:
+                return []
+            ids = list(ranks)
+
+            # Paso 2: detalle y fragmento solo de la página devuelta (sin rank: bm25
+            # recalcularía sus estadísticas globales en cada rowid del IN)
+            cursor.execute(f'''
+                SELECT
+                    sa.id,
+                    {snippet_sql('session_activities_fts', 1)},
+                    sa.activity_type,
+                    sa.activity_description,
+                    sa.timestamp,
+                    sa.blockchain_tx_hash,
+                    us.device_id,
+                    u.nfc_id,
+                    u.full_name,
+                    u.department
+                FROM session_activities_fts
+                JOIN session_activities sa ON sa.id = session_activities_fts.rowid
+                JOIN user_sessions us ON us.id = sa.session_id
+                LEFT JOIN nfc_users u ON u.id = us.user_id
+                WHERE session_activities_fts MATCH ?
+                  AND session_activities_fts.rowid IN ({", ".join("?" * len(ids))})
+            ''', [match] + ids)
+
+            results = {}
+            for row in cursor.fetchall():
+                results[row[0]] = {
+                    'id': row[0],
+                    'score': round(-ranks[row[0]], 4) if ranks[row[0]] is not None else None,
+                    'snippet': row[1],
+                    'activity_type': row[2],
+                    'description': row[3],
+                    'timestamp': row[4],
+                    'blockchain_tx': row[5],
+                    'device_id': row[6],
+                    'nfc_id': row[7],
+                    'full_name': row[8],
+                    'department': row[9]
+                }
+
+            return [results[activity_id] for activity_id in ids if activity_id in results]
+
+        except sqlite3.Error as e:
+            print(f"❌ Error buscando actividades: {e}")
+            return []
+        finally:
+            conn.close()
+
+    def _activity_id_range(self, cursor, since: str, until: str):
+        """Rango de ids que contiene las actividades de [since, until].
+
+        Las actividades se insertan casi en orden de ``timestamp``; se deja un
+        margen de ``activity_timestamp_skew`` para los lotes que llegan
+        desordenados (varios workers) y el filtro exacto se aplica aparte.
+        """
+        low = high = None
+        if since:
+            bound = (datetime.strptime(since, '%Y-%m-%d %H:%M:%S')
+                     - self.activity_timestamp_skew).strftime('%Y-%m-%d %H:%M:%S')
+            cursor.execute('''
+                SELECT id FROM session_activities WHERE timestamp < ?
+                ORDER BY timestamp DESC, id DESC LIMIT 1
+            ''', (bound,))
+            row = cursor.fetchone()
+            low = row[0] + 1 if row else None
+        if until:
+            bound = (datetime.strptime(until, '%Y-%m-%d %H:%M:%S')
+                     + self.activity_timestamp_skew).strftime('%Y-%m-%d %H:%M:%S')
+            cursor.execute('''
+                SELECT id FROM session_activities WHERE timestamp > ?
+                ORDER BY timestamp, id LIMIT 1
+            ''', (bound,))
+            row = cursor.fetchone()
+            high = row[0] - 1 if row else None
+        return low, high
+
+    def get_rollup_report(self, report: str, since: str = None, until: str = None, key: str = None,
+                          granularity: str = 'day'):
+        """Informe desde las tablas de agregados: coste proporcional a los periodos, no al histórico.
+
+        ``report`` es una clave de ``rollups.REPORTS``; ``key`` filtra por
+        dispositivo o departamento; ``since``/``until`` incluyen los
+        periodos que los contienen.
+        """
+        table, period_column, key_column, aggregates, granularities = REPORTS[report]
+        if granularity not in granularities:
+            raise ValueError(f"Granularidad no disponible para {report}: {granularity}")
+        length = GRANULARITY_LENGTH[granularity]
+        conditions, parameters = [], []
+        for clause, value in ((f"{period_column} >= ?", _period_floor(since, period_column)),
+                              (f"{period_column} <= ?", _period_floor(until, period_column)),
+                              (f"{key_column} = ?", key)):
+            if value is not None:
+                conditions.append(clause)
+                parameters.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        columns = ", ".join(f"{expression} AS {name}" for name, expression in aggregates.items())
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(f'''
+                SELECT substr({period_column}, 1, {length}) AS period, {key_column}, {columns}
+                FROM {table}
+                {where}
+                GROUP BY period, {key_column}
+                ORDER BY period, {key_column}
+            ''', parameters)
+            names = ['period', key_column] + list(aggregates)
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error obteniendo informe {report}: {e}")
+            return []
+        finally:
+            conn.close()
+
     def get_all_users(self):
         """Obtener todos los usuarios"""
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -526,6 +1348,153 @@ class DatabaseManager:
         finally:
             conn.close()
 
+    def get_table_version(self, table_name: str = 'nfc_users') -> int:
+        """Generación actual de una tabla (cambia con cada escritura)"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('SELECT version FROM table_versions WHERE table_name = ?', (table_name,))
+            result = cursor.fetchone()
+            return result[0] if result else 0
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error obteniendo versión de {table_name}: {e}")
+            return -1
+        finally:
+            conn.close()
+    
+    USER_PAGE_FIELDS = ('nfc_id', 'username', 'full_name', 'department', 'security_level', 'is_admin', 'updated_at')
+    
+    def get_users_page(self, after: tuple = None, limit: int = 100, fields=None):
+        """Página de usuarios activos ordenada por (full_name, nfc_id).
+
+        ``after`` es la clave ``(full_name, nfc_id)`` del último usuario de la
+        página anterior. Devuelve ``(usuarios, clave_siguiente)``; la clave es
+        None en la última página. Nunca incluye el PIN.
+        """
+        fields = [f for f in (fields or self.USER_PAGE_FIELDS) if f in self.USER_PAGE_FIELDS]
+        columns = ", ".join(["full_name AS _k1", "nfc_id AS _k2"] + list(fields))
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            if after:
+                cursor.execute(f'''
+                    SELECT {columns}
+                    FROM nfc_users 
+                    WHERE is_active = TRUE AND (full_name, nfc_id) > (?, ?)
+                    ORDER BY full_name, nfc_id
+                    LIMIT ?
+                ''', (after[0], after[1], limit + 1))
+            else:
+                cursor.execute(f'''
+                    SELECT {columns}
+                    FROM nfc_users 
+                    WHERE is_active = TRUE
+                    ORDER BY full_name, nfc_id
+                    LIMIT ?
+                ''', (limit + 1,))
+            
+            rows = cursor.fetchall()
+            users = []
+            for row in rows[:limit]:
+                user = dict(zip(fields, row[2:]))
+                if 'is_admin' in user:
+                    user['is_admin'] = bool(user['is_admin'])
+                users.append(user)
+            
+            next_key = (rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+            return users, next_key
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error obteniendo página de usuarios: {e}")
+            return [], None
+        finally:
+            conn.close()
+
+    DIRECTORY_FIELDS = ('nfc_id', 'username', 'full_name', 'department', 'security_level', 'is_admin')
+    
+    def get_user_changes(self, since: int = 0, limit: int = 1000) -> dict:
+        """Cambios compactados de nfc_users posteriores a ``since``.
+
+        Cada tarjeta aparece una vez con su estado actual: ``upsert`` si está
+        activa o ``remove`` si se desactivó o borró. ``since=0`` (o un
+        ``since`` anterior a lo conservado en el registro) devuelve la foto
+        completa con ``reset=True``.
+        """
+        conn = self._connect()
+        cursor = conn.cursor()
+        columns = ", ".join(f"u.{f}" for f in self.DIRECTORY_FIELDS)
+        
+        try:
+            cursor.execute('SELECT COALESCE(MIN(seq), 1), COALESCE(MAX(seq), 0) FROM nfc_user_changes')
+            oldest_seq, latest_seq = cursor.fetchone()
+            
+            if since <= 0 or since < oldest_seq - 1:
+                cursor.execute(f'''
+                    SELECT {columns} FROM nfc_users u WHERE u.is_active = TRUE ORDER BY u.id
+                ''')
+                changes = [dict(zip(self.DIRECTORY_FIELDS, row), op='upsert', seq=latest_seq)
+                           for row in cursor.fetchall()]
+                for change in changes:
+                    change['is_admin'] = bool(change['is_admin'])
+                return {'reset': True, 'changes': changes, 'latest_seq': latest_seq, 'has_more': False}
+            
+            cursor.execute(f'''
+                SELECT c.nfc_id, c.last_seq, u.is_active, {columns}
+                FROM (
+                    SELECT nfc_id, MAX(seq) AS last_seq
+                    FROM nfc_user_changes
+                    WHERE seq > ?
+                    GROUP BY nfc_id
+                    ORDER BY last_seq
+                    LIMIT ?
+                ) c
+                LEFT JOIN nfc_users u ON u.nfc_id = c.nfc_id
+                ORDER BY c.last_seq
+            ''', (since, limit + 1))
+            rows = cursor.fetchall()
+            
+            changes = []
+            for row in rows[:limit]:
+                if row[2]:
+                    change = dict(zip(self.DIRECTORY_FIELDS, row[3:]), op='upsert', seq=row[1])
+                    change['is_admin'] = bool(change['is_admin'])
+                else:
+                    change = {'nfc_id': row[0], 'op': 'remove', 'seq': row[1]}
+                changes.append(change)
+            
+            has_more = len(rows) > limit
+            next_seq = changes[-1]['seq'] if has_more else max([latest_seq, since] + [c['seq'] for c in changes[-1:]])
+            return {'reset': False, 'changes': changes, 'latest_seq': next_seq, 'has_more': has_more}
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error obteniendo cambios de usuarios: {e}")
+            return {'reset': False, 'changes': [], 'latest_seq': since, 'has_more': False}
+        finally:
+            conn.close()
+    
+    def prune_user_changes(self, keep_last: int = 100000) -> int:
+        """Recortar el registro de cambios; los clientes más atrasados harán resync completo"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                DELETE FROM nfc_user_changes
+                WHERE seq <= (SELECT MAX(seq) FROM nfc_user_changes) - ?
+            ''', (keep_last,))
+            deleted = cursor.rowcount
+            conn.commit()
+            return deleted
+            
+        except sqlite3.Error as e:
+            print(f"❌ Error recortando registro de cambios: {e}")
+            return 0
+        finally:
+            conn.close()
+
     def backup_database(self):
         """Crear backup de la base de datos"""
         import shutil
@@ -558,7 +1527,8 @@ if __name__ == "__main__":
     for user in users:
         admin_status = " 🔑 ADMIN" if user['is_admin'] else ""
         print(f"   👤 {user['full_name']} - {user['department']} - Nivel {user['security_level']}{admin_status}")
-        print(f"   🔐 PIN: {user['pin']}")
+        estado_pin = "hash" if PinHasher.is_hashed(user['pin']) else "texto plano (se migrará al iniciar la base de datos)"
+        print(f"   🔐 PIN: {estado_pin}")
         print("   " + "-" * 40)
     
     print("✅ Base de datos actualizada exitosamente")
\ No newline at end of file
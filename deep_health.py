@@ -0,0 +1,63 @@
+import threading
+import time
+
+HEALTHY, DEGRADED, UNHEALTHY = "healthy", "degraded", "unhealthy"
+_SEVERITY = {HEALTHY: 0, DEGRADED: 1, UNHEALTHY: 2}
+
+
+def threshold_status(value: float, degraded: float, unhealthy: float = None) -> str:
+    """Estado de una medida frente a sus umbrales (None en ``value`` = no medible)"""
+    if value is None or (unhealthy is not None and value >= unhealthy):
+        return UNHEALTHY
+    return DEGRADED if value >= degraded else HEALTHY
+
+
+class DeepHealth:
+    """Comprobación de salud profunda con caché.
+
+    ``checks`` es ``nombre -> función`` que devuelve un dict con ``status``
+    y sus medidas; una excepción cuenta como ``unhealthy``. Las
+    comprobaciones se ejecutan como mucho una vez cada ``ttl`` segundos y
+    solo una petición a la vez: las demás reciben el último informe, así que
+    un balanceador sondeando ``/health`` no multiplica las escrituras de
+    prueba en la base de datos.
+    """
+
+    def __init__(self, checks: dict, ttl: float = 10.0, clock=time.time):
+        self.checks = checks
+        self.ttl = ttl
+        self.clock = clock
+        self._report = None
+        self._lock = threading.Lock()
+
+    @property
+    def status(self):
+        """Estado del último informe sin medir nada (None si aún no hay)"""
+        return self._report["status"] if self._report else None
+
+    def _cached(self, now: float) -> dict:
+        return dict(self._report, age_seconds=round(now - self._report["checked_at"], 1))
+
+    def report(self) -> dict:
+        now = self.clock()
+        if self._report is not None and now - self._report["checked_at"] < self.ttl:
+            return self._cached(now)
+        if not self._lock.acquire(blocking=self._report is None):
+            return self._cached(now)
+        try:
+            if self._report is not None and now - self._report["checked_at"] < self.ttl:
+                return self._cached(now)
+            results = {}
+            for name, check in self.checks.items():
+                started = time.perf_counter()
+                try:
+                    result = dict(check())
+                except Exception as e:
+                    result = {"status": UNHEALTHY, "error": str(e)}
+                result["check_ms"] = round((time.perf_counter() - started) * 1000, 2)
+                results[name] = result
+            status = max((r["status"] for r in results.values()), key=_SEVERITY.get, default=HEALTHY)
+            self._report = {"status": status, "checked_at": now, "checks": results}
+            return self._cached(now)
+        finally:
+            self._lock.release()
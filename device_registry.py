@@ -0,0 +1,281 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+ONLINE, DEGRADED, STALE, OFFLINE = "online", "degraded", "stale", "offline"
+READER_OK = "ok"
+
+
+class RegistryFull(Exception):
+    """El registro ya tiene ``max_devices`` lectores y llega uno nuevo"""
+
+
+class DeviceRegistry:
+    """Registro de lectores a partir de sus heartbeats.
+
+    Un heartbeat solo actualiza la entrada del lector en memoria y la marca
+    como pendiente; un hilo vuelca las pendientes a la tabla ``devices``
+    cada ``flush_interval`` segundos en una sola transacción. Un lector está
+    ``online`` si su último heartbeat tiene menos de ``stale_after``
+    segundos (``degraded`` si informa de un problema en el lector),
+    ``stale`` hasta ``offline_after`` y ``offline`` después. Los cambios de
+    estado se notifican a ``listener(device, anterior, nuevo)``.
+
+    Con varios workers cada uno vuelca los heartbeats que recibe y las
+    consultas leen la tabla: la vista es común con un retraso de hasta
+    ``flush_interval``.
+    """
+
+    def __init__(self, db_path: str, heartbeat_interval: float = 30.0, flush_interval: float = 15.0,
+                 stale_after: float = None, offline_after: float = None, listener=None,
+                 max_devices: int = 10000, clock=time.time):
+        self.db_path = db_path
+        self.heartbeat_interval = heartbeat_interval
+        self.flush_interval = flush_interval
+        self.stale_after = stale_after or 3 * heartbeat_interval
+        self.offline_after = offline_after or 10 * heartbeat_interval
+        self.listener = listener
+        self.max_devices = max_devices
+        self.clock = clock
+        self._devices = {}  # device_id -> estado
+        self._dirty = set()
+        self._notified = {}  # device_id -> último estado notificado
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._init_storage()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _init_storage(self):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS devices (
+                    device_id TEXT PRIMARY KEY,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL,
+                    reader_status TEXT NOT NULL,
+                    queue_depth INTEGER NOT NULL DEFAULT 0,
+                    details TEXT,
+                    remote_addr TEXT,
+                    heartbeats INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            conn.commit()
+            rows = conn.execute('''
+                SELECT device_id, first_seen, last_seen, reader_status, queue_depth, details, remote_addr
+                FROM devices ORDER BY last_seen DESC LIMIT ?
+            ''', (self.max_devices,)).fetchall()
+        finally:
+            conn.close()
+        now = self.clock()
+        for device_id, first_seen, last_seen, reader_status, queue_depth, details, remote_addr in rows:
+            device = {"device_id": device_id, "first_seen": first_seen, "last_seen": last_seen,
+                      "reader_status": reader_status, "queue_depth": queue_depth,
+                      "details": json.loads(details) if details else None,
+                      "remote_addr": remote_addr, "pending_heartbeats": 0}
+            self._devices[device_id] = device
+            self._notified[device_id] = self.status_of(device, now)
+
+    # ---------- estado ----------
+    def status_of(self, device: dict, now: float = None) -> str:
+        age = (now if now is not None else self.clock()) - device["last_seen"]
+        if age > self.offline_after:
+            return OFFLINE
+        if age > self.stale_after:
+            return STALE
+        return ONLINE if device["reader_status"] == READER_OK else DEGRADED
+
+    def _notify(self, device: dict, status: str):
+        previous = self._notified.get(device["device_id"])
+        if previous == status:
+            return
+        self._notified[device["device_id"]] = status
+        if self.listener is not None:
+            self.listener(dict(device), previous, status)
+
+    def heartbeat(self, device_id: str, reader_status: str = READER_OK, queue_depth: int = 0,
+                  details: dict = None, remote_addr: str = None) -> str:
+        """Registrar un heartbeat (solo memoria); devuelve el estado del lector"""
+        now = self.clock()
+        with self._lock:
+            device = self._devices.get(device_id)
+            if device is None:
+                if len(self._devices) >= self.max_devices:
+                    raise RegistryFull(device_id)
+                device = self._devices[device_id] = {"device_id": device_id, "first_seen": now,
+                                                     "pending_heartbeats": 0}
+            device.update(last_seen=now, reader_status=reader_status, queue_depth=queue_depth,
+                          details=details, remote_addr=remote_addr)
+            device["pending_heartbeats"] += 1
+            self._dirty.add(device_id)
+            status = self.status_of(device, now)
+            self._notify(device, status)
+        return status
+
+    def _check_transitions(self):
+        """Notificar los lectores que han dejado de enviar heartbeats"""
+        now = self.clock()
+        with self._lock:
+            for device in self._devices.values():
+                self._notify(device, self.status_of(device, now))
+
+    # ---------- persistencia ----------
+    def flush(self) -> int:
+        """Volcar los heartbeats pendientes; si falla se reintentan en el siguiente volcado"""
+        with self._lock:
+            dirty = [dict(self._devices[device_id]) for device_id in self._dirty]
+            for device_id in self._dirty:
+                self._devices[device_id]["pending_heartbeats"] = 0
+            self._dirty = set()
+        if not dirty:
+            return 0
+        rows = [(d["device_id"], d["first_seen"], d["last_seen"], d["reader_status"], d["queue_depth"],
+                 json.dumps(d["details"]) if d["details"] is not None else None, d["remote_addr"],
+                 d["pending_heartbeats"]) for d in dirty]
+        conn = self._connect()
+        try:
+            # Otro worker puede haber volcado un heartbeat más reciente del mismo lector
+            conn.executemany('''
+                INSERT INTO devices (device_id, first_seen, last_seen, reader_status, queue_depth,
+                                     details, remote_addr, heartbeats)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (device_id) DO UPDATE SET
+                    first_seen = MIN(first_seen, excluded.first_seen),
+                    reader_status = CASE WHEN excluded.last_seen >= last_seen
+                                         THEN excluded.reader_status ELSE reader_status END,
+                    queue_depth = CASE WHEN excluded.last_seen >= last_seen
+                                       THEN excluded.queue_depth ELSE queue_depth END,
+                    details = CASE WHEN excluded.last_seen >= last_seen THEN excluded.details ELSE details END,
+                    remote_addr = CASE WHEN excluded.last_seen >= last_seen
+                                       THEN excluded.remote_addr ELSE remote_addr END,
+                    heartbeats = heartbeats + excluded.heartbeats,
+                    last_seen = MAX(last_seen, excluded.last_seen)
+            ''', rows)
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"❌ Error volcando heartbeats de dispositivos: {e}")
+            with self._lock:
+                for device in dirty:
+                    current = self._devices.get(device["device_id"])
+                    if current is not None:
+                        current["pending_heartbeats"] += device["pending_heartbeats"]
+                        self._dirty.add(device["device_id"])
+            return 0
+        finally:
+            conn.close()
+        return len(rows)
+
+    def list_devices(self, status: str = None) -> list:
+        """Lectores conocidos (de todos los workers) con su estado calculado"""
+        self.flush()
+        conn = self._connect()
+        try:
+            rows = conn.execute('''
+                SELECT device_id, first_seen, last_seen, reader_status, queue_depth, details,
+                       remote_addr, heartbeats
+                FROM devices ORDER BY device_id
+            ''').fetchall()
+        finally:
+            conn.close()
+        now = self.clock()
+        devices = []
+        for device_id, first_seen, last_seen, reader_status, queue_depth, details, remote_addr, beats in rows:
+            device = {"device_id": device_id, "first_seen": first_seen, "last_seen": last_seen,
+                      "seconds_since": round(now - last_seen, 1), "reader_status": reader_status,
+                      "queue_depth": queue_depth, "details": json.loads(details) if details else None,
+                      "remote_addr": remote_addr, "heartbeats": beats}
+            device["status"] = self.status_of(device, now)
+            if status is None or device["status"] == status:
+                devices.append(device)
+        return devices
+
+    def summary(self) -> dict:
+        """Lectores por estado y cola local total de los que siguen vivos"""
+        counts = dict.fromkeys((ONLINE, DEGRADED, STALE, OFFLINE), 0)
+        queued = 0
+        for device in self.list_devices():
+            counts[device["status"]] += 1
+            if device["status"] != OFFLINE:
+                queued += device["queue_depth"]
+        return dict(counts, total=sum(counts.values()), queue_depth=queued)
+
+    def __len__(self):
+        return len(self._devices)
+
+    # ---------- volcado periódico ----------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            self._check_transitions()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+
+class HeartbeatSender:
+    """Heartbeat periódico del lector a ``/devices/heartbeat``.
+
+    ``status()`` devuelve ``reader_status``, ``queue_depth`` y ``details``
+    del lector. El servidor responde con el intervalo que espera y con su
+    propio estado de salud (de caché), así que el lector también sabe si el
+    servidor le ve y cómo está sin sondear ``/health``. Se autentica con el
+    secreto edge (``NFC_EDGE_SECRET``).
+    """
+
+    def __init__(self, api_url: str, device_id: str, status, interval: float = 30.0, timeout: float = 3.0,
+                 secret: str = None):
+        self.api_url = api_url.rstrip("/")
+        self.device_id = device_id
+        self.status = status
+        self.secret = secret or os.environ.get("NFC_EDGE_SECRET", "")
+        self.interval = interval
+        self.timeout = timeout
+        self.server_reachable = None
+        self.server_status = None
+        self.last_ok = None
+        self._stop = threading.Event()
+
+    def send(self) -> dict:
+        payload = dict(self.status(), device_id=self.device_id)
+        response = requests.post(f"{self.api_url}/devices/heartbeat", json=payload, timeout=self.timeout,
+                                 headers={"X-Edge-Token": self.secret, "X-Edge-Device": self.device_id})
+        response.raise_for_status()
+        reply = response.json()
+        self.interval = reply.get("next_heartbeat", self.interval)
+        self.server_status = reply.get("server_status")
+        self.server_reachable = True
+        self.last_ok = time.time()
+        return reply
+
+    def start(self):
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.send()
+                except (requests.RequestException, ValueError):
+                    self.server_reachable = False
+                self._stop.wait(self.interval)
+
+        self._stop.clear()
+        threading.Thread(target=loop, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,282 @@
+import hashlib
+import hmac
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import requests
+
+from pin_hasher import PinHasher
+
+# Antigüedad máxima (s) del snapshot para decidir offline según nivel de seguridad.
+# Nivel 3 nunca se autoriza sin servidor.
+DEFAULT_OFFLINE_STALENESS = {1: 24 * 3600, 2: 4 * 3600, 3: 0}
+
+
+# ---------- firma del snapshot (compartido servidor/edge) ----------
+
+def canonical_json(payload: dict) -> bytes:
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def sign_snapshot(payload: dict, secret: str) -> dict:
+    """Documento firmado con HMAC-SHA256 sobre el JSON canónico"""
+    signature = hmac.new(secret.encode(), canonical_json(payload), hashlib.sha256).hexdigest()
+    return {"payload": payload, "signature": signature}
+
+
+def verify_snapshot(document: dict, secret: str) -> bool:
+    expected = hmac.new(secret.encode(), canonical_json(document.get("payload", {})), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, str(document.get("signature", "")))
+
+
+class EdgeAuthenticator:
+    """Autenticación en el lector con respaldo local cuando el servidor no responde.
+
+    Mantiene un snapshot firmado del directorio (tarjetas, nivel y hash de
+    PIN). Si la llamada a /authenticate falla o supera ``online_timeout``, la
+    decisión se toma localmente (búsqueda en memoria + verificación del hash)
+    siempre que el snapshot no supere la antigüedad permitida para el nivel
+    de seguridad del usuario. Las decisiones offline se encolan en SQLite y
+    se concilian con /edge/reconcile al recuperar la conexión.
+
+    Sin servidor no hay bloqueo por PIN compartido: el lector lleva su
+    propio contador de fallos por tarjeta y, tras ``offline_max_failures``
+    en ``offline_lockout`` segundos, rechaza la tarjeta sin comprobar el
+    PIN hasta que pase ese tiempo.
+    """
+
+    def __init__(self, api_url: str, device_id: str, secret: str = None,
+                 state_dir: str = ".", online_timeout: float = 1.5, online_retries: int = 1,
+                 offline_backoff: float = 15.0, staleness: dict = None,
+                 offline_max_failures: int = 5, offline_lockout: float = 300.0):
+        self.api_url = api_url.rstrip("/")
+        self.device_id = device_id
+        self.secret = secret or os.environ.get("NFC_EDGE_SECRET", "")
+        self.online_timeout = online_timeout
+        self.online_retries = online_retries
+        self.offline_backoff = offline_backoff
+        self.staleness = dict(DEFAULT_OFFLINE_STALENESS, **(staleness or {}))
+        self.offline_max_failures = offline_max_failures
+        self.offline_lockout = offline_lockout
+        self._offline_failures = {}  # nfc_id -> [instantes de fallo en la ventana]
+        self.snapshot_path = os.path.join(state_dir, f"edge_snapshot_{device_id}.json")
+        self.queue_db = os.path.join(state_dir, f"edge_auth_queue_{device_id}.db")
+        self.pin_hasher = PinHasher()
+        self.users = {}
+        self.snapshot_issued_at = None
+        self.snapshot_seq = 0
+        self._offline_until = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._maintenance = None
+        self._init_queue()
+        self._load_snapshot_file()
+
+    # ---------- snapshot ----------
+    def _headers(self):
+        return {"X-Edge-Token": self.secret, "X-Edge-Device": self.device_id}
+
+    def _install_snapshot(self, document: dict) -> bool:
+        if not self.secret or not verify_snapshot(document, self.secret):
+            print("❌ Firma del snapshot de usuarios no válida - se descarta")
+            return False
+        payload = document["payload"]
+        self.users = {user["nfc_id"]: user for user in payload["users"]}
+        self.snapshot_issued_at = payload["issued_at"]
+        self.snapshot_seq = payload["latest_seq"]
+        return True
+
+    def _load_snapshot_file(self):
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                self._install_snapshot(json.load(f))
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def refresh_snapshot(self) -> bool:
+        """Descargar un snapshot nuevo (si cambió) y guardarlo en disco"""
+        response = requests.get(f"{self.api_url}/edge/snapshot", params={"since_seq": self.snapshot_seq},
+                                headers=self._headers(), timeout=10)
+        if response.status_code == 304:
+            self.snapshot_issued_at = time.time()
+            return True
+        response.raise_for_status()
+        document = response.json()
+        if not self._install_snapshot(document):
+            return False
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(document, f)
+        os.replace(tmp_path, self.snapshot_path)
+        return True
+
+    def snapshot_age(self) -> float:
+        return time.time() - self.snapshot_issued_at if self.snapshot_issued_at else float("inf")
+
+    # ---------- cola durable ----------
+    def _init_queue(self):
+        conn = sqlite3.connect(self.queue_db)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS pending_decisions (
+                    event_id TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _enqueue(self, decision: dict):
+        conn = sqlite3.connect(self.queue_db)
+        try:
+            conn.execute("INSERT INTO pending_decisions (event_id, payload, created_at) VALUES (?, ?, ?)",
+                         (decision["event_id"], json.dumps(decision), decision["timestamp"]))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def pending_count(self) -> int:
+        conn = sqlite3.connect(self.queue_db)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM pending_decisions").fetchone()[0]
+        finally:
+            conn.close()
+
+    def reconcile(self, batch_size: int = 500) -> int:
+        """Enviar decisiones offline pendientes; devuelve cuántas se confirmaron"""
+        confirmed = 0
+        while True:
+            conn = sqlite3.connect(self.queue_db)
+            try:
+                rows = conn.execute("SELECT event_id, payload FROM pending_decisions "
+                                    "ORDER BY created_at LIMIT ?", (batch_size,)).fetchall()
+            finally:
+                conn.close()
+            if not rows:
+                return confirmed
+            response = requests.post(f"{self.api_url}/edge/reconcile", headers=self._headers(),
+                                     json={"device_id": self.device_id,
+                                           "decisions": [json.loads(payload) for _, payload in rows]},
+                                     timeout=30)
+            response.raise_for_status()
+            result = response.json()
+            done = result.get("accepted", []) + result.get("duplicates", [])
+            conn = sqlite3.connect(self.queue_db)
+            try:
+                conn.executemany("DELETE FROM pending_decisions WHERE event_id = ?", [(e,) for e in done])
+                conn.commit()
+            finally:
+                conn.close()
+            confirmed += len(done)
+            if len(done) < len(rows):
+                return confirmed
+
+    # ---------- autenticación ----------
+    def authenticate(self, pin: str, nfc_id: str) -> dict:
+        """Autenticar online y, si el servidor no está disponible, localmente.
+
+        Los reintentos usan la misma Idempotency-Key: si la primera petición
+        llegó al servidor, el reintento devuelve ese resultado sin duplicar
+        el registro en auth_logs ni en la blockchain.
+        """
+        if time.time() >= self._offline_until:
+            headers = {"Idempotency-Key": uuid.uuid4().hex}
+            for _ in range(1 + self.online_retries):
+                try:
+                    response = requests.post(f"{self.api_url}/authenticate", headers=headers,
+                                             json={"pin": pin, "nfc_id": nfc_id, "device_id": self.device_id},
+                                             timeout=self.online_timeout)
+                except requests.RequestException:
+                    continue
+                if response.status_code >= 500:
+                    break
+                result = response.json()
+                if response.status_code == 429:
+                    return {"success": False, "message": result.get("detail", "Demasiados intentos")}
+                self._after_online_success()
+                return result
+            # Evitar pagar el timeout en cada toque mientras el servidor esté caído
+            self._offline_until = time.time() + self.offline_backoff
+        return self.authenticate_offline(pin, nfc_id)
+
+    def _after_online_success(self):
+        if self.pending_count():
+            threading.Thread(target=self._reconcile_quietly, daemon=True).start()
+
+    def _reconcile_quietly(self):
+        with self._lock:
+            try:
+                self.reconcile()
+            except Exception:
+                pass
+
+    def _offline_locked(self, nfc_id: str, now: float) -> bool:
+        failures = [t for t in self._offline_failures.get(nfc_id, ()) if t > now - self.offline_lockout]
+        if failures:
+            self._offline_failures[nfc_id] = failures
+        else:
+            self._offline_failures.pop(nfc_id, None)
+        return len(failures) >= self.offline_max_failures
+
+    def authenticate_offline(self, pin: str, nfc_id: str) -> dict:
+        """Decisión local a partir del snapshot firmado; se encola para conciliar"""
+        user = self.users.get(nfc_id)
+        age = self.snapshot_age()
+        now = time.time()
+        if user is None:
+            success, reason = False, "Tarjeta no registrada"
+        elif age > self.staleness.get(user["security_level"], 0):
+            return {"success": False, "offline": True, "user": None, "blockchain_tx": None,
+                    "message": "Servidor no disponible y el nivel de seguridad exige validación online"}
+        elif self._offline_locked(nfc_id, now):
+            success, reason = False, "Tarjeta bloqueada temporalmente por fallos de PIN (offline)"
+        elif not self.pin_hasher.verify(pin, user["pin_hash"]):
+            success, reason = False, "PIN incorrecto"
+            self._offline_failures.setdefault(nfc_id, []).append(now)
+        else:
+            success, reason = True, None
+            self._offline_failures.pop(nfc_id, None)
+
+        decision = {"event_id": uuid.uuid4().hex, "nfc_id": nfc_id, "device_id": self.device_id,
+                    "success": success, "failure_reason": reason, "timestamp": now,
+                    "snapshot_seq": self.snapshot_seq}
+        self._enqueue(decision)
+
+        public_user = None
+        if success:
+            public_user = {k: user[k] for k in ("username", "full_name", "department", "security_level")}
+        return {"success": success, "offline": True, "user": public_user, "blockchain_tx": None,
+                "message": "Autenticación offline exitosa" if success else reason}
+
+    def start_background_maintenance(self, interval: float = 60.0):
+        """Refrescar snapshot y conciliar la cola periódicamente hasta ``stop()``"""
+        def loop():
+            while not self._stop.is_set():
+                with self._lock:
+                    try:
+                        self.refresh_snapshot()
+                        self.reconcile()
+                        self._offline_until = 0.0
+                    except Exception:
+                        pass
+                self._stop.wait(interval)
+
+        if self._maintenance is not None:
+            return
+        self._stop.clear()
+        self._maintenance = threading.Thread(target=loop, daemon=True)
+        self._maintenance.start()
+
+    def stop(self, timeout: float = 30.0):
+        """Detener el mantenimiento esperando a que termine la pasada en curso"""
+        self._stop.set()
+        if self._maintenance is not None:
+            self._maintenance.join(timeout)
+            self._maintenance = None
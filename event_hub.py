@@ -0,0 +1,247 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+
+
+def parse_filter(value):
+    """``"a,b"`` -> ``{"a", "b"}``; vacío o None = sin filtro"""
+    if not value:
+        return None
+    return {item.strip() for item in value.split(",") if item.strip()} or None
+
+
+class Subscription:
+    """Suscriptor del hub con cola acotada y filtros opcionales"""
+
+    def __init__(self, max_queue: int, device_ids=None, departments=None, types=None):
+        self.queue = asyncio.Queue(max_queue)
+        self.device_ids = device_ids
+        self.departments = departments
+        self.types = types
+        self.closed_reason = None
+        self.connected_at = time.time()
+
+    def matches(self, event: dict) -> bool:
+        return ((self.types is None or event["type"] in self.types)
+                and (self.device_ids is None or event.get("device_id") in self.device_ids)
+                and (self.departments is None or event.get("department") in self.departments))
+
+    async def next(self):
+        """Siguiente evento ya serializado, o None si el hub cerró la suscripción"""
+        return await self.queue.get()
+
+    def close(self, reason: str):
+        # El cliente va a desconectarse: se descarta lo pendiente y se avisa
+        self.closed_reason = reason
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class EventHub:
+    """Publicación/suscripción en memoria para monitores en vivo.
+
+    Cada evento se serializa una sola vez y se reparte a todos los
+    suscriptores cuyo filtro (dispositivo, departamento, tipo) lo acepta.
+    Las colas son de ``max_queue`` eventos: el suscriptor que no las vacía
+    a tiempo se desconecta (``slow_consumer``) en lugar de retener
+    memoria o frenar a los demás. Sin suscriptores, ``publish`` no hace
+    nada. Se puede publicar desde cualquier hilo; el reparto ocurre en el
+    event loop. Con varios workers, ``relay`` (``SQLiteEventRelay``) lleva
+    los eventos de cada worker a los suscriptores de los demás.
+    """
+
+    def __init__(self, max_queue: int = 256, max_subscribers: int = 500, relay=None):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self.relay = relay
+        self._subscribers = set()
+        self._loop = None
+        self._loop_thread = None
+        if relay is not None:
+            relay.attach(self)
+
+    def subscribe(self, device_ids=None, departments=None, types=None):
+        """Nueva suscripción (desde el event loop); None si se alcanzó el máximo"""
+        if len(self._subscribers) >= self.max_subscribers:
+            return None
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        subscription = Subscription(self.max_queue, device_ids, departments, types)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def publish(self, event_type: str, **fields):
+        remote = self.relay is not None and self.relay.remote_listeners
+        if not self._subscribers and not remote:
+            return
+        event = {"type": event_type, "timestamp": time.time(), **fields}
+        if remote:
+            self.relay.append(event)
+        if self._subscribers:
+            self.deliver(event)
+
+    def deliver(self, event: dict):
+        """Repartir en el event loop un evento ya construido (local o de otro worker)"""
+        if threading.get_ident() == self._loop_thread:
+            self._fan_out(event)
+        else:
+            self._loop.call_soon_threadsafe(self._fan_out, event)
+
+    def start(self):
+        if self.relay is not None:
+            self.relay.start()
+
+    def stop(self):
+        if self.relay is not None:
+            self.relay.stop()
+
+    def _fan_out(self, event: dict):
+        metrics.EVENT_HUB.inc("published")
+        encoded = None
+        for subscription in list(self._subscribers):
+            if not subscription.matches(event):
+                continue
+            if encoded is None:
+                encoded = json.dumps(event, ensure_ascii=False, default=str)
+            try:
+                subscription.queue.put_nowait(encoded)
+                metrics.EVENT_HUB.inc("delivered")
+            except asyncio.QueueFull:
+                self._subscribers.discard(subscription)
+                subscription.close("slow_consumer")
+                metrics.EVENT_HUB.inc("dropped_subscriber")
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+class SQLiteEventRelay:
+    """Reparto de eventos entre workers a través de una tabla SQLite.
+
+    Cada worker con suscriptores se anuncia en ``hub_listeners`` (caduca a
+    los ``listener_ttl`` segundos). Solo si otro worker escucha, los
+    eventos publicados se acumulan y un hilo los escribe en ``hub_events``
+    cada ``poll_interval`` segundos en una transacción; el mismo hilo lee
+    los de otros workers y los entrega al hub local. Sin monitores
+    conectados el coste es una consulta pequeña por intervalo. Los eventos
+    se purgan tras ``retention`` segundos.
+    """
+
+    def __init__(self, db_path: str, poll_interval: float = 0.25, listener_ttl: float = 10.0,
+                 retention: float = 60.0, max_pending: int = 10000, clock=time.time):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.listener_ttl = listener_ttl
+        self.retention = retention
+        self.max_pending = max_pending
+        self.clock = clock
+        self.origin = os.getpid()
+        self.remote_listeners = False
+        self.relayed = 0
+        self.dropped = 0
+        self._hub = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_id = None
+        self._announced = 0.0
+        self._purged = 0.0
+        self._conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS hub_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                origin INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                payload TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS hub_listeners (
+                origin INTEGER PRIMARY KEY,
+                expires_at REAL NOT NULL
+            );
+        ''')
+
+    def attach(self, hub: EventHub):
+        self._hub = hub
+
+    def append(self, event: dict):
+        """Encolar un evento para los demás workers (cualquier hilo; sin E/S)"""
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending.append(event)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.origin = os.getpid()  # el módulo pudo importarse en el proceso supervisor
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.sync()
+            except sqlite3.Error as e:
+                print(f"⚠️ Error repartiendo eventos entre workers: {e}")
+
+    def sync(self):
+        """Anunciarse si hay suscriptores, escribir lo pendiente y entregar lo de otros workers"""
+        now = self.clock()
+        listening = self._hub is not None and len(self._hub) > 0
+        with self._lock:
+            pending, self._pending = self._pending, []
+        with self._conn:
+            if pending:
+                self._conn.executemany(
+                    'INSERT INTO hub_events (origin, created_at, payload) VALUES (?, ?, ?)',
+                    [(self.origin, now, json.dumps(event, ensure_ascii=False, default=str)) for event in pending])
+            if listening and now - self._announced > self.listener_ttl / 3:
+                self._conn.execute('INSERT OR REPLACE INTO hub_listeners (origin, expires_at) VALUES (?, ?)',
+                                   (self.origin, now + self.listener_ttl))
+                self._announced = now
+            elif not listening and self._announced:
+                self._conn.execute('DELETE FROM hub_listeners WHERE origin = ?', (self.origin,))
+                self._announced = 0.0
+            if now - self._purged > self.retention:
+                self._conn.execute('DELETE FROM hub_events WHERE created_at < ?', (now - self.retention,))
+                self._conn.execute('DELETE FROM hub_listeners WHERE expires_at < ?', (now,))
+                self._purged = now
+        self.remote_listeners = self._conn.execute(
+            'SELECT EXISTS (SELECT 1 FROM hub_listeners WHERE origin != ? AND expires_at > ?)',
+            (self.origin, now)).fetchone()[0] == 1
+        if self._last_id is None or not listening:
+            # Solo interesa lo publicado mientras hay suscriptores
+            self._last_id = self._conn.execute('SELECT COALESCE(MAX(id), 0) FROM hub_events').fetchone()[0]
+            return
+        rows = self._conn.execute('SELECT id, origin, payload FROM hub_events WHERE id > ? ORDER BY id',
+                                  (self._last_id,)).fetchall()
+        for event_id, origin, payload in rows:
+            self._last_id = event_id
+            if origin != self.origin:
+                self._hub.deliver(json.loads(payload))
+                self.relayed += 1
+
+    def stop(self):
+        """Escribir lo pendiente y dejar de anunciarse"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            self.sync()
+            with self._conn:
+                self._conn.execute('DELETE FROM hub_listeners WHERE origin = ?', (self.origin,))
+        except sqlite3.Error as e:
+            print(f"⚠️ Error cerrando el reparto de eventos: {e}")
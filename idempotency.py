@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+
+class IdempotencyConflict(Exception):
+    """La misma clave de idempotencia se reutilizó con otra petición"""
+
+
+class IdempotencyInProgress(IdempotencyConflict):
+    """La petición original sigue en curso (o falló) en otro worker"""
+
+
+def _process_alive(pid) -> bool:
+    """Si el proceso sigue vivo (en Windows os.kill lo mataría: se asume que sí)"""
+    if pid is None or pid == os.getpid() or os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class SQLiteIdempotencyBackend:
+    """Claves de idempotencia compartidas entre workers.
+
+    ``claim`` reserva la clave en una tabla SQLite; si otro proceso ya la
+    reservó devuelve ``(huella, payload)``, con ``payload`` None mientras
+    la petición original siga en curso. Las filas caducadas se reutilizan
+    y se purgan cada ``purge_every`` reservas. Cada reserva anota el pid
+    del worker: si ese proceso ya no existe (se cayó a mitad de petición)
+    la reserva se hereda en vez de responder 409 hasta que caduque. Todas
+    las llamadas bloquean y deben hacerse fuera del event loop.
+    """
+
+    def __init__(self, db_path: str, purge_every: int = 500):
+        self.purge_every = purge_every
+        self._claims = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                payload TEXT,
+                expires_at REAL NOT NULL,
+                owner_pid INTEGER
+            )
+        ''')
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(idempotency_keys)')}
+        if 'owner_pid' not in columns:
+            self._conn.execute('ALTER TABLE idempotency_keys ADD COLUMN owner_pid INTEGER')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS idempotency_meta (key TEXT PRIMARY KEY, value TEXT)')
+
+    def secret(self) -> bytes:
+        """Clave de las huellas, común a todos los workers"""
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO idempotency_meta (key, value) VALUES ('secret', ?)",
+                               (os.urandom(16).hex(),))
+            return bytes.fromhex(self._conn.execute(
+                "SELECT value FROM idempotency_meta WHERE key = 'secret'").fetchone()[0])
+
+    def claim(self, key: str, fingerprint: str, expires_at: float):
+        now = time.time()
+        with self._lock:
+            self._claims += 1
+            if self._claims % self.purge_every == 0:
+                self._conn.execute('DELETE FROM idempotency_keys WHERE expires_at < ?', (now,))
+            cursor = self._conn.execute('''
+                INSERT INTO idempotency_keys (key, fingerprint, payload, expires_at, owner_pid)
+                VALUES (?, ?, NULL, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET fingerprint = excluded.fingerprint, payload = NULL,
+                    expires_at = excluded.expires_at, owner_pid = excluded.owner_pid
+                WHERE idempotency_keys.expires_at < ?
+            ''', (key, fingerprint, expires_at, os.getpid(), now))
+            if cursor.rowcount:
+                return None
+            row = self._conn.execute('SELECT fingerprint, payload, owner_pid FROM idempotency_keys WHERE key = ?',
+                                     (key,)).fetchone()
+            if row[1] is None and row[0] == fingerprint and not _process_alive(row[2]):
+                cursor = self._conn.execute('''
+                    UPDATE idempotency_keys SET owner_pid = ?, expires_at = ?
+                    WHERE key = ? AND payload IS NULL AND owner_pid = ?
+                ''', (os.getpid(), expires_at, key, row[2]))
+                if cursor.rowcount:
+                    return None
+            return row[:2]
+
+    def get(self, key: str):
+        with self._lock:
+            return self._conn.execute('SELECT fingerprint, payload FROM idempotency_keys WHERE key = ?',
+                                      (key,)).fetchone()
+
+    def complete(self, key: str, payload: str):
+        with self._lock:
+            self._conn.execute('UPDATE idempotency_keys SET payload = ? WHERE key = ?', (payload, key))
+
+    def release(self, key: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM idempotency_keys WHERE key = ? AND payload IS NULL', (key,))
+
+
+class IdempotencyStore:
+    """Resultados recientes indexados por clave de idempotencia.
+
+    Guarda ``clave -> [huella, futuro, caduca_en]``. Un reintento con la
+    misma clave recibe el resultado original (o espera al que está en curso)
+    sin repetir el trabajo. Las entradas caducan tras ``ttl`` segundos y
+    ``max_entries`` acota la memoria expulsando las más antiguas. Pensado
+    para el event loop: no usa locks.
+
+    Con ``backend`` (varios workers) la clave se reserva además en el
+    almacén compartido y el desenlace se guarda serializado con
+    ``encode``/``decode``, de modo que un reintento que llegue a otro
+    proceso tampoco repite el trabajo. Las llamadas al almacén se hacen en
+    el pool de hilos por defecto del loop.
+    """
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 10000, clock=time.monotonic,
+                 backend: SQLiteIdempotencyBackend = None, encode=None, decode=None,
+                 pending_timeout: float = 10.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.backend = backend
+        self.encode = encode
+        self.decode = decode
+        self.pending_timeout = pending_timeout
+        self._entries = OrderedDict()
+        self._secret = backend.secret() if backend is not None else os.urandom(16)
+
+    def fingerprint(self, *parts) -> str:
+        """Huella de la petición (con clave por proceso: el PIN no queda en claro)"""
+        return hmac.new(self._secret, "\x1f".join(map(str, parts)).encode(), hashlib.sha256).hexdigest()
+
+    def _backend_call(self, method, *args):
+        return asyncio.get_running_loop().run_in_executor(None, method, *args)
+
+    def _purge(self, now):
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry[2] > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    async def run(self, key, fingerprint: str, func, cacheable=lambda outcome: True):
+        """Ejecutar ``await func()`` una sola vez por clave.
+
+        ``cacheable(resultado_o_excepcion)`` decide si el desenlace se
+        conserva; si no, la clave se libera y el siguiente reintento vuelve
+        a ejecutar (p. ej. tras un 429 o un error interno).
+        """
+        now = self.clock()
+        self._purge(now)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if not hmac.compare_digest(entry[0], fingerprint):
+                raise IdempotencyConflict("Clave de idempotencia reutilizada con otra petición")
+            metrics.CACHE_REQUESTS.inc("idempotency", "hit")
+            return await asyncio.shield(entry[1])
+
+        shared_key = "\x1f".join(map(str, key)) if isinstance(key, tuple) else str(key)
+        if self.backend is not None:
+            existing = await self._backend_call(self.backend.claim, shared_key, fingerprint,
+                                                time.time() + self.ttl)
+            if existing is not None:
+                if not hmac.compare_digest(existing[0], fingerprint):
+                    raise IdempotencyConflict("Clave de idempotencia reutilizada con otra petición")
+                payload = existing[1] or await self._wait_shared(shared_key)
+                metrics.CACHE_REQUESTS.inc("idempotency", "hit")
+                return self.decode(payload)
+
+        metrics.CACHE_REQUESTS.inc("idempotency", "miss")
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = [fingerprint, future, now + self.ttl]
+        self._purge(now)
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            self._discard(key, future, shared_key)  # la liberación compartida sigue en el pool
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # marcado como recuperado aunque no haya reintentos esperando
+            await self._settle(key, future, shared_key, e, cacheable)
+            raise
+        future.set_result(result)
+        await self._settle(key, future, shared_key, result, cacheable)
+        return result
+
+    async def _settle(self, key, future, shared_key, outcome, cacheable):
+        if not cacheable(outcome):
+            released = self._discard(key, future, shared_key)
+            if released is not None:
+                await released
+        elif self.backend is not None:
+            await self._backend_call(self.backend.complete, shared_key, self.encode(outcome))
+
+    async def _wait_shared(self, shared_key: str) -> str:
+        deadline = self.clock() + self.pending_timeout
+        while self.clock() < deadline:
+            await asyncio.sleep(0.05)
+            row = await self._backend_call(self.backend.get, shared_key)
+            if row is None:
+                break
+            if row[1] is not None:
+                return row[1]
+        raise IdempotencyInProgress("La petición original con esta clave no ha terminado; reintente")
+
+    def _discard(self, key, future, shared_key=None):
+        """Olvidar la clave; devuelve el futuro de la liberación compartida (o None)"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is future:
+            del self._entries[key]
+        if self.backend is not None and shared_key is not None:
+            return self._backend_call(self.backend.release, shared_key)
+        return None
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TapDeduplicator:
+    """Filtro de lecturas repetidas en el lector.
+
+    Una tarjeta apoyada se lee una y otra vez; solo se entrega de nuevo si
+    salió del campo o no se ha visto durante ``window`` segundos. La clave
+    es ``(nfc_id, device_id)`` y cada dispositivo recuerda una sola tarjeta.
+    """
+
+    def __init__(self, window: float = 10.0, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._last = {}
+
+    def is_duplicate(self, nfc_id: str, device_id: str) -> bool:
+        """True si es la misma tarjeta que sigue presente; renueva la ventana"""
+        now = self.clock()
+        previous = self._last.get(device_id)
+        self._last[device_id] = (nfc_id, now)
+        return previous is not None and previous[0] == nfc_id and now - previous[1] < self.window
+
+    def card_left(self, device_id: str):
+        """El lector dejó de ver la tarjeta: el siguiente toque cuenta como nuevo"""
+        self._last.pop(device_id, None)
@@ -0,0 +1,488 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+
+# Contrato de anclaje mínimo, ensamblado a mano para no depender de solc.
+# Equivale a:
+#
+#   fallback(bytes32 root) {            // calldata = raíz de 32 bytes
+#       require(msg.sender == owner);
+#       if (anchoredAt[root] == 0) {    // slot de storage = la propia raíz
+#           anchoredAt[root] = block.timestamp;
+#           emit Anchored(root);        // LOG1 con topic = raíz
+#       }
+#   }
+#
+# La comprobación se hace con eth_getStorageAt(contrato, raíz): != 0 si la
+# raíz está anclada (sin ABI).
+ANCHOR_RUNTIME = "3373{owner}14601e57600080fd5b600035805415602957005b80429055600080a100"
+ANCHOR_CONSTRUCTOR = "6033" "80" "600b" "6000" "39" "6000" "f3"  # CODECOPY del runtime y RETURN
+ANCHOR_GAS = 100000
+
+
+def anchor_contract_bytecode(owner: str) -> bytes:
+    """Código de despliegue del contrato de anclaje para ``owner``"""
+    return bytes.fromhex(ANCHOR_CONSTRUCTOR + ANCHOR_RUNTIME.format(owner=owner[2:].lower()))
+
+
+def merkle_leaf(record: dict) -> bytes:
+    """Hoja de Merkle de un registro del ledger (compromete todos sus campos)"""
+    data = (f"{record['block_number']}|{record['tx_hash']}|{record['user_id']}|{record['timestamp']!r}|"
+            f"{record['device_id']}|{record['nfc_id']}|{int(bool(record['success']))}")
+    return hashlib.sha256(data.encode()).digest()
+
+
+def _hash_pair(a: bytes, b: bytes) -> bytes:
+    # Pares ordenados: la prueba no necesita indicar el lado de cada hermano
+    return hashlib.sha256(a + b if a <= b else b + a).digest()
+
+
+def merkle_root(leaves: list) -> bytes:
+    level = list(leaves)
+    if not level:
+        raise ValueError("Lote vacío")
+    while len(level) > 1:
+        level = [_hash_pair(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+    return level[0]
+
+
+def merkle_proof(leaves: list, index: int) -> list:
+    """Hermanos desde la hoja ``index`` hasta la raíz"""
+    proof = []
+    level = list(leaves)
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(level[sibling])
+        level = [_hash_pair(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+        index //= 2
+    return proof
+
+
+def verify_merkle_proof(leaf: bytes, proof: list, root: bytes) -> bool:
+    node = leaf
+    for sibling in proof:
+        node = _hash_pair(node, sibling)
+    return node == root
+
+
+class _SenderState:
+    """Nonce local y turno de anclaje de una cuenta, comunes a todos sus ledgers del proceso"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.next_nonce = None
+
+
+_senders = {}
+_senders_lock = threading.Lock()
+_process_token = None
+
+
+def _sender_state(address: str) -> _SenderState:
+    with _senders_lock:
+        return _senders.setdefault(address.lower(), _SenderState())
+
+
+def _lease_token() -> str:
+    """Identidad de este proceso en las concesiones (nueva tras un fork)"""
+    global _process_token
+    if _process_token is None or not _process_token.startswith(f"{os.getpid()}:"):
+        _process_token = f"{os.getpid()}:{os.urandom(4).hex()}"
+    return _process_token
+
+
+class AnchoredLedger:
+    """Ledger local con anclaje periódico de raíces de Merkle en una cadena EVM.
+
+    Envuelve un ledger local (``SQLiteLedger`` o ``BlockchainSimulated``) y
+    mantiene su interfaz: ``record_auth_attempt`` escribe solo en local y
+    devuelve el hash al momento, así que la latencia de autenticación no
+    depende de la cadena. Un hilo en segundo plano agrupa los bloques
+    nuevos en lotes de hasta ``batch_size``, cada ``interval`` segundos o
+    en cuanto se llena un lote, y envía una transacción por lote con su raíz
+    de Merkle al contrato de anclaje.
+
+    El nonce se gestiona en local (varias transacciones en vuelo sin
+    esperar confirmaciones) y los recibos se consultan en cada vuelta; si
+    una transacción no se mina en ``receipt_timeout`` segundos se reemplaza
+    con el mismo nonce y más gas. Los lotes se guardan en ``anchor_batches``
+    (en el fichero del ledger SQLite, o en memoria), de donde salen las
+    pruebas de inclusión.
+
+    Los ledgers "auth" y "sessions" firman con la misma cuenta: el nonce y
+    la concesión ``anchor_meta.leader:<cuenta>`` son por cuenta, no por
+    ledger. En un proceso los ledgers de una cuenta anclan por turnos con
+    un único contador de nonce; con varios workers solo ancla el proceso
+    que tiene la concesión y el resto solo escribe en local. La cuenta del
+    nodo (sin ``private_key``) se resuelve en el primer anclaje, no al
+    importar.
+    """
+
+    def __init__(self, ledger, web3: Web3, private_key: str = None, contract_address: str = None,
+                 batch_size: int = 256, interval: float = 5.0, confirmations: int = 1,
+                 receipt_timeout: float = 120.0, gas_bump: float = 1.125, max_in_flight: int = 16,
+                 start: bool = True):
+        self._ledger = ledger
+        self.web3 = web3
+        self.batch_size = batch_size
+        self.interval = interval
+        self.confirmations = confirmations
+        self.receipt_timeout = receipt_timeout
+        self.gas_bump = gas_bump
+        self.max_in_flight = max_in_flight
+        self.name = getattr(ledger, "ledger", "memory")
+        self._account = web3.eth.account.from_key(private_key) if private_key else None
+        self._sender = self._account.address if self._account else None
+        self.contract_address = contract_address
+        self._chain_id = None
+        self._recorded = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        state_path = getattr(ledger, "db_path", ":memory:")
+        self._conn = sqlite3.connect(state_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS anchor_batches (
+                ledger TEXT NOT NULL,
+                first_block INTEGER NOT NULL,
+                last_block INTEGER NOT NULL,
+                merkle_root TEXT NOT NULL,
+                nonce INTEGER,
+                chain_tx_hash TEXT,
+                gas_price INTEGER,
+                status TEXT NOT NULL DEFAULT 'pending',
+                chain_block INTEGER,
+                submitted_at REAL,
+                confirmed_at REAL,
+                PRIMARY KEY (ledger, first_block)
+            )
+        ''')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS anchor_meta (key TEXT PRIMARY KEY, value TEXT)')
+        print(f"🔗 Anclaje EVM del ledger '{self.name}' (lotes de {batch_size}, cada {interval:.0f} s)")
+        if start:
+            self.start()
+
+    # ---------- interfaz de ledger ----------
+    def record_auth_attempt(self, user_id: str, timestamp: float,
+                            device_id: str, nfc_id: str, success: bool):
+        """Registrar en el ledger local; el anclaje llega después, en lote"""
+        tx_hash = self._ledger.record_auth_attempt(user_id, timestamp, device_id, nfc_id, success)
+        self._recorded += 1
+        if self._recorded % self.batch_size == 0:
+            self._wake.set()
+        return tx_hash
+
+    def record_auth_attempts(self, attempts: list) -> list:
+        tx_hashes = self._ledger.record_auth_attempts(attempts)
+        previous, self._recorded = self._recorded, self._recorded + len(tx_hashes)
+        if previous // self.batch_size != self._recorded // self.batch_size:
+            self._wake.set()
+        return tx_hashes
+
+    def verify_transaction(self, tx_hash: str):
+        """Verificar transacción (en el ledger local; ver ``verify_anchor``)"""
+        return self._ledger.verify_transaction(tx_hash)
+
+    def __len__(self):
+        return len(self._ledger)
+
+    def __getattr__(self, name):
+        # db_path, ledger, records, iter_records... del ledger local
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._ledger, name)
+
+    @property
+    def sender(self) -> str:
+        """Cuenta que firma los anclajes (la primera del nodo si no hay clave)"""
+        if self._sender is None:
+            self._sender = self.web3.eth.accounts[0]
+        return self._sender
+
+    @property
+    def _state(self) -> _SenderState:
+        return _sender_state(self.sender)
+
+    # ---------- hilo de anclaje ----------
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.anchor_once()
+                except Exception as e:
+                    print(f"⚠️ Error anclando el ledger '{self.name}': {e}")
+                self._wake.wait(self.interval)
+                self._wake.clear()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+
+    def anchor_once(self) -> bool:
+        """Una vuelta: recibos, reenvíos y lotes nuevos. False si otro worker lidera"""
+        with self._state.lock:
+            if not self._acquire_lease():
+                return False
+            if self._chain_id is None:
+                self._chain_id = self.web3.eth.chain_id
+            if self.contract_address is None:
+                self.contract_address = self._get_or_deploy_contract()
+            self._poll_receipts()
+            self._submit_unsent()
+            self._anchor_new_blocks()
+            return True
+
+    def flush(self, timeout: float = 60.0) -> bool:
+        """Anclar todo lo pendiente y esperar confirmaciones (pruebas, apagado ordenado)"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            self.anchor_once()
+            status = self.anchor_status()
+            if status["confirmed_block"] >= status["blocks"]:
+                return True
+            time.sleep(0.2)
+        return False
+
+    def _acquire_lease(self) -> bool:
+        now = time.time()
+        token = _lease_token()
+        key = f"leader:{self.sender}"
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute('SELECT value FROM anchor_meta WHERE key = ?', (key,)).fetchone()
+                holder, expires = row[0].rsplit("|", 1) if row else (None, "0")
+                leader = holder == token or float(expires) < now
+                if leader:
+                    self._conn.execute('INSERT OR REPLACE INTO anchor_meta (key, value) VALUES (?, ?)',
+                                       (key, f"{token}|{now + 3 * self.interval}"))
+                    if holder != token:
+                        # Nueva concesión: el nonce se vuelve a leer de la cadena
+                        self._state.next_nonce = None
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return leader
+
+    def _get_or_deploy_contract(self) -> str:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM anchor_meta WHERE key = 'contract'").fetchone()
+        if row:
+            return row[0]
+        tx_hash, _ = self._send({"data": anchor_contract_bytecode(self.sender), "gas": 200000})
+        receipt = self.web3.eth.wait_for_transaction_receipt(tx_hash, timeout=self.receipt_timeout)
+        address = receipt["contractAddress"]
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO anchor_meta (key, value) VALUES ('contract', ?)", (address,))
+            address = self._conn.execute("SELECT value FROM anchor_meta WHERE key = 'contract'").fetchone()[0]
+        print(f"✅ Contrato de anclaje desplegado en {address}")
+        return address
+
+    def _send(self, tx: dict, nonce: int = None, gas_price: int = None):
+        """Firmar (o delegar en la cuenta desbloqueada del nodo) y enviar sin esperar.
+
+        Se llama con ``_state.lock`` tomado; devuelve ``(tx_hash, nonce)``.
+        """
+        state = self._state
+        if state.next_nonce is None:
+            state.next_nonce = self.web3.eth.get_transaction_count(self.sender, "pending")
+        if nonce is None:
+            nonce = state.next_nonce
+        tx = dict(tx, nonce=nonce, chainId=self._chain_id or self.web3.eth.chain_id,
+                  gasPrice=gas_price or self.web3.eth.gas_price, value=0)
+        if self._account is not None:
+            signed = self._account.sign_transaction(tx)
+            # rawTransaction en eth-account < 0.13 (web3 6.x); raw_transaction después
+            raw = getattr(signed, "raw_transaction", None) or signed.rawTransaction
+            tx_hash = self.web3.eth.send_raw_transaction(raw)
+        else:
+            tx_hash = self.web3.eth.send_transaction(dict(tx, **{"from": self.sender}))
+        state.next_nonce = max(state.next_nonce, nonce + 1)
+        return tx_hash, nonce
+
+    def _iter_range(self, first: int, last: int):
+        for record in self._ledger.iter_records(after_block=first - 1):
+            if record['block_number'] > last:
+                return
+            yield record
+
+    def _anchor_new_blocks(self):
+        with self._lock:
+            anchored, in_flight = self._conn.execute('''
+                SELECT COALESCE(MAX(last_block), 0), SUM(status != 'confirmed')
+                FROM anchor_batches WHERE ledger = ?
+            ''', (self.name,)).fetchone()
+        total = len(self._ledger)
+        in_flight = in_flight or 0
+        while anchored < total and in_flight < self.max_in_flight:
+            first, last = anchored + 1, min(anchored + self.batch_size, total)
+            root = merkle_root([merkle_leaf(r) for r in self._iter_range(first, last)])
+            with self._lock:
+                self._conn.execute('''
+                    INSERT INTO anchor_batches (ledger, first_block, last_block, merkle_root)
+                    VALUES (?, ?, ?, ?)
+                ''', (self.name, first, last, root.hex()))
+            self._submit(first, root.hex())
+            anchored = last
+            in_flight += 1
+
+    def _submit(self, first_block: int, root: str, nonce: int = None, gas_price: int = None):
+        gas_price = gas_price or self.web3.eth.gas_price
+        try:
+            tx_hash, nonce = self._send({"to": self.contract_address, "data": bytes.fromhex(root),
+                                         "gas": ANCHOR_GAS}, nonce, gas_price)
+        except ValueError as e:
+            message = str(e).lower()
+            if "nonce" in message or "underpriced" in message:
+                # Nonce ya usado u ocupado por otra transacción pendiente (reinicio, envío
+                # previo que sí llegó, otro ledger de la cuenta): resincronizar con la cadena
+                self._state.next_nonce = None
+            if "underpriced" in message and nonce is not None:
+                # Reemplazo insuficiente: el siguiente intento sube sobre este precio
+                with self._lock:
+                    self._conn.execute('UPDATE anchor_batches SET gas_price = ? WHERE ledger = ? AND first_block = ?',
+                                       (gas_price, self.name, first_block))
+            print(f"⚠️ No se pudo enviar el anclaje del bloque {first_block}: {e}")
+            return
+        with self._lock:
+            self._conn.execute('''
+                UPDATE anchor_batches SET nonce = ?, chain_tx_hash = ?, gas_price = ?, status = 'submitted',
+                    submitted_at = ?
+                WHERE ledger = ? AND first_block = ?
+            ''', (nonce, tx_hash.hex(), gas_price,
+                  time.time(), self.name, first_block))
+
+    def _submit_unsent(self):
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT first_block, merkle_root FROM anchor_batches
+                WHERE ledger = ? AND status = 'pending' ORDER BY first_block
+            ''', (self.name,)).fetchall()
+        for first_block, root in rows:
+            self._submit(first_block, root)
+
+    def _poll_receipts(self):
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT first_block, merkle_root, nonce, chain_tx_hash, gas_price, submitted_at
+                FROM anchor_batches WHERE ledger = ? AND status = 'submitted' ORDER BY first_block
+            ''', (self.name,)).fetchall()
+        if not rows:
+            return
+        head = self.web3.eth.block_number
+        for first_block, root, nonce, chain_tx_hash, gas_price, submitted_at in rows:
+            try:
+                receipt = self.web3.eth.get_transaction_receipt(chain_tx_hash)
+            except TransactionNotFound:
+                receipt = None
+            if receipt is None:
+                if self._root_on_chain(root):
+                    # Se minó otra transacción con el mismo nonce y la misma raíz (un reemplazo)
+                    self._mark_confirmed(first_block, None)
+                elif time.time() - submitted_at > self.receipt_timeout:
+                    print(f"⚠️ Anclaje del bloque {first_block} sin minar; reemplazando con más gas")
+                    self._submit(first_block, root, nonce, int(gas_price * self.gas_bump) + 1)
+                continue
+            if receipt["status"] != 1:
+                print(f"❌ Anclaje del bloque {first_block} revertido; se reenviará")
+                with self._lock:
+                    self._conn.execute('''
+                        UPDATE anchor_batches SET status = 'pending', nonce = NULL
+                        WHERE ledger = ? AND first_block = ?
+                    ''', (self.name, first_block))
+            elif head - receipt["blockNumber"] + 1 >= self.confirmations:
+                self._mark_confirmed(first_block, receipt["blockNumber"])
+
+    def _mark_confirmed(self, first_block: int, chain_block):
+        with self._lock:
+            self._conn.execute('''
+                UPDATE anchor_batches SET status = 'confirmed', chain_block = ?, confirmed_at = ?
+                WHERE ledger = ? AND first_block = ?
+            ''', (chain_block, time.time(), self.name, first_block))
+
+    def _root_on_chain(self, root: str) -> bool:
+        slot = self.web3.eth.get_storage_at(self.contract_address, int(root, 16))
+        return int.from_bytes(slot, "big") != 0
+
+    # ---------- consultas ----------
+    def anchor_status(self) -> dict:
+        with self._lock:
+            row = self._conn.execute('''
+                SELECT COALESCE(MAX(last_block), 0),
+                       COALESCE(MAX(CASE WHEN status = 'confirmed' THEN last_block END), 0),
+                       COALESCE(SUM(status = 'submitted'), 0), COALESCE(SUM(status = 'pending'), 0)
+                FROM anchor_batches WHERE ledger = ?
+            ''', (self.name,)).fetchone()
+        return {"ledger": self.name, "blocks": len(self._ledger), "anchored_block": row[0],
+                "confirmed_block": row[1], "in_flight": row[2], "unsent": row[3],
+                "contract": self.contract_address, "sender": self._sender}
+
+    def anchor_proof(self, tx_hash: str):
+        """Prueba de inclusión de ``tx_hash`` en su lote anclado (None si aún no hay lote)"""
+        block_number = self._block_number_of(tx_hash)
+        if block_number is None:
+            return None
+        with self._lock:
+            row = self._conn.execute('''
+                SELECT first_block, last_block, merkle_root, status, chain_tx_hash, chain_block
+                FROM anchor_batches WHERE ledger = ? AND first_block <= ? AND last_block >= ?
+            ''', (self.name, block_number, block_number)).fetchone()
+        if row is None:
+            return None
+        first_block, last_block, root, status, chain_tx_hash, chain_block = row
+        leaves = [merkle_leaf(r) for r in self._iter_range(first_block, last_block)]
+        index = block_number - first_block
+        return {"tx_hash": tx_hash, "block_number": block_number, "leaf": leaves[index].hex(),
+                "proof": [p.hex() for p in merkle_proof(leaves, index)], "merkle_root": root,
+                "batch": [first_block, last_block], "status": status, "chain_tx_hash": chain_tx_hash,
+                "chain_block": chain_block, "contract": self.contract_address}
+
+    def verify_anchor(self, tx_hash: str) -> bool:
+        """La prueba de inclusión es válida y la raíz está en el contrato"""
+        proof = self.anchor_proof(tx_hash)
+        if proof is None or proof["status"] != "confirmed":
+            return False
+        return verify_merkle_proof(bytes.fromhex(proof["leaf"]), [bytes.fromhex(p) for p in proof["proof"]],
+                                   bytes.fromhex(proof["merkle_root"])) \
+            and self._root_on_chain(proof["merkle_root"])
+
+    def _block_number_of(self, tx_hash: str):
+        if hasattr(self._ledger, "db_path"):
+            with self._lock:
+                row = self._conn.execute('SELECT block_number FROM ledger_blocks WHERE ledger = ? AND tx_hash = ?',
+                                         (self.name, tx_hash)).fetchone()
+            return row[0] if row else None
+        record = self._ledger._by_hash.get(tx_hash)
+        return record['block_number'] if record else None
+
+
+def create_anchored_ledger(ledger, start: bool = True) -> AnchoredLedger:
+    """``AnchoredLedger`` configurado por entorno (``NFC_WEB3_URL``, ``NFC_ANCHOR_*``)"""
+    web3 = Web3(Web3.HTTPProvider(os.environ.get("NFC_WEB3_URL", "http://127.0.0.1:8545")))
+    return AnchoredLedger(ledger, web3,
+                          private_key=os.environ.get("NFC_ANCHOR_KEY"),
+                          contract_address=os.environ.get("NFC_ANCHOR_CONTRACT"),
+                          batch_size=int(os.environ.get("NFC_ANCHOR_BATCH", "256")),
+                          interval=float(os.environ.get("NFC_ANCHOR_INTERVAL", "5")),
+                          confirmations=int(os.environ.get("NFC_ANCHOR_CONFIRMATIONS", "1")),
+                          start=start)
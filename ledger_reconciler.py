@@ -0,0 +1,299 @@
+import argparse
+import heapq
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+
+# Cada tabla con blockchain_tx_hash y el ledger lógico al que apunta. Las
+# consultas devuelven (id, epoch, tx_hash, nfc_id, device_id, success, user_id)
+# en orden temporal; user_id None = no comparable (auth_logs guarda el id
+# numérico y el ledger el nombre de usuario).
+SOURCES = {
+    "auth_logs": {
+        "ledger": "auth",
+        "query": '''
+            SELECT id, CAST(strftime('%s', auth_timestamp) AS REAL), blockchain_tx_hash,
+                   nfc_id, device_id, auth_success, NULL
+            FROM auth_logs
+            WHERE id > ? AND COALESCE(auth_source, 'online') != 'edge-filter'
+            ORDER BY auth_timestamp, id
+        ''',
+        # Todos los bloques del ledger de autenticación deberían tener fila
+        "ledger_filter": "",
+    },
+    "session_activities": {
+        "ledger": "sessions",
+        "query": '''
+            SELECT id, CAST(strftime('%s', timestamp) AS REAL), blockchain_tx_hash,
+                   activity_type, 'activity_log', 1, 'session_' || session_id
+            FROM session_activities
+            WHERE id > ?
+            ORDER BY timestamp, id
+        ''',
+        # Los cierres de sesión se anotan en el ledger sin fila en session_activities
+        "ledger_filter": "AND device_id = 'activity_log'",
+    },
+}
+
+KINDS = ("orphaned", "missing", "mismatched")
+
+
+def _stream(cursor, batch_size: int):
+    """Filas de un cursor por lotes de ``fetchmany`` (sin materializar el resultado)"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+class LedgerReconciler:
+    """Conciliación en streaming entre las tablas de registro y el ledger SQLite.
+
+    Recorre la tabla (``auth_logs`` o ``session_activities``) y los bloques
+    del ledger en orden temporal y los cruza por merge-join: los bloques
+    entran en una ventana de ``window`` segundos indexada por ``tx_hash`` y
+    cada fila busca el suyo en ella. Así la memoria depende del ritmo de
+    escritura, no del tamaño de las tablas (más los bloques que salen de la
+    ventana sin pareja, que solo se dan por perdidos al final por si su
+    fila llega desviada). Cada bloque se cuenta una vez. Clasifica:
+
+    - ``orphaned``: fila cuyo hash no existe en el ledger (o sin hash).
+    - ``missing``: bloque del ledger sin fila que lo referencie.
+    - ``mismatched``: ambos existen pero los campos o la hora no coinciden.
+
+    El punto de control (último id de fila, último bloque y bloques recientes
+    aún sin pareja) se guarda en ``ledger_reconciliation_checkpoints`` de la
+    base de datos principal, de modo que cada ejecución solo procesa lo nuevo.
+    """
+
+    def __init__(self, db_path: str = "nfc_auth_system.db", ledger_path: str = "nfc_ledger.db",
+                 window: float = 120.0, batch_size: int = 5000, sample_size: int = 20,
+                 clock=time.time):
+        self.db_path = db_path
+        self.ledger_path = ledger_path
+        self.window = window
+        self.batch_size = batch_size
+        self.sample_size = sample_size
+        self.clock = clock
+
+    def _load_checkpoint(self, conn, source: str):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ledger_reconciliation_checkpoints (
+                source TEXT PRIMARY KEY,
+                last_row_id INTEGER NOT NULL,
+                last_block INTEGER NOT NULL,
+                pending TEXT,
+                last_run TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        row = conn.execute('''
+            SELECT last_row_id, last_block, pending FROM ledger_reconciliation_checkpoints WHERE source = ?
+        ''', (source,)).fetchone()
+        if row is None:
+            return 0, 0, []
+        return row[0], row[1], [tuple(block) for block in json.loads(row[2] or "[]")]
+
+    def _save_checkpoint(self, conn, source: str, last_row_id: int, last_block: int, pending, summary):
+        conn.execute('''
+            INSERT OR REPLACE INTO ledger_reconciliation_checkpoints
+            (source, last_row_id, last_block, pending, last_run, updated_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (source, last_row_id, last_block, json.dumps(pending), json.dumps(summary)))
+        conn.commit()
+
+    def _differences(self, row_ts, fields, block) -> list:
+        nfc_id, device_id, success, user_id = fields
+        _, _, block_user, block_ts, block_device, block_nfc, block_success = block
+        differences = []
+        if nfc_id != block_nfc:
+            differences.append("nfc_id")
+        if device_id != block_device:
+            differences.append("device_id")
+        if bool(success) != bool(block_success):
+            differences.append("success")
+        if user_id is not None and user_id != block_user:
+            differences.append("user_id")
+        if abs(row_ts - block_ts) > self.window:
+            differences.append("timestamp")
+        return differences
+
+    def reconcile(self, source: str, full: bool = False, report=None, save_checkpoint: bool = True) -> dict:
+        """Conciliar ``source`` desde su punto de control (o desde el principio con ``full``).
+
+        ``report`` (fichero abierto) recibe cada discrepancia como una línea
+        JSON; el resumen solo conserva ``sample_size`` ejemplos por tipo.
+        """
+        spec = SOURCES[source]
+        ledger = spec["ledger"]
+        started = time.perf_counter()
+        counts = {"rows": 0, "blocks": 0, "matched": 0, "late_matched": 0, "pending": 0}
+        counts.update(dict.fromkeys(KINDS, 0))
+        samples = {kind: [] for kind in KINDS}
+
+        def emit(kind, **detail):
+            counts[kind] += 1
+            entry = dict(detail, kind=kind, source=source)
+            if len(samples[kind]) < self.sample_size:
+                samples[kind].append(entry)
+            if report is not None:
+                report.write(json.dumps(entry) + "\n")
+
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        ledger_conn = sqlite3.connect(f"file:{self.ledger_path}?mode=ro", uri=True, timeout=30)
+        try:
+            checkpoint = self._load_checkpoint(conn, source)
+            last_row_id, last_block, carried = (0, 0, []) if full else checkpoint
+            first_row_id, first_block = last_row_id, last_block
+
+            rows = conn.execute(spec["query"], (last_row_id,))
+            blocks = ledger_conn.execute(f'''
+                SELECT block_number, tx_hash, user_id, timestamp, device_id, nfc_id, success
+                FROM ledger_blocks
+                WHERE ledger = ? AND block_number > ? {spec["ledger_filter"]}
+                ORDER BY timestamp
+            ''', (ledger, last_block))
+            # Los bloques que quedaron pendientes en la ejecución anterior vuelven a la ventana
+            block_stream = heapq.merge(sorted(carried, key=lambda b: b[3]),
+                                       _stream(blocks, self.batch_size), key=lambda b: b[3])
+            window = OrderedDict()  # tx_hash -> bloque, en orden temporal
+            matched_outside = set()  # hashes emparejados por búsqueda puntual
+            # Bloques que salieron de la ventana sin fila: faltan salvo que su fila llegue tarde
+            unmatched = OrderedDict()
+
+            def take():
+                """Siguiente bloque del flujo; cada bloque nuevo se cuenta una sola vez aquí"""
+                nonlocal last_block
+                block = next(block_stream, None)
+                if block is not None and block[0] > first_block:
+                    counts["blocks"] += 1
+                    last_block = max(last_block, block[0])
+                return block
+
+            def release(block):
+                if block[1] in matched_outside:
+                    matched_outside.discard(block[1])
+                else:
+                    unmatched[block[1]] = block
+
+            next_block = take()
+            for row_id, row_ts, tx_hash, *fields in _stream(rows, self.batch_size):
+                counts["rows"] += 1
+                last_row_id = max(last_row_id, row_id)
+                row_ts = row_ts or 0.0
+                while next_block is not None and next_block[3] <= row_ts + self.window:
+                    window[next_block[1]] = next_block
+                    next_block = take()
+                while window:
+                    oldest = next(iter(window.values()))
+                    if oldest[3] >= row_ts - self.window:
+                        break
+                    del window[oldest[1]]
+                    release(oldest)
+
+                if not tx_hash:
+                    emit("orphaned", row_id=row_id, tx_hash=None, timestamp=row_ts, reason="sin hash")
+                    continue
+                block = window.pop(tx_hash, None)
+                if block is None and tx_hash in unmatched:
+                    block = unmatched.pop(tx_hash)
+                    counts["late_matched"] += 1
+                elif block is None:
+                    # Fuera de la ventana: bloque de una ejecución anterior o con la hora desviada
+                    found = ledger_conn.execute('''
+                        SELECT block_number, tx_hash, user_id, timestamp, device_id, nfc_id, success
+                        FROM ledger_blocks WHERE tx_hash = ? AND ledger = ? LIMIT 1
+                    ''', (tx_hash, ledger)).fetchone()
+                    if found is None:
+                        emit("orphaned", row_id=row_id, tx_hash=tx_hash, timestamp=row_ts,
+                             reason="hash inexistente en el ledger")
+                        continue
+                    block = found
+                    if block[0] > first_block:
+                        matched_outside.add(tx_hash)
+                    counts["late_matched"] += 1
+                differences = self._differences(row_ts, fields, block)
+                if differences:
+                    emit("mismatched", row_id=row_id, tx_hash=tx_hash, block_number=block[0],
+                         fields=differences)
+                else:
+                    counts["matched"] += 1
+
+            # Bloques sin fila: los recientes pueden tener la escritura en curso
+            cutoff = self.clock() - self.window
+            pending = []
+            def remaining(block):
+                yield from list(window.values())
+                while block is not None:
+                    yield block
+                    block = take()
+
+            for block in remaining(next_block):
+                if block[3] >= cutoff and block[1] not in matched_outside:
+                    pending.append(list(block))
+                else:
+                    release(block)
+            for block in unmatched.values():
+                emit("missing", block_number=block[0], tx_hash=block[1], timestamp=block[3],
+                     device_id=block[4], nfc_id=block[5])
+            counts["pending"] = len(pending)
+
+            elapsed = time.perf_counter() - started
+            summary = dict(counts, source=source, ledger=ledger, full=full,
+                           row_range=[first_row_id, last_row_id], block_range=[first_block, last_block],
+                           consistent=not any(counts[kind] for kind in KINDS),
+                           seconds=round(elapsed, 3),
+                           rows_per_s=round(counts["rows"] / elapsed, 1) if elapsed > 0 else None)
+            if save_checkpoint:
+                self._save_checkpoint(conn, source, last_row_id, last_block, pending, summary)
+            summary["samples"] = samples
+            return summary
+        finally:
+            ledger_conn.close()
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Conciliación de auth_logs/session_activities con el ledger")
+    parser.add_argument("--db", default=os.environ.get("NFC_DB_PATH", "nfc_auth_system.db"))
+    parser.add_argument("--ledger-db", default=os.environ.get("NFC_LEDGER_PATH", "nfc_ledger.db"))
+    parser.add_argument("--source", nargs="+", choices=sorted(SOURCES), default=sorted(SOURCES))
+    parser.add_argument("--full", action="store_true", help="Ignorar el punto de control y recorrer todo")
+    parser.add_argument("--no-checkpoint", action="store_true", help="No actualizar el punto de control")
+    parser.add_argument("--window", type=float, default=120.0,
+                        help="Desfase máximo (s) entre la fila y su bloque")
+    parser.add_argument("--report", help="Escribir cada discrepancia como JSON por línea")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.ledger_db):
+        raise SystemExit(f"❌ No existe el ledger {args.ledger_db}: la conciliación requiere "
+                         "NFC_LEDGER_BACKEND=sqlite (el ledger en memoria no sobrevive al proceso)")
+
+    reconciler = LedgerReconciler(args.db, args.ledger_db, window=args.window)
+    report = open(args.report, "w", encoding="utf-8") if args.report else None
+    inconsistent = False
+    try:
+        for source in args.source:
+            result = reconciler.reconcile(source, full=args.full, report=report,
+                                          save_checkpoint=not args.no_checkpoint)
+            inconsistent |= not result["consistent"]
+            icon = "✅" if result["consistent"] else "⚠️"
+            print(f"{icon} {source} ↔ ledger '{result['ledger']}': {result['rows']:,} filas, "
+                  f"{result['blocks']:,} bloques en {result['seconds']} s "
+                  f"(filas {result['row_range'][0]}→{result['row_range'][1]}, "
+                  f"bloques {result['block_range'][0]}→{result['block_range'][1]})")
+            print(f"   🔗 emparejadas={result['matched']:,} fuera_de_ventana={result['late_matched']:,} "
+                  f"huérfanas={result['orphaned']:,} sin_fila={result['missing']:,} "
+                  f"discrepantes={result['mismatched']:,} pendientes={result['pending']:,}")
+            for kind in KINDS:
+                for sample in result["samples"][kind][:3]:
+                    print(f"   🔍 {kind}: {sample}")
+    finally:
+        if report is not None:
+            report.close()
+            print(f"📄 Discrepancias guardadas en {args.report}")
+    sys.exit(1 if inconsistent else 0)
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+GENESIS_HASH = "0" * 64
+
+
+def compute_tx_hash(user_id, timestamp, device_id, nfc_id, success) -> str:
+    """Mismo formato de hash de transacción que BlockchainSimulated"""
+    tx_data = f"{user_id}{timestamp}{device_id}{nfc_id}{success}"
+    return f"0x{hashlib.sha256(tx_data.encode()).hexdigest()[:20]}"
+
+
+def compute_block_hash(prev_hash: str, block_number: int, tx_hash: str, user_id, timestamp,
+                       device_id, nfc_id, success) -> str:
+    """Hash encadenado de un bloque (depende del hash del bloque anterior)"""
+    data = f"{prev_hash}|{block_number}|{tx_hash}|{user_id}|{timestamp!r}|{device_id}|{nfc_id}|{int(bool(success))}"
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class SQLiteLedger:
+    """Ledger simulado persistido en SQLite y compartido entre procesos.
+
+    Misma interfaz que ``BlockchainSimulated`` (``record_auth_attempt``,
+    ``verify_transaction``). Cada anexión abre una transacción ``BEGIN
+    IMMEDIATE``: el bloqueo de escritura de SQLite hace de escritor único,
+    de modo que varios workers de uvicorn numeran y encadenan los bloques
+    sin bifurcar el ledger. Varios ledgers lógicos (``auth``, ``sessions``)
+    comparten el fichero.
+    """
+
+    def __init__(self, db_path: str = "nfc_ledger.db", ledger: str = "auth"):
+        self.db_path = db_path
+        self.ledger = ledger
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS ledger_blocks (
+                ledger TEXT NOT NULL,
+                block_number INTEGER NOT NULL,
+                tx_hash TEXT NOT NULL,
+                user_id TEXT,
+                timestamp REAL,
+                device_id TEXT,
+                nfc_id TEXT,
+                success BOOLEAN,
+                prev_hash TEXT NOT NULL,
+                block_hash TEXT NOT NULL,
+                PRIMARY KEY (ledger, block_number)
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_ledger_blocks_tx ON ledger_blocks(tx_hash)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_ledger_blocks_time ON ledger_blocks(ledger, timestamp)')
+        print(f"🔗 Ledger SQLite compartido iniciado ({ledger} @ {db_path})")
+
+    def record_auth_attempt(self, user_id: str, timestamp: float,
+                            device_id: str, nfc_id: str, success: bool):
+        """Anexar un bloque; devuelve el hash de la transacción"""
+        tx_hash = compute_tx_hash(user_id, timestamp, device_id, nfc_id, success)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                last = self._conn.execute('''
+                    SELECT block_number, block_hash FROM ledger_blocks
+                    WHERE ledger = ? ORDER BY block_number DESC LIMIT 1
+                ''', (self.ledger,)).fetchone()
+                block_number, prev_hash = (last[0] + 1, last[1]) if last else (1, GENESIS_HASH)
+                block_hash = compute_block_hash(prev_hash, block_number, tx_hash, user_id,
+                                                timestamp, device_id, nfc_id, success)
+                self._conn.execute('''
+                    INSERT INTO ledger_blocks
+                    (ledger, block_number, tx_hash, user_id, timestamp, device_id, nfc_id,
+                     success, prev_hash, block_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (self.ledger, block_number, tx_hash, str(user_id), timestamp, device_id,
+                      nfc_id, bool(success), prev_hash, block_hash))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return tx_hash
+
+    def record_auth_attempts(self, attempts: list) -> list:
+        """Anexar varios bloques en una sola transacción.
+
+        ``attempts`` son tuplas ``(user_id, timestamp, device_id, nfc_id,
+        success)``; devuelve los hashes en el mismo orden.
+        """
+        tx_hashes = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                last = self._conn.execute('''
+                    SELECT block_number, block_hash FROM ledger_blocks
+                    WHERE ledger = ? ORDER BY block_number DESC LIMIT 1
+                ''', (self.ledger,)).fetchone()
+                block_number, prev_hash = last if last else (0, GENESIS_HASH)
+                rows = []
+                for user_id, timestamp, device_id, nfc_id, success in attempts:
+                    block_number += 1
+                    tx_hash = compute_tx_hash(user_id, timestamp, device_id, nfc_id, success)
+                    block_hash = compute_block_hash(prev_hash, block_number, tx_hash, user_id,
+                                                    timestamp, device_id, nfc_id, success)
+                    rows.append((self.ledger, block_number, tx_hash, str(user_id), timestamp, device_id,
+                                 nfc_id, bool(success), prev_hash, block_hash))
+                    tx_hashes.append(tx_hash)
+                    prev_hash = block_hash
+                self._conn.executemany('''
+                    INSERT INTO ledger_blocks
+                    (ledger, block_number, tx_hash, user_id, timestamp, device_id, nfc_id,
+                     success, prev_hash, block_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return tx_hashes
+
+    def verify_transaction(self, tx_hash: str):
+        """Verificar transacción"""
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM ledger_blocks WHERE tx_hash = ? AND ledger = ? LIMIT 1',
+                                     (tx_hash, self.ledger)).fetchone()
+        return row is not None
+
+    def iter_records(self, after_block: int = 0, batch_size: int = 1000):
+        """Bloques en orden, por lotes (sin cargar el ledger entero)"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            while True:
+                rows = conn.execute('''
+                    SELECT block_number, tx_hash, user_id, timestamp, device_id, nfc_id, success,
+                           prev_hash, block_hash
+                    FROM ledger_blocks WHERE ledger = ? AND block_number > ?
+                    ORDER BY block_number LIMIT ?
+                ''', (self.ledger, after_block, batch_size)).fetchall()
+                for row in rows:
+                    yield {'block_number': row[0], 'tx_hash': row[1], 'user_id': row[2],
+                           'timestamp': row[3], 'device_id': row[4], 'nfc_id': row[5],
+                           'success': bool(row[6]), 'prev_hash': row[7], 'block_hash': row[8]}
+                if len(rows) < batch_size:
+                    return
+                after_block = rows[-1][0]
+        finally:
+            conn.close()
+
+    @property
+    def records(self):
+        """Compatibilidad con BlockchainSimulated: carga todos los bloques"""
+        return list(self.iter_records())
+
+    def __len__(self):
+        with self._lock:
+            row = self._conn.execute('SELECT COALESCE(MAX(block_number), 0) FROM ledger_blocks WHERE ledger = ?',
+                                     (self.ledger,)).fetchone()
+        return row[0]
+
+
+def create_ledger(name: str = "auth", start: bool = True):
+    """Ledger según ``NFC_LEDGER_BACKEND``: ``memory`` (un proceso), ``sqlite`` (varios
+    workers) o ``web3`` (SQLite + anclaje por lotes en una cadena EVM, ver ledger_anchor).
+    Con ``start=False`` el anclaje no arranca hasta ``ledger.start()``."""
+    backend = os.environ.get("NFC_LEDGER_BACKEND", "memory")
+    if backend in ("sqlite", "web3"):
+        ledger = SQLiteLedger(os.environ.get("NFC_LEDGER_PATH", "nfc_ledger.db"), name)
+        if backend == "web3":
+            from ledger_anchor import create_anchored_ledger
+            return create_anchored_ledger(ledger, start)
+        return ledger
+    from blockchain_simulated import BlockchainSimulated
+    return BlockchainSimulated()
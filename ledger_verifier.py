@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from ledger_store import GENESIS_HASH, compute_block_hash, compute_tx_hash
+
+
+def _verify_block_range(args):
+    """Verificar los bloques ``start..end`` leyendo directamente de SQLite (proceso hijo)"""
+    db_path, ledger, start, end = args
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    expected = start
+    first_prev = last_hash = None
+    error = None
+    try:
+        cursor = conn.execute('''
+            SELECT block_number, tx_hash, user_id, timestamp, device_id, nfc_id, success,
+                   prev_hash, block_hash
+            FROM ledger_blocks
+            WHERE ledger = ? AND block_number BETWEEN ? AND ?
+            ORDER BY block_number
+        ''', (ledger, start, end))
+        while error is None:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            for number, tx_hash, user_id, timestamp, device_id, nfc_id, success, prev_hash, block_hash in rows:
+                success = bool(success)
+                if number != expected:
+                    error = (expected, "Falta el bloque")
+                elif last_hash is not None and prev_hash != last_hash:
+                    error = (number, "Enlace prev_hash roto")
+                elif compute_tx_hash(user_id, timestamp, device_id, nfc_id, success) != tx_hash:
+                    error = (number, "El hash de la transacción no coincide con sus campos")
+                elif compute_block_hash(prev_hash, number, tx_hash, user_id, timestamp,
+                                        device_id, nfc_id, success) != block_hash:
+                    error = (number, "El hash del bloque no coincide")
+                if error:
+                    break
+                if first_prev is None:
+                    first_prev = prev_hash
+                last_hash = block_hash
+                expected += 1
+        if error is None and expected != end + 1:
+            error = (expected, "Falta el bloque")
+    finally:
+        conn.close()
+    return {"start": start, "end": end, "verified": expected - start,
+            "first_prev": first_prev, "last_hash": last_hash, "error": error}
+
+
+def verify_sqlite_ledger(db_path: str, ledger: str = "auth", workers: int = None,
+                         chunk_size: int = 100000, progress=None) -> dict:
+    """Recalcular y encadenar todos los bloques de un ``SQLiteLedger`` en paralelo.
+
+    El ledger se reparte en rangos de ``chunk_size`` bloques; cada proceso
+    lee su rango, recalcula hashes de transacción y de bloque y comprueba
+    los enlaces internos. Después se cosen las fronteras entre rangos. En
+    cuanto se conoce el primer bloque divergente (todos los rangos previos
+    terminados) se cancela el resto. ``progress(verificados, total)`` se
+    llama al terminar cada rango.
+    """
+    started = time.perf_counter()
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    try:
+        total = conn.execute('SELECT COALESCE(MAX(block_number), 0) FROM ledger_blocks WHERE ledger = ?',
+                             (ledger,)).fetchone()[0]
+    finally:
+        conn.close()
+
+    workers = workers or os.cpu_count() or 1
+    ranges = [(db_path, ledger, start, min(start + chunk_size - 1, total))
+              for start in range(1, total + 1, chunk_size)]
+    results = {}
+    verified = 0
+    first_error = None
+
+    # spawn: los hijos importan el módulo __main__ del proceso; desde el servidor
+    # usar verify_sqlite_ledger_subprocess para no reimportar main en cada uno
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = {executor.submit(_verify_block_range, r): r[2] for r in ranges}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                start = pending.pop(future)
+                result = results[start] = future.result()
+                verified += result["verified"]
+                if progress:
+                    progress(verified, total)
+            first_error = _first_divergence(ranges, results)
+            if first_error and all(r[2] in results for r in ranges if r[2] <= first_error[0]):
+                for future in pending:
+                    future.cancel()
+                break
+
+    elapsed = time.perf_counter() - started
+    return {"ledger": ledger, "backend": "sqlite", "blocks": total, "verified": verified,
+            "valid": first_error is None and len(results) == len(ranges),
+            "first_divergent_block": first_error[0] if first_error else None,
+            "reason": first_error[1] if first_error else None,
+            "workers": workers, "seconds": round(elapsed, 3),
+            "blocks_per_s": round(verified / elapsed, 1) if elapsed > 0 else None}
+
+
+def _first_divergence(ranges, results):
+    """Primer fallo conocido: dentro de un rango o en la frontera con el anterior"""
+    previous = None
+    for _, _, start, _ in ranges:
+        result = results.get(start)
+        if result is not None:
+            expected_prev = GENESIS_HASH if start == 1 else (previous["last_hash"] if previous else None)
+            if expected_prev is not None and result["first_prev"] is not None \
+                    and result["first_prev"] != expected_prev:
+                return start, "Enlace prev_hash roto entre rangos"
+            if result["error"]:
+                return result["error"]
+        previous = result
+    return None
+
+
+def verify_records(records: list, progress=None) -> dict:
+    """Verificar un ledger en memoria (``BlockchainSimulated.records``): hashes y numeración"""
+    started = time.perf_counter()
+    error = None
+    for index, record in enumerate(records):
+        if record['block_number'] != index + 1:
+            error = (index + 1, "Numeración de bloques no consecutiva")
+        elif compute_tx_hash(record['user_id'], record['timestamp'], record['device_id'],
+                             record['nfc_id'], record['success']) != record['tx_hash']:
+            error = (record['block_number'], "El hash de la transacción no coincide con sus campos")
+        if error:
+            break
+        if progress and index % 100000 == 0:
+            progress(index, len(records))
+    elapsed = time.perf_counter() - started
+    verified = error[0] - 1 if error else len(records)
+    return {"ledger": "memory", "backend": "memory", "blocks": len(records), "verified": verified,
+            "valid": error is None, "first_divergent_block": error[0] if error else None,
+            "reason": error[1] if error else None, "workers": 1, "seconds": round(elapsed, 3),
+            "blocks_per_s": round(verified / elapsed, 1) if elapsed > 0 else None}
+
+
+def verify_sqlite_ledger_subprocess(db_path: str, ledger: str = "auth", workers: int = None,
+                                    progress=None) -> dict:
+    """``verify_sqlite_ledger`` en un proceso aparte (este módulo como CLI con ``--json``).
+
+    El pool ``spawn`` reimporta el ``__main__`` del proceso en cada hijo;
+    lanzado desde el servidor eso sería main.py entero (BD, ledgers,
+    hilos) por proceso. Como CLI el ``__main__`` de los hijos es este
+    módulo, que no importa nada del servidor.
+    """
+    command = [sys.executable, os.path.abspath(__file__), "--db", os.path.abspath(db_path),
+               "--ledger", ledger, "--json"]
+    if workers:
+        command += ["--workers", str(workers)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    result = None
+    for line in process.stdout:
+        message = json.loads(line)
+        if "result" in message:
+            result = message["result"]
+        elif progress:
+            progress(message["verified"], message["total"])
+    stderr = process.stderr.read()
+    process.wait()
+    if result is None:
+        last_line = stderr.strip().splitlines()[-1] if stderr.strip() else ""
+        raise RuntimeError(f"El verificador terminó sin resultado (código {process.returncode}): {last_line}")
+    return result
+
+
+def verify_ledger(ledger, workers: int = None, progress=None) -> dict:
+    """Verificar un ledger de ``create_ledger`` (SQLite en paralelo en un proceso aparte, memoria en proceso)"""
+    if hasattr(ledger, "db_path"):
+        return verify_sqlite_ledger_subprocess(ledger.db_path, ledger.ledger, workers, progress)
+    return verify_records(list(ledger.records), progress)
+
+
+def generate_ledger(db_path: str, count: int, ledger: str = "auth", batch_size: int = 50000):
+    """Rellenar un ledger SQLite con bloques sintéticos encadenados (para medir)"""
+    from ledger_store import SQLiteLedger
+
+    store = SQLiteLedger(db_path, ledger)
+    next_number = len(store) + 1
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute('SELECT block_hash FROM ledger_blocks WHERE ledger = ? AND block_number = ?',
+                           (ledger, next_number - 1)).fetchone()
+        prev_hash = row[0] if row else GENESIS_HASH
+        batch = []
+        for number in range(next_number, next_number + count):
+            user_id, timestamp, device_id, nfc_id, success = \
+                f"user{number % 5000}", 1700000000.0 + number, f"ACR122U-{number % 64:02d}", f"5E{number:08X}", number % 7 != 0
+            tx_hash = compute_tx_hash(user_id, timestamp, device_id, nfc_id, success)
+            block_hash = compute_block_hash(prev_hash, number, tx_hash, user_id, timestamp,
+                                            device_id, nfc_id, success)
+            batch.append((ledger, number, tx_hash, user_id, timestamp, device_id, nfc_id, success,
+                          prev_hash, block_hash))
+            prev_hash = block_hash
+            if len(batch) >= batch_size:
+                conn.executemany('INSERT INTO ledger_blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+                conn.commit()
+                batch = []
+        if batch:
+            conn.executemany('INSERT INTO ledger_blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def _print_progress(verified: int, total: int):
+    pct = verified / total * 100 if total else 100.0
+    print(f"   🔍 {verified:,}/{total:,} bloques verificados ({pct:.1f} %)", end="\r", flush=True)
+
+
+def _json_progress(verified: int, total: int):
+    print(json.dumps({"verified": verified, "total": total}), flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verificación completa de integridad del ledger")
+    parser.add_argument("--db", default=os.environ.get("NFC_LEDGER_PATH", "nfc_ledger.db"))
+    parser.add_argument("--ledger", default="auth", help="Ledger lógico (auth, sessions)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--generate", type=int, default=0, help="Añadir N bloques sintéticos antes de verificar")
+    parser.add_argument("--json", action="store_true", help="Progreso y resultado como líneas JSON (para el servidor)")
+    args = parser.parse_args()
+
+    if args.json:
+        report = verify_sqlite_ledger(args.db, args.ledger, args.workers, args.chunk_size, _json_progress)
+        print(json.dumps({"result": report}), flush=True)
+        sys.exit(0 if report["valid"] else 1)
+
+    if args.generate:
+        print(f"📝 Generando {args.generate:,} bloques sintéticos...")
+        generate_ledger(args.db, args.generate, args.ledger)
+
+    report = verify_sqlite_ledger(args.db, args.ledger, args.workers, args.chunk_size, _print_progress)
+    print()
+    if report["valid"]:
+        print(f"✅ Ledger '{args.ledger}' íntegro: {report['blocks']:,} bloques en {report['seconds']} s "
+              f"({report['blocks_per_s']:,.0f} bloques/s, {report['workers']} procesos)")
+    else:
+        print(f"❌ Primer bloque divergente: #{report['first_divergent_block']} - {report['reason']}")
+        sys.exit(1)
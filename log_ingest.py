@@ -0,0 +1,284 @@
+import argparse
+import glob
+import os
+import re
+import sqlite3
+import time
+
+# Cabeceras de cada fichero (formato logging por defecto y _stealth_log del cliente)
+ANTI_LEAK_LINE = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:,(\d{3}))? - ([A-Z]+) - (.*)$")
+AUDIT_LINE = re.compile(r"^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\] \[([A-Z]+)\] (.*)$")
+
+# (patrón del mensaje, tipo de evento); grupos con nombre: nfc, session, duration, category
+ANTI_LEAK_MESSAGES = [
+    (re.compile(r"^(?:Inicio escaneo|Escaneo iniciado) - Sesión: (?P<session>\w+)"), "scan_started"),
+    (re.compile(r"^Sesión iniciada - Tarjeta: (?P<nfc>\S+)"), "session_started"),
+    (re.compile(r"^Autenticación exitosa - Tarjeta: (?P<nfc>\S+)"), "auth_success"),
+    (re.compile(r"^Autenticación fallida.*?(?:Tarjeta: (?P<nfc>\S+))?$"), "auth_failure"),
+    (re.compile(r"^Tarjeta retirada después de validación - Duración: (?P<duration>[\d.]+)s"),
+     "card_removed_after_auth"),
+    (re.compile(r"^Tarjeta retirada - Duración: (?P<duration>[\d.]+)s - Tarjeta: (?P<nfc>\S+)"), "card_removed"),
+    (re.compile(r"^Sesión finalizada - Duración: (?P<duration>[\d.]+)s - Tarjeta: (?P<nfc>\S+)"), "session_ended"),
+    (re.compile(r"^Tarjeta perdida durante sesión: (?P<nfc>\S+)"), "card_lost"),
+    (re.compile(r"^Timeout escaneo sin tarjeta"), "scan_timeout"),
+    (re.compile(r"^Sistema bloqueado hasta: (?P<category>.+)"), "system_locked"),
+]
+AUDIT_MESSAGES = [
+    (re.compile(r"^Sesión cerrada: (?P<session>\w+)"), "session_closed"),
+    (re.compile(r"^(?P<category>[A-Z][A-Z_]{2,}): "), "security_alert"),
+]
+
+SOURCES = {
+    "anti_leak": {"path": "nfc_anti_leak.log", "line": ANTI_LEAK_LINE, "messages": ANTI_LEAK_MESSAGES},
+    "security_audit": {"path": "security_audit.log", "line": AUDIT_LINE, "messages": AUDIT_MESSAGES},
+}
+
+MAX_LINE = 64 * 1024
+MOJIBAKE_MARKERS = ("Ã", "Â")
+
+
+def decode_line(raw: bytes):
+    """Texto de una línea en UTF-8 o en la codificación heredada; ``(texto, reparada)``.
+
+    Las líneas que no son UTF-8 válido se leen como cp1252 (latin-1 si
+    contienen bytes sin asignar). Las que son UTF-8 pero llevan mojibake
+    de una doble codificación (``SesiÃ³n``) se recodifican.
+    """
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        try:
+            return raw.decode("cp1252"), True
+        except UnicodeDecodeError:
+            return raw.decode("latin-1"), True
+    if any(marker in text for marker in MOJIBAKE_MARKERS):
+        try:
+            return text.encode("cp1252").decode("utf-8"), True
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            pass
+    return text, False
+
+
+def parse_line(text: str, spec: dict):
+    """Tupla ``(event_time, level, event_type, nfc_id, session_ref, duration_s, category, message)``"""
+    header = spec["line"].match(text)
+    if header is None:
+        return None
+    if spec["line"] is ANTI_LEAK_LINE:
+        stamp, millis, level, message = header.groups()
+        event_time = f"{stamp}.{millis}" if millis else stamp
+    else:
+        event_time, level, message = header.groups()
+    for pattern, event_type in spec["messages"]:
+        match = pattern.match(message)
+        if match:
+            fields = match.groupdict()
+            duration = fields.get("duration")
+            return (event_time, level, event_type, fields.get("nfc"), fields.get("session"),
+                    float(duration) if duration else None, fields.get("category"), message)
+    return event_time, level, "message", None, None, None, None, message
+
+
+def _read_lines(f, max_line: int = MAX_LINE):
+    """Líneas completas con su longitud en bytes; las excesivas se truncan sin cargarlas enteras"""
+    while True:
+        raw = f.readline(max_line)
+        if not raw:
+            return
+        consumed = len(raw)
+        if not raw.endswith(b"\n"):
+            if len(raw) < max_line:
+                return  # línea a medio escribir: se relee en la próxima pasada
+            rest = f.readline(max_line)
+            while rest and not rest.endswith(b"\n"):
+                consumed += len(rest)
+                rest = f.readline(max_line)
+            if not rest:
+                return
+            consumed += len(rest)
+        yield raw.rstrip(b"\r\n"), consumed
+
+
+class LogIngester:
+    """Carga incremental de los logs de texto en la base de datos de autenticación.
+
+    Cada fichero se lee en streaming desde el último desplazamiento
+    guardado (``log_ingest_state``) y los eventos se insertan por lotes en
+    ``log_events``; el desplazamiento se guarda en la misma transacción que
+    el lote, así que una interrupción no duplica ni pierde líneas. El
+    inodo identifica el fichero: si cambió (rotación), se termina primero
+    el fichero rotado (``ruta.*`` con el inodo antiguo) y después se
+    empieza el nuevo desde cero; si el fichero encogió (copytruncate) se
+    relee desde el principio. Las horas se guardan tal como las escribió
+    el equipo de origen (hora local).
+    """
+
+    def __init__(self, db_path: str = "nfc_auth_system.db", batch_size: int = 5000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self._conn = sqlite3.connect(db_path, timeout=30)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS log_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT NOT NULL,
+                file_inode INTEGER NOT NULL,
+                file_offset INTEGER NOT NULL,
+                event_time TIMESTAMP,
+                level TEXT,
+                event_type TEXT NOT NULL,
+                nfc_id TEXT,
+                session_ref TEXT,
+                duration_s REAL,
+                category TEXT,
+                message TEXT NOT NULL,
+                UNIQUE (source, file_inode, file_offset)
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_log_events_time ON log_events (source, event_time)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_log_events_nfc ON log_events (nfc_id) WHERE nfc_id IS NOT NULL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS log_ingest_state (
+                source TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                device INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def _state(self, source: str):
+        return self._conn.execute('SELECT path, device, inode, offset FROM log_ingest_state WHERE source = ?',
+                                  (source,)).fetchone()
+
+    def ingest(self, source: str, path: str = None) -> dict:
+        """Procesar lo nuevo de ``source`` (incluida la cola de un fichero rotado)"""
+        spec = SOURCES[source]
+        path = path or spec["path"]
+        stats = {"source": source, "lines": 0, "events": 0, "unparsed": 0, "repaired": 0,
+                 "bytes": 0, "rotated": False}
+        started = time.perf_counter()
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            return dict(stats, missing=True, seconds=0.0)
+
+        state = self._state(source)
+        offset = 0
+        if state is not None:
+            _, device, inode, saved_offset = state
+            if (device, inode) == (current.st_dev, current.st_ino):
+                offset = saved_offset if current.st_size >= saved_offset else 0
+            else:
+                stats["rotated"] = True
+                rotated = self._find_rotated(path, device, inode)
+                if rotated:
+                    self._ingest_file(source, spec, rotated, device, inode, saved_offset, stats)
+                else:
+                    print(f"⚠️ {source}: no se encontró el fichero rotado (inodo {inode}); "
+                          f"las líneas posteriores a {saved_offset} se pierden")
+        self._ingest_file(source, spec, path, current.st_dev, current.st_ino, offset, stats)
+
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        stats["lines_per_s"] = round(stats["lines"] / stats["seconds"], 1) if stats["seconds"] else None
+        return stats
+
+    @staticmethod
+    def _find_rotated(path: str, device: int, inode: int):
+        for candidate in glob.glob(glob.escape(path) + ".*"):
+            try:
+                info = os.stat(candidate)
+            except OSError:
+                continue
+            if (info.st_dev, info.st_ino) == (device, inode):
+                return candidate
+        return None
+
+    def _ingest_file(self, source, spec, path, device, inode, offset, stats):
+        batch = []
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for raw, consumed in _read_lines(f):
+                line_offset = offset
+                offset += consumed
+                stats["lines"] += 1
+                stats["bytes"] += consumed
+                if not raw.strip():
+                    continue
+                text, repaired = decode_line(raw)
+                stats["repaired"] += repaired
+                event = parse_line(text, spec)
+                if event is None:
+                    stats["unparsed"] += 1
+                    event = (None, None, "unparsed", None, None, None, None, text)
+                batch.append((source, inode, line_offset) + event)
+                if len(batch) >= self.batch_size:
+                    stats["events"] += self._flush(source, path, device, inode, offset, batch)
+                    batch = []
+        stats["events"] += self._flush(source, path, device, inode, offset, batch)
+
+    def _flush(self, source, path, device, inode, offset, batch) -> int:
+        """Insertar el lote y avanzar el desplazamiento en la misma transacción"""
+        try:
+            cursor = self._conn.executemany('''
+                INSERT OR IGNORE INTO log_events
+                (source, file_inode, file_offset, event_time, level, event_type, nfc_id, session_ref,
+                 duration_s, category, message)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+            self._conn.execute('''
+                INSERT OR REPLACE INTO log_ingest_state (source, path, device, inode, offset, updated_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (source, path, device, inode, offset))
+            self._conn.commit()
+            return cursor.rowcount if batch else 0
+        except sqlite3.Error as e:
+            self._conn.rollback()
+            print(f"❌ Error cargando eventos de {source}: {e}")
+            raise
+
+    def follow(self, sources: dict, poll_interval: float = 1.0):
+        """Seguir los ficheros (``tail -F``) hasta Ctrl+C"""
+        while True:
+            for source, path in sources.items():
+                stats = self.ingest(source, path)
+                if stats["events"]:
+                    print(f"📝 {source}: {stats['events']} eventos nuevos"
+                          f"{' (tras rotación)' if stats['rotated'] else ''}")
+            time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingesta incremental de nfc_anti_leak.log y security_audit.log")
+    parser.add_argument("--db", default=os.environ.get("NFC_DB_PATH", "nfc_auth_system.db"))
+    parser.add_argument("--anti-leak-log", default=SOURCES["anti_leak"]["path"])
+    parser.add_argument("--audit-log", default=SOURCES["security_audit"]["path"])
+    parser.add_argument("--source", nargs="+", choices=sorted(SOURCES), default=sorted(SOURCES))
+    parser.add_argument("--follow", action="store_true", help="Seguir los ficheros tras la carga inicial")
+    parser.add_argument("--poll", type=float, default=1.0)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    paths = {"anti_leak": args.anti_leak_log, "security_audit": args.audit_log}
+    ingester = LogIngester(args.db, args.batch_size)
+    try:
+        for source in args.source:
+            stats = ingester.ingest(source, paths[source])
+            if stats.get("missing"):
+                print(f"⚠️ {source}: no existe {paths[source]}")
+                continue
+            print(f"✅ {source}: {stats['events']:,} eventos de {stats['lines']:,} líneas "
+                  f"({stats['bytes'] / 1e6:.1f} MB) en {stats['seconds']} s; "
+                  f"reparadas={stats['repaired']:,} sin_formato={stats['unparsed']:,}"
+                  f"{' · rotación detectada' if stats['rotated'] else ''}")
+        if args.follow:
+            print("⏱️  Siguiendo los ficheros (Ctrl+C para salir)")
+            ingester.follow({source: paths[source] for source in args.source}, args.poll)
+    except KeyboardInterrupt:
+        print("\nIngesta detenida")
+    finally:
+        ingester.close()
@@ -1,13 +1,38 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from datetime import datetime
+import argparse
+import asyncio
+import base64
+import hmac
+import json
+import math
+import os
+import threading
+import time
 import uvicorn
-from typing import Optional
+from typing import Dict, List, Optional, Union
 from fastapi.middleware.cors import CORSMiddleware
 
 from database import DatabaseManager
-from blockchain_simulated import BlockchainSimulated
+from ledger_store import create_ledger
+from ledger_verifier import verify_ledger
 from session_manager import SessionManager
+from pin_hasher import PinVerifier
+from rate_limiter import LOCKED_REASON, AuthThrottle, SQLiteFailureLockout
+import metrics
+from query_profiler import QueryProfiler
+from response_cache import VersionedResponseCache
+from edge_auth import sign_snapshot
+from card_filter import ActiveCardFilter
+from idempotency import IdempotencyConflict, IdempotencyInProgress, IdempotencyStore, SQLiteIdempotencyBackend
+from session_ingest import IngestQueueFull, SessionIngest
+from event_hub import EventHub, SQLiteEventRelay, parse_filter
+from rollups import REPORTS
+from correlation import FailureCorrelator, load_device_locations
+from device_registry import ONLINE, OFFLINE, DEGRADED as DEVICE_DEGRADED, STALE, DeviceRegistry, RegistryFull
+from deep_health import DEGRADED, HEALTHY, UNHEALTHY, DeepHealth, threshold_status
 
 # ------------------- App y CORS -------------------
 app = FastAPI(title="Sistema de Autenticación NFC + Blockchain")
@@ -21,6 +46,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Histograma de latencia por ruta (plantilla de la ruta, no la URL concreta)"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or getattr(request.scope.get("endpoint"), "__name__", "unmatched")
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - start, request.method, path, str(status))
+
 # ------------------- Modelos -------------------
 class AuthRequest(BaseModel):
     pin: str
@@ -46,16 +85,262 @@ class ActivityRequest(BaseModel):
 class LogoutRequest(BaseModel):
     session_token: str
 
+class UserLookupRequest(BaseModel):
+    nfc_ids: List[str]
+
+class EdgeDecision(BaseModel):
+    event_id: str
+    nfc_id: str
+    device_id: str
+    success: bool
+    timestamp: float
+    failure_reason: Optional[str] = None
+    snapshot_seq: Optional[int] = None
+
+class EdgeReconcileRequest(BaseModel):
+    device_id: str
+    decisions: List[EdgeDecision]
+
+class FilterRejectionReport(BaseModel):
+    report_id: str
+    device_id: str
+    filter_version: Optional[int] = None
+    window_start: float
+    window_end: float
+    counts: Dict[str, int]
+    dropped: int = 0
+
+class DeviceHeartbeat(BaseModel):
+    device_id: str
+    reader_status: str = "ok"
+    queue_depth: int = 0
+    details: Optional[Dict] = None
+
 class AdminRegisterRequest(BaseModel):
     username: str
     password: str
     nfc_id: str
     full_name: str
 
+def encode_idempotent_outcome(outcome) -> str:
+    """Serializar el desenlace para el almacén de idempotencia compartido"""
+    if isinstance(outcome, HTTPException):
+        return json.dumps({"error": {"status_code": outcome.status_code, "detail": outcome.detail,
+                                     "headers": outcome.headers}})
+    if isinstance(outcome, BaseModel):
+        outcome = outcome.dict()
+    return json.dumps({"result": outcome}, ensure_ascii=False)
+
+def decode_idempotent_outcome(payload: str):
+    data = json.loads(payload)
+    if "error" in data:
+        raise HTTPException(**data["error"])
+    return data["result"]
+
 # ------------------- Inicialización -------------------
-database = DatabaseManager()  # Base de datos local
-blockchain = BlockchainSimulated()
-session_manager = SessionManager()
+# Con NFC_WORKERS > 1 (python main.py --workers N) el ledger, la idempotencia, las
+# sesiones y el reparto de eventos en vivo pasan por SQLite; cada worker solo guarda
+# cachés validadas por generación.
+WORKERS = max(1, int(os.environ.get("NFC_WORKERS", "1")))
+if WORKERS > 1:
+    os.environ.setdefault("NFC_LEDGER_BACKEND", "sqlite")
+database = DatabaseManager(os.environ.get("NFC_DB_PATH", "nfc_auth_system.db"))  # Base de datos local
+if os.environ.get("NFC_DB_METRICS") == "1":  # Opcional: instrumentar cada conexión tiene coste
+    database.add_query_observer(metrics.observe_query)
+if WORKERS > 1:
+    database.enable_wal()
+# Los hilos de fondo (anclaje, ingesta, heartbeats, líneas base) arrancan en el evento
+# startup: con --workers el supervisor y la copia __mp_main__ importan este módulo sin servir
+blockchain = create_ledger("auth", start=False)
+session_manager = SessionManager(database, create_ledger("sessions", start=False))
+# Monitores en vivo (WebSocket/SSE) sin consultar la BD; con varios workers los eventos se reparten entre ellos
+event_hub = EventHub(relay=SQLiteEventRelay(database.db_name) if WORKERS > 1 else None)
+
+def publish_session_event(kind: str, session: dict, fields: dict):
+    if kind == "logout":
+        event_type = "session_end"
+    elif fields["activity_type"].startswith("ALERTA_SEGURIDAD"):
+        event_type = "security_alert"
+        fields = dict(fields, severity=fields["activity_type"].rsplit("_", 1)[-1])
+    else:
+        event_type = "session_activity"
+    event_hub.publish(event_type, device_id=session['device_id'], department=session['department'],
+                      session_id=session['id'], **fields)
+
+# Actividades y cierres de sesión: validación en memoria y escritura por lotes
+session_ingest = SessionIngest(database, session_manager.blockchain, listener=publish_session_event, start=False)
+MAX_ACTIVITY_TYPE = 64
+MAX_ACTIVITY_DESCRIPTION = 2000
+query_profiler = QueryProfiler(database)  # Opcional: NFC_QUERY_PROFILER=1 o /admin/query-profile
+if os.environ.get("NFC_QUERY_PROFILER") == "1":
+    query_profiler.enable()
+pin_verifier = PinVerifier(database.pin_hasher)  # Verificación de PIN fuera del event loop
+# Límites por tarjeta/dispositivo y bloqueo por PIN (común a todos los workers)
+auth_throttle = AuthThrottle(workers=WORKERS,
+                             lockout=SQLiteFailureLockout(database.db_name) if WORKERS > 1 else None)
+# Reintentos con Idempotency-Key devuelven el resultado original (compartido entre workers)
+idempotency_store = IdempotencyStore(
+    backend=SQLiteIdempotencyBackend(database.db_name) if WORKERS > 1 else None,
+    encode=encode_idempotent_outcome, decode=decode_idempotent_outcome)
+MAX_IDEMPOTENCY_KEY = 128
+# Puntuación de anomalías por línea base de comportamiento (requiere numpy; NFC_BEHAVIOR_SCORING=0 la desactiva)
+behavior = None
+ANOMALY_THRESHOLD = float(os.environ.get("NFC_ANOMALY_THRESHOLD", "0.7"))
+BEHAVIOR_REFRESH = float(os.environ.get("NFC_BEHAVIOR_REFRESH", "300"))
+if os.environ.get("NFC_BEHAVIOR_SCORING", "1") == "1":
+    try:
+        from behavior_baseline import BehaviorBaselines
+    except ImportError:
+        print("⚠️ numpy no está instalado: puntuación de anomalías desactivada")
+    else:
+        behavior = BehaviorBaselines(database.db_name)
+# Correlación de fallos entre lectores: fuerza bruta, spray y tarjetas clonadas (posiciones en NFC_DEVICE_LOCATIONS)
+failure_correlator = FailureCorrelator(
+    window=float(os.environ.get("NFC_CORRELATION_WINDOW", "300")),
+    locations=load_device_locations(os.environ["NFC_DEVICE_LOCATIONS"])
+    if os.environ.get("NFC_DEVICE_LOCATIONS") else None)
+
+def publish_device_status(device: dict, previous: str, status: str):
+    event_hub.publish("device_status", device_id=device['device_id'], previous=previous, status=status,
+                      reader_status=device.get('reader_status'), queue_depth=device.get('queue_depth'))
+
+# Registro de lectores: heartbeats en memoria, volcados periódicamente a la tabla devices
+device_registry = DeviceRegistry(database.db_name,
+                                 heartbeat_interval=float(os.environ.get("NFC_HEARTBEAT_INTERVAL", "30")),
+                                 listener=publish_device_status)
+
+@app.on_event("startup")
+def start_background_services():
+    for ledger in (blockchain, session_manager.blockchain):
+        if hasattr(ledger, "start"):
+            ledger.start()
+    session_ingest.start()
+    device_registry.start()
+    event_hub.start()
+    if behavior is not None:
+        behavior.start(BEHAVIOR_REFRESH)
+
+MAX_HEARTBEAT_DEVICE_ID = 128
+MAX_HEARTBEAT_DETAILS = 4096
+
+async def lockout_call(method, *args):
+    """El bloqueo compartido (SQLite) se consulta en un hilo, fuera del event loop"""
+    if auth_throttle.shared_lockout:
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+    return method(*args)
+
+async def admit_auth_request(nfc_id: str, device_id: str):
+    """Rechazo barato (429) antes de cualquier trabajo en BD o blockchain"""
+    locked = auth_throttle.shared_lockout and await lockout_call(auth_throttle.lockout.locked_for, nfc_id)
+    rejection = (LOCKED_REASON, locked) if locked else auth_throttle.check(nfc_id, device_id)
+    if rejection:
+        reason, retry_after = rejection
+        raise HTTPException(status_code=429, detail=reason,
+                            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+    if not auth_throttle.admission.try_acquire():
+        raise HTTPException(status_code=429, detail="Servidor saturado, reintente en unos segundos",
+                            headers={"Retry-After": "1"})
+
+# Gauges evaluados solo al exportar /metrics
+metrics.REGISTRY.gauge("nfc_ledger_records", "Registros en la blockchain simulada",
+                       lambda: {("auth",): len(blockchain),
+                                ("sessions",): len(session_manager.blockchain)},
+                       labels=("ledger",))
+metrics.REGISTRY.gauge("nfc_queue_depth", "Trabajo pendiente en colas internas",
+                       lambda: {("pin_verify",): pin_verifier.pending,
+                                ("auth_in_flight",): auth_throttle.admission.in_flight,
+                                ("session_ingest",): len(session_ingest)},
+                       labels=("queue",))
+metrics.REGISTRY.gauge("nfc_event_subscribers", "Suscriptores conectados al flujo de eventos",
+                       lambda: len(event_hub))
+metrics.REGISTRY.gauge("nfc_admission_rejected_total", "Peticiones rechazadas por el límite de concurrencia",
+                       lambda: auth_throttle.admission.rejected)
+metrics.REGISTRY.gauge("nfc_throttle_tracked_keys", "Claves vivas en los limitadores",
+                       lambda: {("nfc_id",): len(auth_throttle.by_card),
+                                ("device_id",): len(auth_throttle.by_device)},
+                       labels=("limiter",))
+metrics.REGISTRY.gauge("nfc_devices", "Lectores registrados por estado de heartbeat",
+                       lambda: {(status,): count for status, count in device_registry.summary().items()
+                                if status not in ("total", "queue_depth")},
+                       labels=("status",))
+metrics.REGISTRY.gauge("nfc_correlation_tracked_keys", "Claves vivas en el correlador de fallos",
+                       lambda: {(index,): count for index, count in failure_correlator.tracked_keys().items()},
+                       labels=("index",))
+
+def record_attempt(username: str, user_id: int, auth_request: Union[AuthRequest, SessionStartRequest],
+                   success: bool, failure_reason: str = None, department: str = None) -> str:
+    """Registrar el intento (autenticación o inicio de sesión) en blockchain y en auth_logs,
+    puntuarlo y correlacionarlo, cronometrando cada etapa"""
+    with metrics.AUTH_STAGE_LATENCY.time("ledger_append"):
+        tx_hash = blockchain.record_auth_attempt(
+            username, datetime.now().timestamp(),
+            auth_request.device_id, auth_request.nfc_id, success
+        )
+    anomaly_score = None
+    if behavior is not None and user_id:
+        with metrics.AUTH_STAGE_LATENCY.time("anomaly_score"):
+            anomaly_score = behavior.score(user_id, auth_request.device_id)
+    with metrics.AUTH_STAGE_LATENCY.time("log_auth_attempt"):
+        database.log_auth_attempt(user_id, auth_request.nfc_id, auth_request.device_id,
+                                  success, tx_hash, failure_reason, anomaly_score)
+    metrics.AUTH_RESULTS.inc("success" if success else failure_reason or "failure")
+    event_hub.publish("auth", device_id=auth_request.device_id, department=department,
+                      nfc_id=auth_request.nfc_id, username=username, success=success,
+                      failure_reason=failure_reason, blockchain_tx=tx_hash, source="online")
+    if anomaly_score is not None and anomaly_score >= ANOMALY_THRESHOLD:
+        # Fichaje fuera de la línea base del usuario (hora, día o lector inusuales)
+        raise_security_alert("ANOMALIA_COMPORTAMIENTO", "ALTA" if anomaly_score >= 0.85 else "MEDIA",
+                             behavior.explain(user_id, auth_request.device_id),
+                             auth_request.nfc_id, auth_request.device_id, department,
+                             username=username, user_id=user_id, score=anomaly_score)
+    for alert in failure_correlator.observe(auth_request.nfc_id, auth_request.device_id, success, department):
+        raise_security_alert(username=username, user_id=user_id, **alert)
+    return tx_hash
+
+def raise_security_alert(alert_type: str, severity: str, details: dict, nfc_id: str, device_id: str,
+                         department: str = None, username: str = None, user_id: int = None,
+                         score: float = None):
+    """Guardar la alerta en security_alerts y publicarla a los monitores en vivo"""
+    database.log_security_alert(alert_type, severity, json.dumps(details), nfc_id=nfc_id,
+                                user_id=user_id or None, device_id=device_id, score=score)
+    metrics.SECURITY_ALERTS.inc(alert_type, severity)
+    event_hub.publish("security_alert", device_id=device_id, department=department, nfc_id=nfc_id,
+                      username=username, alert_type=alert_type, severity=severity,
+                      score=round(score, 3) if score is not None else None, details=details)
+
+async def check_pin(nfc_user: dict, pin: str) -> bool:
+    """Verificar PIN en el pool y rehashear si el coste almacenado está desactualizado"""
+    stored = nfc_user.get('pin')
+    try:
+        valid, new_hash = await pin_verifier.verify_and_upgrade(pin, stored)
+    except RuntimeError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    if new_hash:
+        database.update_user_pin_hash(nfc_user.get('nfc_id'), stored, new_hash)
+    return valid
+
+def idempotent_outcome_cacheable(outcome) -> bool:
+    """Se repiten los desenlaces definitivos; un 429, un 5xx o un error interno se reintentan"""
+    if isinstance(outcome, HTTPException):
+        return outcome.status_code < 500 and outcome.status_code != 429
+    if isinstance(outcome, BaseException):
+        return False
+    return not (isinstance(outcome, AuthResponse) and outcome.message.startswith("Error interno"))
+
+async def run_idempotent(route: str, idempotency_key: Optional[str], request, func):
+    """Ejecutar ``func`` una sola vez por (ruta, Idempotency-Key); sin cabecera, siempre"""
+    if not idempotency_key:
+        return await func()
+    if len(idempotency_key) > MAX_IDEMPOTENCY_KEY:
+        raise HTTPException(status_code=400, detail="Idempotency-Key demasiado larga")
+    fingerprint = idempotency_store.fingerprint(request.nfc_id, request.device_id, request.pin)
+    try:
+        return await idempotency_store.run((route, idempotency_key), fingerprint, func,
+                                           idempotent_outcome_cacheable)
+    except IdempotencyInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
 # ------------------- ENDPOINTS -------------------
 
@@ -79,35 +364,142 @@ async def register_admin_card(admin_data: AdminRegisterRequest):
         return {"success": False, "message": f"Error: {str(e)}"}
 
 
+# ------------------- PERFILADOR DE CONSULTAS -------------------
+@app.get("/admin/query-profile")
+async def get_query_profile(limit: int = 20):
+    return query_profiler.report(limit)
+
+@app.post("/admin/query-profile")
+async def configure_query_profile(enabled: bool = True, threshold_ms: Optional[float] = None,
+                                  reset: bool = False):
+    if reset:
+        query_profiler.reset()
+    if enabled:
+        query_profiler.enable(threshold_ms)
+    else:
+        query_profiler.disable()
+    return {"success": True, "enabled": query_profiler.enabled,
+            "slow_threshold_ms": query_profiler.slow_threshold_ms}
+
+
+# ------------------- INTEGRIDAD DEL LEDGER -------------------
+ledger_verification = {"running": False, "ledger": None, "verified": 0, "total": 0, "result": None}
+
+def run_ledger_verification(name: str, ledger, workers: Optional[int]):
+    """Verificación completa en segundo plano (el ledger SQLite, en un proceso verificador aparte)"""
+    def progress(verified, total):
+        ledger_verification.update(verified=verified, total=total)
+    try:
+        result = verify_ledger(ledger, workers, progress)
+    except Exception as e:
+        result = {"valid": False, "first_divergent_block": None, "reason": f"Error verificando: {e}"}
+    ledger_verification.update(running=False, result=dict(result, ledger=name), finished_at=time.time())
+
+@app.post("/admin/ledger/verify")
+async def start_ledger_verification(ledger: str = "auth", workers: Optional[int] = None):
+    ledgers = {"auth": blockchain, "sessions": session_manager.blockchain}
+    if ledger not in ledgers:
+        raise HTTPException(status_code=400, detail=f"Ledger desconocido: {ledger}")
+    if ledger_verification["running"]:
+        return {"success": False, "message": "Ya hay una verificación en curso", **ledger_verification}
+    ledger_verification.update(running=True, ledger=ledger, verified=0, total=len(ledgers[ledger]),
+                               result=None, started_at=time.time(), finished_at=None)
+    threading.Thread(target=run_ledger_verification, args=(ledger, ledgers[ledger], workers),
+                     daemon=True).start()
+    return {"success": True, "message": "Verificación iniciada; consulte el progreso con GET",
+            **ledger_verification}
+
+@app.get("/admin/ledger/verify")
+async def ledger_verification_status():
+    return ledger_verification
+
+@app.get("/admin/ledger/anchor")
+async def ledger_anchor_status(ledger: str = "auth", tx_hash: Optional[str] = None):
+    """Estado del anclaje en la cadena EVM (NFC_LEDGER_BACKEND=web3) y prueba de inclusión"""
+    ledgers = {"auth": blockchain, "sessions": session_manager.blockchain}
+    if ledger not in ledgers:
+        raise HTTPException(status_code=400, detail=f"Ledger desconocido: {ledger}")
+    target = ledgers[ledger]
+    if not hasattr(target, "anchor_status"):
+        raise HTTPException(status_code=404, detail="El ledger no se ancla en cadena (NFC_LEDGER_BACKEND)")
+    if tx_hash is None:
+        return target.anchor_status()
+    proof = target.anchor_proof(tx_hash)
+    if proof is None:
+        raise HTTPException(status_code=404, detail="Transacción desconocida o aún sin lote de anclaje")
+    return proof
+
+MAX_SEARCH_RESULTS = 500
+
+@app.get("/admin/activities/search")
+async def search_activities(q: str, since: Optional[str] = None, until: Optional[str] = None,
+                            nfc_id: Optional[str] = None, department: Optional[str] = None,
+                            device_id: Optional[str] = None, order: str = "rank",
+                            limit: int = 50, offset: int = 0):
+    """Búsqueda de texto completo en las actividades de sesión (FTS5, sin distinguir acentos)"""
+    if order not in ("rank", "recent"):
+        raise HTTPException(status_code=400, detail="order debe ser 'rank' o 'recent'")
+    try:
+        results = database.search_session_activities(
+            q, since=since, until=until, nfc_id=nfc_id, department=department, device_id=device_id,
+            order=order, limit=max(1, min(limit, MAX_SEARCH_RESULTS)), offset=max(0, offset))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Fecha inválida en since/until")
+    return {"query": q, "order": order, "count": len(results), "results": results}
+
+@app.get("/admin/reports/{report}")
+async def rollup_report(report: str, since: Optional[str] = None, until: Optional[str] = None,
+                        key: Optional[str] = None, granularity: str = "day"):
+    """Informes desde los agregados: auth_by_device, auth_by_department, sessions_by_department"""
+    if report not in REPORTS:
+        raise HTTPException(status_code=404, detail=f"Informe desconocido: {report}")
+    try:
+        rows = database.get_rollup_report(report, since=since, until=until, key=key, granularity=granularity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"report": report, "granularity": granularity, "rows": rows}
+
+@app.get("/admin/alerts")
+async def security_alerts(limit: int = 100, alert_type: Optional[str] = None, since: Optional[str] = None):
+    """Últimas alertas de seguridad (anomalías de comportamiento, etc.)"""
+    try:
+        alerts = database.get_security_alerts(limit=max(1, min(limit, MAX_SEARCH_RESULTS)),
+                                              alert_type=alert_type, since=since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Fecha inválida en since")
+    return {"count": len(alerts), "alerts": alerts}
+
+
 # ------------------- AUTENTICACIÓN -------------------
 @app.post("/authenticate", response_model=AuthResponse)
-async def authenticate_user(auth_request: AuthRequest):
+async def authenticate_user(auth_request: AuthRequest, idempotency_key: Optional[str] = Header(None)):
+    return await run_idempotent("authenticate", idempotency_key, auth_request,
+                                lambda: process_authentication(auth_request))
+
+async def process_authentication(auth_request: AuthRequest):
+    await admit_auth_request(auth_request.nfc_id, auth_request.device_id)
     try:
-        nfc_user = database.get_user_by_nfc(auth_request.nfc_id)
+        with metrics.AUTH_STAGE_LATENCY.time("user_lookup"):
+            nfc_user = database.get_user_by_nfc(auth_request.nfc_id)
 
         if not nfc_user:
-            tx_hash = blockchain.record_auth_attempt(
-                "unknown", datetime.now().timestamp(),
-                auth_request.device_id, auth_request.nfc_id, False
-            )
-            database.log_auth_attempt(0, auth_request.nfc_id, auth_request.device_id, False, tx_hash, "Tarjeta no registrada")
+            tx_hash = record_attempt("unknown", 0, auth_request, False, "Tarjeta no registrada")
             return AuthResponse(success=False, message="Tarjeta NFC no registrada en el sistema", blockchain_tx=tx_hash, user=None)
 
         # Validar PIN con la base de datos
-        if nfc_user.get('pin') != auth_request.pin:
-            tx_hash = blockchain.record_auth_attempt(
-                nfc_user.get('username', 'unknown'), datetime.now().timestamp(),
-                auth_request.device_id, auth_request.nfc_id, False
-            )
-            database.log_auth_attempt(nfc_user.get('id', 0), auth_request.nfc_id, auth_request.device_id, False, tx_hash, "PIN incorrecto")
+        with metrics.AUTH_STAGE_LATENCY.time("pin_check"):
+            pin_ok = await check_pin(nfc_user, auth_request.pin)
+
+        if not pin_ok:
+            await lockout_call(auth_throttle.lockout.record_failure, auth_request.nfc_id)
+            tx_hash = record_attempt(nfc_user.get('username', 'unknown'), nfc_user.get('id', 0),
+                                     auth_request, False, "PIN incorrecto", nfc_user.get('department'))
             return AuthResponse(success=False, message="PIN incorrecto", blockchain_tx=tx_hash, user=None)
 
         # Autenticación exitosa
-        tx_hash = blockchain.record_auth_attempt(
-            nfc_user.get('username'), datetime.now().timestamp(),
-            auth_request.device_id, auth_request.nfc_id, True
-        )
-        database.log_auth_attempt(nfc_user.get('id', 0), auth_request.nfc_id, auth_request.device_id, True, tx_hash)
+        await lockout_call(auth_throttle.lockout.record_success, auth_request.nfc_id)
+        tx_hash = record_attempt(nfc_user.get('username'), nfc_user.get('id', 0), auth_request, True,
+                                 department=nfc_user.get('department'))
 
         return AuthResponse(
             success=True,
@@ -121,23 +513,45 @@ async def authenticate_user(auth_request: AuthRequest):
             blockchain_tx=tx_hash
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         print("⚠️ Error interno en /authenticate:", str(e))
         return AuthResponse(success=False, message=f"Error interno: {str(e)}", blockchain_tx=None, user=None)
+    finally:
+        auth_throttle.admission.release()
 
 
 # ------------------- SESIONES -------------------
 @app.post("/session/start")
-async def start_session(session_request: SessionStartRequest):
-    nfc_user = database.get_user_by_nfc(session_request.nfc_id)
-    if not nfc_user:
-        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+async def start_session(session_request: SessionStartRequest, idempotency_key: Optional[str] = Header(None)):
+    return await run_idempotent("session_start", idempotency_key, session_request,
+                                lambda: process_session_start(session_request))
 
-    if nfc_user.get('pin') != session_request.pin:
-        raise HTTPException(status_code=401, detail="PIN incorrecto")
+async def process_session_start(session_request: SessionStartRequest):
+    await admit_auth_request(session_request.nfc_id, session_request.device_id)
+    try:
+        nfc_user = database.get_user_by_nfc(session_request.nfc_id)
+        if not nfc_user:
+            record_attempt("unknown", 0, session_request, False, "Tarjeta no registrada")
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
+
+        if not await check_pin(nfc_user, session_request.pin):
+            await lockout_call(auth_throttle.lockout.record_failure, session_request.nfc_id)
+            record_attempt(nfc_user.get('username', 'unknown'), nfc_user.get('id', 0), session_request,
+                           False, "PIN incorrecto", nfc_user.get('department'))
+            raise HTTPException(status_code=401, detail="PIN incorrecto")
+        await lockout_call(auth_throttle.lockout.record_success, session_request.nfc_id)
+        record_attempt(nfc_user.get('username'), nfc_user.get('id', 0), session_request, True,
+                       department=nfc_user.get('department'))
+    finally:
+        auth_throttle.admission.release()
 
     session_token = session_manager.create_session(nfc_user.get('id', 0), session_request.device_id)
     session_manager.log_activity(session_token, "LOGIN", f"Inicio de sesión - {nfc_user.get('full_name', 'Desconocido')}")
+    event_hub.publish("session_start", device_id=session_request.device_id,
+                      department=nfc_user.get('department'), username=nfc_user.get('username'),
+                      session=session_token[:8])
 
     return {"success": True, "session_token": session_token, "user": {
         "username": nfc_user.get('username', 'No disponible'),
@@ -146,35 +560,431 @@ async def start_session(session_request: SessionStartRequest):
         "security_level": nfc_user.get('security_level', 0)
     }, "message": "Sesión iniciada correctamente"}
 
+@app.post("/session/activity", status_code=202)
+async def log_session_activity(activity: ActivityRequest):
+    """Encolar la actividad; el ledger y session_activities se escriben en lote"""
+    if len(activity.activity_type) > MAX_ACTIVITY_TYPE or len(activity.description) > MAX_ACTIVITY_DESCRIPTION:
+        raise HTTPException(status_code=400, detail="Actividad demasiado larga")
+    try:
+        tx_hash = session_ingest.submit_activity(activity.session_token, activity.activity_type,
+                                                 activity.description)
+    except IngestQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    if tx_hash is None:
+        raise HTTPException(status_code=401, detail="Sesión no encontrada o inactiva")
+    return {"success": True, "queued": True, "blockchain_tx": tx_hash}
+
+@app.post("/session/logout", status_code=202)
+async def logout_session(logout: LogoutRequest):
+    try:
+        closed = session_ingest.submit_logout(logout.session_token)
+    except IngestQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    if not closed:
+        raise HTTPException(status_code=401, detail="Sesión no encontrada o inactiva")
+    return {"success": True, "queued": True, "message": "Sesión cerrada"}
+
+@app.on_event("shutdown")
+def drain_session_ingest():
+    session_ingest.stop()
+    device_registry.stop()
+    event_hub.stop()
+    if behavior is not None:
+        behavior.stop()
+    for ledger in (blockchain, session_manager.blockchain):
+        if hasattr(ledger, "stop"):
+            ledger.stop()
+
 
 # ------------------- LISTAR USUARIOS -------------------
+MAX_USERS_PAGE = 1000
+users_cache = VersionedResponseCache("users")  # Cuerpos serializados por generación de nfc_users
+
+def encode_users_cursor(key) -> Optional[str]:
+    if key is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode()).decode().rstrip("=")
+
+def decode_users_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
+    try:
+        full_name, nfc_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return full_name, nfc_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
 @app.get("/users")
-async def list_users():
+async def list_users(request: Request, limit: int = 100, after: Optional[str] = None,
+                     fields: Optional[str] = None):
+    """Usuarios activos paginados por clave, con ETag y respuesta 304 si no hubo cambios"""
+    limit = max(1, min(limit, MAX_USERS_PAGE))
+    field_list = tuple(f.strip() for f in fields.split(",") if f.strip()) if fields else database.USER_PAGE_FIELDS
+    unknown = [f for f in field_list if f not in database.USER_PAGE_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Campos no disponibles: {', '.join(unknown)}")
+    after_key = decode_users_cursor(after)
+
     try:
-        users = database.get_all_users()
-        return {"success": True, "users": users, "count": len(users)}
+        key = (after, limit, field_list)
+        generation = database.get_table_version('nfc_users')
+        etag = users_cache.make_etag(generation, key)
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+        cached = users_cache.get(generation, key)
+        if cached is None:
+            users, next_key = database.get_users_page(after_key, limit, field_list)
+            body = json.dumps({"success": True, "users": users, "count": len(users),
+                               "next_cursor": encode_users_cursor(next_key), "generation": generation},
+                              ensure_ascii=False).encode()
+            cached = users_cache.put(generation, key, body)
+
+        etag, body = cached
+        return Response(content=body, media_type="application/json",
+                        headers={"ETag": etag, "Cache-Control": "no-cache"})
     except Exception as e:
         return {"success": False, "message": f"Error obteniendo usuarios: {str(e)}"}
 
 
+# ------------------- Métricas -------------------
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.REGISTRY.render(),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+MAX_LOOKUP_IDS = 10000
+
+@app.post("/users/lookup")
+async def lookup_users(lookup: UserLookupRequest):
+    """Resolver muchas tarjetas en una sola consulta; las no registradas vuelven como null"""
+    if len(lookup.nfc_ids) > MAX_LOOKUP_IDS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_LOOKUP_IDS} tarjetas por consulta")
+    users = database.get_users_by_nfc_ids(lookup.nfc_ids)
+    found = {nfc_id: ({k: v for k, v in user.items() if k != 'pin'} if user else None)
+             for nfc_id, user in users.items()}
+    registered = sum(1 for user in found.values() if user)
+    return {"success": True, "users": found, "found": registered, "missing": len(found) - registered}
+
+
+@app.get("/users/changes")
+async def user_changes(since: int = 0, limit: int = 1000):
+    """Deltas del directorio desde la secuencia ``since`` (0 = foto completa)"""
+    limit = max(1, min(limit, 10000))
+    return database.get_user_changes(since, limit)
+
+
+MAX_FILTER_REPORT_CARDS = 5000
+card_filter = ActiveCardFilter(database)  # Bloom de tarjetas activas para descartar en el lector
+filter_body_cache = {"version": None, "body": None}
+
+@app.get("/users/filter")
+async def users_filter(since_version: Optional[int] = None):
+    """Filtro de Bloom de las tarjetas activas; 304 si el lector ya tiene esta versión"""
+    bloom = card_filter.refresh()
+    if since_version is not None and since_version == card_filter.version:
+        return Response(status_code=304)
+    if filter_body_cache["version"] != card_filter.version or filter_body_cache["body"] is None:
+        filter_body_cache["body"] = json.dumps(dict(bloom.to_dict(), version=card_filter.version)).encode()
+        filter_body_cache["version"] = card_filter.version
+    return Response(content=filter_body_cache["body"], media_type="application/json",
+                    headers={"Cache-Control": "no-cache"})
+
+@app.post("/users/filter/rejections")
+async def users_filter_rejections(request: Request, report: FilterRejectionReport):
+    """Auditoría agregada de tarjetas descartadas por el filtro en el lector.
+
+    Una fila de auth_logs por tarjeta y ventana (sin blockchain): el detalle
+    por lectura no aporta y es justo el coste que el filtro evita. Solo los
+    lectores (secreto edge) pueden escribir en la auditoría. Cada tarjeta
+    cuenta para el spray del lector en el correlador; no hubo PIN, así que
+    no cuenta como fallo de la tarjeta.
+    """
+    require_edge_token(request)
+    if len(report.counts) > MAX_FILTER_REPORT_CARDS:
+        raise HTTPException(status_code=400, detail=f"Máximo {MAX_FILTER_REPORT_CARDS} tarjetas por informe")
+    timestamp = datetime.utcfromtimestamp(report.window_end).strftime('%Y-%m-%d %H:%M:%S')
+    rows = [(0, nfc_id, report.device_id, False, timestamp, None,
+             f"Tarjeta no registrada (filtro local, {count} lecturas)", f"{report.report_id}:{nfc_id}")
+            for nfc_id, count in report.counts.items()]
+    if report.dropped:
+        rows.append((0, "*", report.device_id, False, timestamp, None,
+                     f"Tarjetas no registradas sin detalle (filtro local, {report.dropped} lecturas)",
+                     f"{report.report_id}:*"))
+    if rows:
+        database.log_edge_auth_attempts(rows, source='edge-filter')
+    for nfc_id in report.counts:
+        for alert in failure_correlator.observe_rejection(nfc_id, report.device_id, report.window_end):
+            raise_security_alert(username="unknown", **alert)
+    total = sum(report.counts.values()) + report.dropped
+    metrics.AUTH_RESULTS.inc("filter_rejected", amount=total)
+    return {"success": True, "logged": len(rows), "rejections": total}
+
+
+# ------------------- EDGE (autenticación offline) -------------------
+EDGE_SECRET = os.environ.get("NFC_EDGE_SECRET", "")
+edge_snapshot_cache = {"seq": None, "users": None}
+
+def require_edge_token(request: Request):
+    """Endpoints de lectores y monitores: exigen el secreto compartido (``request`` o WebSocket)"""
+    if not EDGE_SECRET:
+        raise HTTPException(status_code=503, detail="Modo edge no configurado (NFC_EDGE_SECRET)")
+    if not hmac.compare_digest(request.headers.get("x-edge-token", ""), EDGE_SECRET):
+        raise HTTPException(status_code=401, detail="Token edge inválido")
+
+@app.get("/edge/snapshot")
+async def edge_snapshot(request: Request, since_seq: int = 0):
+    """Directorio firmado (incluye hashes de PIN) para decisiones offline en el lector"""
+    require_edge_token(request)
+    latest_seq = database.get_latest_user_change_seq()
+    if since_seq and since_seq == latest_seq:
+        return Response(status_code=304)
+    if edge_snapshot_cache["seq"] != latest_seq:
+        fields = ("nfc_id", "username", "full_name", "department", "security_level", "pin_hash")
+        # Sin hash (PIN heredado sin migrar) el usuario solo se autentica online
+        edge_snapshot_cache["users"] = [{k: user[k] for k in fields} for user in database.iter_users()
+                                        if user["pin_hash"]]
+        edge_snapshot_cache["seq"] = latest_seq
+    payload = {"issued_at": time.time(), "latest_seq": latest_seq, "users": edge_snapshot_cache["users"]}
+    return sign_snapshot(payload, EDGE_SECRET)
+
+@app.post("/edge/reconcile")
+async def edge_reconcile(request: Request, batch: EdgeReconcileRequest):
+    """Incorporar a auth_logs y a la blockchain las decisiones tomadas offline"""
+    require_edge_token(request)
+    foreign = sorted({d.device_id for d in batch.decisions if d.device_id != batch.device_id})
+    if foreign:
+        raise HTTPException(status_code=400,
+                            detail=f"Decisiones de otros dispositivos en el lote de {batch.device_id}: {foreign}")
+    event_ids = [d.event_id for d in batch.decisions]
+    duplicates = database.get_existing_edge_events(event_ids)
+    fresh = [d for d in batch.decisions if d.event_id not in duplicates]
+    users = database.get_users_by_nfc_ids({d.nfc_id for d in fresh})
+
+    rows = []
+    for decision in fresh:
+        user = users.get(decision.nfc_id) or {}
+        tx_hash = blockchain.record_auth_attempt(
+            user.get('username', 'unknown'), decision.timestamp,
+            decision.device_id, decision.nfc_id, decision.success
+        )
+        rows.append((user.get('id', 0), decision.nfc_id, decision.device_id, decision.success,
+                     datetime.utcfromtimestamp(decision.timestamp).strftime('%Y-%m-%d %H:%M:%S'),
+                     tx_hash, decision.failure_reason, decision.event_id))
+        event_hub.publish("auth", device_id=decision.device_id, department=user.get('department'),
+                          nfc_id=decision.nfc_id, username=user.get('username', 'unknown'),
+                          success=decision.success, failure_reason=decision.failure_reason,
+                          blockchain_tx=tx_hash, source="edge-offline")
+        for alert in failure_correlator.observe(decision.nfc_id, decision.device_id, decision.success,
+                                                user.get('department'), decision.timestamp):
+            raise_security_alert(username=user.get('username', 'unknown'), user_id=user.get('id'), **alert)
+    if rows:
+        database.log_edge_auth_attempts(rows)
+
+    return {"success": True, "accepted": [d.event_id for d in fresh], "duplicates": sorted(duplicates)}
+
+
+# ------------------- EVENTOS EN VIVO -------------------
+SSE_HEARTBEAT = 15.0
+
+def subscribe_events(devices: Optional[str], departments: Optional[str], types: Optional[str]):
+    subscription = event_hub.subscribe(parse_filter(devices), parse_filter(departments), parse_filter(types))
+    if subscription is None:
+        raise HTTPException(status_code=503, detail="Demasiados monitores conectados",
+                            headers={"Retry-After": "5"})
+    return subscription
+
+@app.websocket("/events/ws")
+async def events_websocket(websocket: WebSocket, devices: Optional[str] = None,
+                           departments: Optional[str] = None, types: Optional[str] = None):
+    """Eventos en vivo (auth, session_start, session_activity, security_alert, session_end).
+
+    Exige el secreto edge (``X-Edge-Token``). Sin eventos durante
+    ``SSE_HEARTBEAT`` segundos se envía ``{"type": "ping"}``, y un lector de
+    fondo detecta el cierre del cliente aunque no haya nada que enviarle.
+    """
+    try:
+        require_edge_token(websocket)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    subscription = event_hub.subscribe(parse_filter(devices), parse_filter(departments), parse_filter(types))
+    if subscription is None:
+        await websocket.close(code=1013)
+        return
+
+    async def client_closed():
+        # Lo que envíe el monitor se descarta; solo interesa el cierre
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    closed = asyncio.create_task(client_closed())
+    try:
+        while not closed.done():
+            next_event = asyncio.ensure_future(subscription.next())
+            done, _ = await asyncio.wait({next_event, closed}, timeout=SSE_HEARTBEAT,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if next_event not in done:
+                next_event.cancel()
+                if not done:
+                    await websocket.send_text(json.dumps({"type": "ping"}))
+                continue
+            message = next_event.result()
+            if message is None:
+                await websocket.send_text(json.dumps({"type": "dropped", "reason": subscription.closed_reason}))
+                await websocket.close(code=1013)
+                break
+            await websocket.send_text(message)
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # el envío falló: el cliente ya no está
+    finally:
+        closed.cancel()
+        event_hub.unsubscribe(subscription)
+
+@app.get("/events/stream")
+async def events_stream(request: Request, devices: Optional[str] = None,
+                        departments: Optional[str] = None, types: Optional[str] = None):
+    """Mismos eventos por Server-Sent Events (filtros separados por comas; exige el secreto edge)"""
+    require_edge_token(request)
+    subscription = subscribe_events(devices, departments, types)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscription.next(), SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None:
+                    yield f"event: dropped\ndata: {json.dumps({'reason': subscription.closed_reason})}\n\n"
+                    break
+                yield f"data: {message}\n\n"
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# ------------------- DISPOSITIVOS -------------------
+@app.post("/devices/heartbeat")
+async def device_heartbeat(heartbeat: DeviceHeartbeat, request: Request):
+    """Heartbeat del lector (secreto edge): solo memoria; responde con el intervalo esperado y la salud cacheada"""
+    require_edge_token(request)
+    if max(len(heartbeat.device_id), len(heartbeat.reader_status)) > MAX_HEARTBEAT_DEVICE_ID:
+        raise HTTPException(status_code=400, detail="device_id o reader_status demasiado largo")
+    if heartbeat.details is not None and len(json.dumps(heartbeat.details)) > MAX_HEARTBEAT_DETAILS:
+        raise HTTPException(status_code=400, detail=f"details supera {MAX_HEARTBEAT_DETAILS} bytes")
+    try:
+        status = device_registry.heartbeat(heartbeat.device_id, heartbeat.reader_status,
+                                           max(0, heartbeat.queue_depth), heartbeat.details,
+                                           request.client.host if request.client else None)
+    except RegistryFull:
+        raise HTTPException(status_code=429, detail="Registro de dispositivos lleno")
+    return {"status": status, "next_heartbeat": device_registry.heartbeat_interval,
+            "server_status": deep_health.status}
+
+@app.get("/admin/devices")
+async def list_devices(status: Optional[str] = None):
+    """Lectores conocidos con su estado (online, degraded, stale, offline) y cola local"""
+    if status is not None and status not in (ONLINE, DEVICE_DEGRADED, STALE, OFFLINE):
+        raise HTTPException(status_code=400, detail=f"Estado desconocido: {status}")
+    devices = device_registry.list_devices(status)
+    return {"count": len(devices), "devices": devices}
+
+
 # ------------------- Health y root -------------------
+HEALTH_DB_WRITE_MS = (200.0, 2000.0)  # degradado, caído
+HEALTH_LEDGER_BACKLOG = 10000  # bloques sin anclaje confirmado
+HEALTH_QUEUE_USAGE = 0.8  # fracción de la capacidad de cada cola
+HEALTH_DEVICE_FRACTION = float(os.environ.get("NFC_HEALTH_DEVICE_FRACTION", "0.25"))  # lectores conocidos con problemas
+
+def check_database() -> dict:
+    seconds = database.probe_write_latency()
+    write_ms = round(seconds * 1000, 2) if seconds is not None else None
+    return {"status": threshold_status(write_ms, *HEALTH_DB_WRITE_MS), "write_ms": write_ms}
+
+def check_ledgers() -> dict:
+    result = {"status": HEALTHY}
+    for name, ledger in (("auth", blockchain), ("sessions", session_manager.blockchain)):
+        info = {"records": len(ledger)}
+        if hasattr(ledger, "anchor_status"):
+            anchor = ledger.anchor_status()
+            info["unanchored"] = anchor["blocks"] - anchor["confirmed_block"]
+            if info["unanchored"] >= HEALTH_LEDGER_BACKLOG:
+                result["status"] = DEGRADED
+        result[name] = info
+    return result
+
+def check_queues() -> dict:
+    usage = {"pin_verify": pin_verifier.pending / pin_verifier.max_pending,
+             "session_ingest": len(session_ingest) / session_ingest.max_queue,
+             "auth_in_flight": auth_throttle.admission.in_flight / auth_throttle.admission.max_in_flight}
+    return dict({name: round(value, 3) for name, value in usage.items()},
+                status=threshold_status(max(usage.values()), HEALTH_QUEUE_USAGE))
+
+def check_devices() -> dict:
+    """Degradado si una fracción de los lectores conocidos está caída o averiada; los offline solo se cuentan"""
+    summary = device_registry.summary()
+    affected = (summary[STALE] + summary[DEVICE_DEGRADED]) / summary["total"] if summary["total"] else 0.0
+    return dict(summary, affected_fraction=round(affected, 3),
+                status=threshold_status(affected, HEALTH_DEVICE_FRACTION))
+
+def check_behavior() -> dict:
+    if behavior is None:
+        return {"status": HEALTHY, "enabled": False}
+    age = time.time() - behavior.last_refresh if behavior.last_refresh else None
+    return {"status": HEALTHY if age is not None and age < 3 * BEHAVIOR_REFRESH else DEGRADED, "enabled": True,
+            "users": len(behavior), "refresh_age_seconds": round(age, 1) if age is not None else None}
+
+# Se mide como mucho una vez cada NFC_HEALTH_TTL segundos, no por petición
+deep_health = DeepHealth({"database": check_database, "ledgers": check_ledgers, "queues": check_queues,
+                          "devices": check_devices, "behavior": check_behavior},
+                         ttl=float(os.environ.get("NFC_HEALTH_TTL", "10")))
+
 @app.get("/health")
-async def health_check():
-    return {"status": "healthy",
-            "nfc_reader": "simulated",
-            "database": "connected",
-            "blockchain": "simulated",
-            "session_manager": "active"}
+async def health_check(response: Response):
+    """Salud profunda (escritura real en BD, ledgers, colas, lectores) desde caché; 503 si está caído"""
+    report = deep_health.report()
+    if report["status"] == UNHEALTHY:
+        response.status_code = 503
+    return dict(report, blockchain=os.environ.get("NFC_LEDGER_BACKEND", "memory"))
 
 @app.get("/")
 async def root():
     return {"message": "Sistema NFC + Blockchain", "version": "1.0",
             "endpoints": {"authentication": "/authenticate",
                           "sessions": "/session/start, /session/activity, /session/logout",
-                          "admin": "/admin/register-card",
-                          "users": "/users",
+                          "admin": "/admin/register-card, /admin/ledger/verify, /admin/ledger/anchor, "
+                                   "/admin/activities/search, /admin/reports/{report}, /admin/alerts, "
+                                   "/admin/devices",
+                          "devices": "/devices/heartbeat",
+                          "users": "/users, /users/lookup, /users/changes, /users/filter",
                           "logs": "/logs",
-                          "health": "/health"}}
+                          "health": "/health",
+                          "edge": "/edge/snapshot, /edge/reconcile",
+                          "events": "/events/stream (SSE), /events/ws (WebSocket)",
+                          "metrics": "/metrics"}}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    parser = argparse.ArgumentParser(description="Servidor de autenticación NFC")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Procesos uvicorn; con más de uno el estado compartido pasa a SQLite")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # Los workers importan main de nuevo y heredan el entorno
+        os.environ["NFC_WORKERS"] = str(args.workers)
+        os.environ.setdefault("NFC_LEDGER_BACKEND", "sqlite")
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
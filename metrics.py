@@ -0,0 +1,200 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Buckets por defecto en segundos (0.5 ms .. 10 s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Contador monótono. Las series son un dict ``tupla_de_etiquetas -> valor``.
+
+    Se incrementa desde el event loop y desde hilos de fondo (observadores
+    de consultas, ingesta de sesiones), así que cada suma va bajo un lock.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield self.name, _format_labels(self.label_names, labels), value
+
+
+class Histogram:
+    """Histograma de buckets fijos; solo se incrementa un bucket por observación.
+
+    Igual que ``Counter``, las observaciones pueden llegar desde varios hilos
+    y se serializan con un lock.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bucket] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """Medir la duración de un bloque ``with``"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count)
+                        for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield (f"{self.name}_bucket",
+                       _format_labels(self.label_names, labels, ("le", repr(bound))), cumulative)
+            yield f"{self.name}_bucket", _format_labels(self.label_names, labels, ("le", "+Inf")), count
+            yield f"{self.name}_sum", _format_labels(self.label_names, labels), total
+            yield f"{self.name}_count", _format_labels(self.label_names, labels), count
+
+
+class Gauge:
+    """Gauge evaluado al exportar mediante una función.
+
+    La función devuelve un número o un dict ``tupla_de_etiquetas -> valor``,
+    así que leer tamaños de colas o del ledger no cuesta nada en el camino caliente.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, func, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.func = func
+
+    def samples(self):
+        try:
+            value = self.func()
+        except Exception:
+            return
+        if isinstance(value, dict):
+            for labels, v in value.items():
+                yield self.name, _format_labels(self.label_names, labels), v
+        else:
+            yield self.name, "", value
+
+
+class MetricsRegistry:
+    """Colección de métricas exportable en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels=()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name: str, help_text: str, func, labels=()) -> Gauge:
+        metric = Gauge(name, help_text, func, labels)
+        self._metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Registro global del proceso y métricas compartidas entre módulos
+REGISTRY = MetricsRegistry()
+
+HTTP_LATENCY = REGISTRY.histogram(
+    "nfc_http_request_duration_seconds", "Latencia de peticiones HTTP por ruta",
+    labels=("method", "route", "status"))
+AUTH_STAGE_LATENCY = REGISTRY.histogram(
+    "nfc_auth_stage_duration_seconds", "Duración de cada etapa de /authenticate",
+    labels=("stage",))
+AUTH_RESULTS = REGISTRY.counter(
+    "nfc_auth_attempts_total", "Intentos de autenticación por resultado",
+    labels=("result",))
+DB_QUERY_LATENCY = REGISTRY.histogram(
+    "nfc_db_query_duration_seconds", "Duración de sentencias SQLite por operación",
+    labels=("operation",))
+CACHE_REQUESTS = REGISTRY.counter(
+    "nfc_cache_requests_total", "Consultas a cachés en memoria por resultado (hit/miss)",
+    labels=("cache", "result"))
+SESSION_EVENTS = REGISTRY.counter(
+    "nfc_session_events_total", "Eventos de sesión (actividad/logout) por resultado",
+    labels=("kind", "result"))
+EVENT_HUB = REGISTRY.counter(
+    "nfc_event_hub_total", "Eventos del hub en vivo (published/delivered/dropped_subscriber)",
+    labels=("result",))
+SESSION_BATCH_LATENCY = REGISTRY.histogram(
+    "nfc_session_batch_duration_seconds", "Escritura de cada lote de eventos de sesión (ledger + BD)")
+SECURITY_ALERTS = REGISTRY.counter(
+    "nfc_security_alerts_total", "Alertas de seguridad generadas por tipo y severidad",
+    labels=("alert_type", "severity"))
+
+
+def observe_query(sql: str, parameters, elapsed: float, rows: int):
+    """Observador de DatabaseManager: cuenta y cronometra cada sentencia"""
+    operation = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "UNKNOWN"
+    DB_QUERY_LATENCY.observe(elapsed, operation)
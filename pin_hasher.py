@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Parámetros de coste por defecto (ajustar con benchmark_pin_cost.py)
+DEFAULT_SCRYPT_N = 2 ** 14
+DEFAULT_SCRYPT_R = 8
+DEFAULT_SCRYPT_P = 1
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+
+class PinHasher:
+    """Hash de PINs con scrypt y sal por registro.
+
+    Formato almacenado: ``scrypt$n$r$p$sal_hex$hash_hex``. Los parámetros de
+    coste viajan con cada registro, así que subir el coste no invalida los
+    hashes existentes: se rehashean en el siguiente login correcto.
+    Los PIN heredados en texto plano se migran a hash al iniciar la base de
+    datos y ya no se aceptan.
+    """
+
+    PREFIX = "scrypt"
+
+    def __init__(self, n: int = DEFAULT_SCRYPT_N, r: int = DEFAULT_SCRYPT_R,
+                 p: int = DEFAULT_SCRYPT_P):
+        self.n = int(os.environ.get("NFC_PIN_SCRYPT_N", n))
+        self.r = int(os.environ.get("NFC_PIN_SCRYPT_R", r))
+        self.p = int(os.environ.get("NFC_PIN_SCRYPT_P", p))
+
+    def _derive(self, pin: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+        return hashlib.scrypt(pin.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=HASH_BYTES)
+
+    def hash_pin(self, pin: str) -> str:
+        """Generar hash salado del PIN con el coste actual"""
+        salt = os.urandom(SALT_BYTES)
+        digest = self._derive(pin, salt, self.n, self.r, self.p)
+        return f"{self.PREFIX}${self.n}${self.r}${self.p}${salt.hex()}${digest.hex()}"
+
+    @classmethod
+    def is_hashed(cls, stored: str) -> bool:
+        """Indica si el valor almacenado ya es un hash (y no un PIN heredado)"""
+        return bool(stored) and stored.startswith(cls.PREFIX + "$")
+
+    @classmethod
+    def parse(cls, stored: str):
+        """Descomponer un hash almacenado en (n, r, p, sal, hash)"""
+        _, n, r, p, salt_hex, digest_hex = stored.split("$")
+        return int(n), int(r), int(p), bytes.fromhex(salt_hex), bytes.fromhex(digest_hex)
+
+    def verify(self, pin: str, stored: str) -> bool:
+        """Verificar PIN contra el valor almacenado (tiempo constante)"""
+        if stored is None or pin is None or not self.is_hashed(stored):
+            return False
+        try:
+            n, r, p, salt, digest = self.parse(stored)
+        except ValueError:
+            return False
+        return hmac.compare_digest(self._derive(pin, salt, n, r, p), digest)
+
+    def needs_rehash(self, stored: str) -> bool:
+        """True si el registro usa texto plano o un coste distinto al actual"""
+        if not self.is_hashed(stored):
+            return True
+        try:
+            n, r, p, _, _ = self.parse(stored)
+        except ValueError:
+            return True
+        return (n, r, p) != (self.n, self.r, self.p)
+
+
+class PinVerifier:
+    """Pool acotado de verificación de PINs fuera del event loop.
+
+    hashlib.scrypt libera el GIL, así que un ThreadPoolExecutor escala con los
+    núcleos. ``max_pending`` limita cuántas verificaciones pueden estar en
+    cola para que una ráfaga de intentos no acumule memoria ni latencia sin
+    límite. El contador solo se toca desde el event loop.
+    """
+
+    def __init__(self, hasher: PinHasher = None, max_workers: int = None,
+                 max_pending: int = None):
+        self.hasher = hasher or PinHasher()
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending or self.max_workers * 8
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                           thread_name_prefix="pin-verify")
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Verificaciones en curso o en cola"""
+        return self._pending
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            raise RuntimeError("Cola de verificación de PIN saturada")
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def verify(self, pin: str, stored: str) -> bool:
+        """Verificar PIN en el pool"""
+        return await self._run(self.hasher.verify, pin, stored)
+
+    async def hash_pin(self, pin: str) -> str:
+        """Calcular un hash nuevo en el pool"""
+        return await self._run(self.hasher.hash_pin, pin)
+
+    async def verify_and_upgrade(self, pin: str, stored: str):
+        """Verificar y, si procede, devolver un hash nuevo con el coste actual.
+
+        Devuelve ``(valido, nuevo_hash)``; ``nuevo_hash`` es None si no hace
+        falta rehashear.
+        """
+        valid = await self.verify(pin, stored)
+        if valid and self.hasher.needs_rehash(stored):
+            return True, await self.hash_pin(pin)
+        return valid, None
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+# Prueba rápida
+if __name__ == "__main__":
+    hasher = PinHasher()
+    stored = hasher.hash_pin("1234")
+    print(f"Hash: {stored}")
+    print(f"Verifica 1234: {hasher.verify('1234', stored)}")
+    print(f"Verifica 0000: {hasher.verify('0000', stored)}")
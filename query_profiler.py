@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+
+def normalize_sql(sql: str) -> str:
+    """Colapsar espacios y sustituir literales por ``?`` para agrupar sentencias"""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+class QueryProfiler:
+    """Perfilador opcional de las sentencias de DatabaseManager.
+
+    Se engancha como observador de consultas solo mientras está activo, de
+    modo que desactivado no añade ningún coste a las conexiones. Agrega
+    tiempo y filas por sentencia normalizada, guarda las últimas ``top_n``
+    consultas lentas en un buffer circular y captura ``EXPLAIN QUERY PLAN``
+    (una vez por sentencia) cuando se supera el umbral. Las conexiones de
+    varios hilos notifican a la vez, así que el estado va bajo un lock.
+    """
+
+    def __init__(self, database, slow_threshold_ms: float = 50.0, top_n: int = 50):
+        self.database = database
+        self.slow_threshold_ms = slow_threshold_ms
+        self.top_n = top_n
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Vaciar estadísticas y buffer de consultas lentas"""
+        with self._lock:
+            self.stats = {}
+            self.slow_queries = deque(maxlen=self.top_n)
+            self.plans = {}
+            self.started_at = time.time()
+
+    def enable(self, slow_threshold_ms: float = None):
+        if slow_threshold_ms is not None:
+            self.slow_threshold_ms = slow_threshold_ms
+        self.database.add_query_observer(self.observe)
+        self.enabled = True
+
+    def disable(self):
+        self.database.remove_query_observer(self.observe)
+        self.enabled = False
+
+    def observe(self, sql: str, parameters, elapsed: float, rows: int):
+        normalized = normalize_sql(sql)
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            entry = self.stats.get(normalized)
+            if entry is None:
+                entry = self.stats[normalized] = {"sql": normalized, "calls": 0, "total_ms": 0.0,
+                                                  "max_ms": 0.0, "rows": 0}
+            entry["calls"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["rows"] += max(rows, 0)
+            if elapsed_ms > entry["max_ms"]:
+                entry["max_ms"] = elapsed_ms
+            if elapsed_ms < self.slow_threshold_ms:
+                return
+            plan = self.plans.get(normalized)
+            explain = normalized not in self.plans
+
+        if explain:
+            # EXPLAIN abre otra conexión: fuera del lock (dos hilos pueden calcularlo a la vez)
+            plan = self._explain(sql, parameters)
+        with self._lock:
+            plan = self.plans.setdefault(normalized, plan)
+            self.slow_queries.append({
+                "sql": normalized,
+                "elapsed_ms": round(elapsed_ms, 3),
+                "rows": rows,
+                "timestamp": time.time(),
+                "plan": plan,
+            })
+
+    def _explain(self, sql: str, parameters):
+        """Capturar el plan en una conexión aparte (sin instrumentar)"""
+        if parameters is None or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        try:
+            conn = sqlite3.connect(self.database.db_name)
+            try:
+                return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            return [f"error: {e}"]
+
+    def report(self, limit: int = 20) -> dict:
+        """Resumen ordenado por tiempo total"""
+        with self._lock:
+            stats = [dict(e) for e in self.stats.values()]
+            plans = dict(self.plans)
+            slow_queries = list(self.slow_queries)
+            started_at = self.started_at
+        top = sorted(stats, key=lambda e: e["total_ms"], reverse=True)[:limit]
+        return {
+            "enabled": self.enabled,
+            "slow_threshold_ms": self.slow_threshold_ms,
+            "since": started_at,
+            "statements": [dict(e, avg_ms=round(e["total_ms"] / e["calls"], 3),
+                                total_ms=round(e["total_ms"], 3), max_ms=round(e["max_ms"], 3),
+                                plan=plans.get(e["sql"])) for e in top],
+            "slow_queries": slow_queries,
+        }
+
+
+def print_report(report: dict):
+    """Volcado legible del informe del perfilador"""
+    estado = "activo" if report.get("enabled") else "inactivo"
+    print(f"🔬 Perfilador de consultas ({estado}, umbral {report.get('slow_threshold_ms')} ms)")
+    print("=" * 90)
+    print(f"{'llamadas':>9} {'total ms':>11} {'media ms':>9} {'max ms':>9} {'filas':>9}  sentencia")
+    for entry in report.get("statements", []):
+        print(f"{entry['calls']:>9} {entry['total_ms']:>11.2f} {entry['avg_ms']:>9.3f} "
+              f"{entry['max_ms']:>9.3f} {entry['rows']:>9}  {entry['sql'][:80]}")
+        for step in entry.get("plan") or []:
+            print(f"{'':>52}↳ {step}")
+    slow = report.get("slow_queries", [])
+    print(f"\n🐢 Últimas consultas lentas ({len(slow)}):")
+    for entry in slow:
+        print(f"   {entry['elapsed_ms']:>9.2f} ms  {entry['rows']:>7} filas  {entry['sql'][:80]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Volcar el informe del perfilador de consultas")
+    parser.add_argument("--url", default=os.environ.get("NFC_API_URL", "http://localhost:8000"),
+                        help="Servidor del que leer /admin/query-profile")
+    parser.add_argument("--file", help="Leer el informe desde un JSON guardado en lugar del servidor")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Imprimir el JSON sin formatear")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            data = json.load(f)
+    else:
+        import requests
+        response = requests.get(f"{args.url.rstrip('/')}/admin/query-profile",
+                                params={"limit": args.limit}, timeout=10)
+        data = response.json()
+
+    if args.json:
+        print(json.dumps(data, indent=2, ensure_ascii=False))
+    else:
+        print_report(data)
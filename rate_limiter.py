@@ -0,0 +1,260 @@
+import math
+import sqlite3
+import threading
+import time
+
+
+LOCKED_REASON = "Tarjeta bloqueada temporalmente por PIN incorrecto"
+
+
+class TokenBucketLimiter:
+    """Token buckets en memoria indexados por clave (nfc_id, device_id...).
+
+    Cada clave ocupa una lista ``[tokens, ultima_actualizacion]``. Las claves
+    inactivas durante ``idle_ttl`` segundos (ya con el cubo lleno) se purgan
+    periódicamente y ``max_keys`` acota la memoria ante UIDs aleatorios.
+    """
+
+    def __init__(self, rate: float, burst: int, idle_ttl: float = 600.0,
+                 max_keys: int = 100000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.idle_ttl = idle_ttl
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = {}
+        self._next_sweep = clock() + idle_ttl
+
+    def _refill(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._sweep(now, force=True)
+            bucket = self._buckets[key] = [float(self.burst), now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def allow(self, key, cost: float = 1.0) -> bool:
+        """Consumir ``cost`` tokens; False si la clave supera el límite"""
+        now = self.clock()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        bucket = self._refill(key, now)
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return True
+        return False
+
+    def retry_after(self, key) -> float:
+        """Segundos hasta que la clave vuelva a tener un token"""
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket[0] >= 1:
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def _sweep(self, now, force: bool = False):
+        """Purgar claves inactivas; si sigue lleno, expulsar las más antiguas"""
+        cutoff = now - self.idle_ttl
+        for key in [k for k, (_, updated) in self._buckets.items() if updated < cutoff]:
+            del self._buckets[key]
+        if force and len(self._buckets) >= self.max_keys:
+            for key in list(self._buckets)[:len(self._buckets) - self.max_keys + 1]:
+                del self._buckets[key]
+        self._next_sweep = now + self.idle_ttl
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class FailureLockout:
+    """Bloqueo temporal tras varios PIN incorrectos seguidos.
+
+    Guarda ``clave -> [fallos, primer_fallo, bloqueado_hasta]``. Cada bloqueo
+    sucesivo dobla la duración hasta ``max_lockout``.
+    """
+
+    def __init__(self, max_failures: int = 5, window: float = 300.0,
+                 lockout: float = 60.0, max_lockout: float = 3600.0,
+                 max_keys: int = 100000, clock=time.monotonic):
+        self.max_failures = max_failures
+        self.window = window
+        self.lockout = lockout
+        self.max_lockout = max_lockout
+        self.max_keys = max_keys
+        self.clock = clock
+        self._entries = {}
+        self._strikes = {}
+
+    def locked_for(self, key) -> float:
+        """Segundos de bloqueo restantes (0 si no está bloqueada)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return 0.0
+        remaining = entry[2] - self.clock()
+        return remaining if remaining > 0 else 0.0
+
+    def record_failure(self, key) -> float:
+        """Registrar un fallo; devuelve la duración del bloqueo si se activa"""
+        now = self.clock()
+        entry = self._entries.get(key)
+        if entry is None or now - entry[1] > self.window:
+            if entry is None and len(self._entries) >= self.max_keys:
+                self._sweep(now)
+            entry = self._entries[key] = [0, now, 0.0]
+        entry[0] += 1
+        if entry[0] >= self.max_failures:
+            strikes = self._strikes.get(key, 0)
+            duration = min(self.max_lockout, self.lockout * (2 ** strikes))
+            self._strikes[key] = strikes + 1
+            entry[0] = 0
+            entry[1] = now
+            entry[2] = now + duration
+            return duration
+        return 0.0
+
+    def record_success(self, key):
+        """Un acceso correcto reinicia el contador"""
+        self._entries.pop(key, None)
+        self._strikes.pop(key, None)
+
+    def _sweep(self, now):
+        for key in [k for k, e in self._entries.items()
+                    if e[2] < now and now - e[1] > self.window]:
+            del self._entries[key]
+            self._strikes.pop(key, None)
+        if len(self._entries) >= self.max_keys:
+            for key in list(self._entries)[:len(self._entries) - self.max_keys + 1]:
+                del self._entries[key]
+                self._strikes.pop(key, None)
+
+
+class SQLiteFailureLockout:
+    """``FailureLockout`` compartido entre workers en una tabla SQLite.
+
+    Con contadores por proceso cada worker concedería ``max_failures``
+    intentos: el total sería N veces mayor. Aquí cada fallo se suma en
+    ``auth_lockouts`` dentro de una transacción, con reloj de pared común a
+    todos los procesos. Las llamadas bloquean (SQLite): desde el event loop
+    deben ir a un hilo. Las filas inactivas se purgan cada ``purge_every``
+    fallos.
+    """
+
+    def __init__(self, db_path: str, max_failures: int = 5, window: float = 300.0,
+                 lockout: float = 60.0, max_lockout: float = 3600.0, purge_every: int = 500,
+                 clock=time.time):
+        self.max_failures = max_failures
+        self.window = window
+        self.lockout = lockout
+        self.max_lockout = max_lockout
+        self.purge_every = purge_every
+        self.clock = clock
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS auth_lockouts (
+                key TEXT PRIMARY KEY,
+                failures INTEGER NOT NULL,
+                first_failure REAL NOT NULL,
+                locked_until REAL NOT NULL,
+                strikes INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+    def locked_for(self, key) -> float:
+        """Segundos de bloqueo restantes (0 si no está bloqueada)"""
+        with self._lock:
+            row = self._conn.execute('SELECT locked_until FROM auth_lockouts WHERE key = ?',
+                                     (str(key),)).fetchone()
+        remaining = row[0] - self.clock() if row else 0.0
+        return remaining if remaining > 0 else 0.0
+
+    def record_failure(self, key) -> float:
+        """Registrar un fallo; devuelve la duración del bloqueo si se activa"""
+        now = self.clock()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._failures += 1
+                if self._failures % self.purge_every == 0:
+                    self._conn.execute('DELETE FROM auth_lockouts WHERE locked_until < ? AND first_failure < ?',
+                                       (now, now - self.window))
+                row = self._conn.execute('SELECT failures, first_failure, strikes FROM auth_lockouts WHERE key = ?',
+                                         (str(key),)).fetchone()
+                failures, first_failure, strikes = row if row else (0, now, 0)
+                if now - first_failure > self.window:
+                    failures, first_failure = 0, now
+                failures += 1
+                duration = 0.0
+                if failures >= self.max_failures:
+                    duration = min(self.max_lockout, self.lockout * (2 ** strikes))
+                    failures, first_failure, strikes = 0, now, strikes + 1
+                self._conn.execute('''
+                    INSERT INTO auth_lockouts (key, failures, first_failure, locked_until, strikes)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET failures = excluded.failures,
+                        first_failure = excluded.first_failure, strikes = excluded.strikes,
+                        locked_until = CASE WHEN ? > 0 THEN excluded.locked_until ELSE locked_until END
+                ''', (str(key), failures, first_failure, now + duration, strikes, duration))
+                self._conn.execute('COMMIT')
+            except sqlite3.Error:
+                self._conn.execute('ROLLBACK')
+                raise
+        return duration
+
+    def record_success(self, key):
+        """Un acceso correcto reinicia el contador"""
+        with self._lock:
+            self._conn.execute('DELETE FROM auth_lockouts WHERE key = ?', (str(key),))
+
+
+class AdmissionController:
+    """Límite global de peticiones concurrentes (corre en el event loop, sin locks)"""
+
+    def __init__(self, max_in_flight: int = 64):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+
+class AuthThrottle:
+    """Agrupa los limitadores que protegen /authenticate y /session/start.
+
+    Con varios workers los token buckets se reparten por proceso, pero el
+    bloqueo por PIN debe ser un ``SQLiteFailureLockout`` común: en ese caso
+    ``check`` no lo consulta y el llamador usa ``lockout`` desde un hilo.
+    """
+
+    def __init__(self, card_rate: float = 0.5, card_burst: int = 5,
+                 device_rate: float = 5.0, device_burst: int = 20,
+                 max_in_flight: int = 64, lockout: FailureLockout = None, workers: int = 1):
+        # Con varios workers cada proceso limita su parte: el total se mantiene aproximado
+        workers = max(1, workers)
+        self.by_card = TokenBucketLimiter(card_rate / workers, max(1, math.ceil(card_burst / workers)))
+        self.by_device = TokenBucketLimiter(device_rate / workers, max(1, math.ceil(device_burst / workers)))
+        self.lockout = lockout or FailureLockout()
+        self.shared_lockout = isinstance(self.lockout, SQLiteFailureLockout)
+        self.admission = AdmissionController(max_in_flight)
+
+    def check(self, nfc_id: str, device_id: str):
+        """Devuelve ``None`` si se admite o ``(motivo, retry_after)`` si se rechaza"""
+        locked = 0.0 if self.shared_lockout else self.lockout.locked_for(nfc_id)
+        if locked:
+            return LOCKED_REASON, locked
+        if not self.by_device.allow(device_id):
+            return "Demasiados intentos desde este dispositivo", self.by_device.retry_after(device_id)
+        if not self.by_card.allow(nfc_id):
+            return "Demasiados intentos con esta tarjeta", self.by_card.retry_after(nfc_id)
+        return None
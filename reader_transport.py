@@ -0,0 +1,102 @@
+import threading
+import time
+
+# ATR que el ACR122U sintetiza para tarjetas sin contacto (PC/SC parte 3);
+# los bytes 13-14 identifican el tipo de tarjeta
+ACR122U_ATR_PREFIX = (0x3B, 0x8F, 0x80, 0x01, 0x80, 0x4F, 0x0C, 0xA0, 0x00, 0x00, 0x03, 0x06)
+CARD_NAMES = {
+    (0x00, 0x01): "MIFARE Classic 1K",
+    (0x00, 0x02): "MIFARE Classic 4K",
+    (0x00, 0x03): "MIFARE Ultralight",
+    (0x00, 0x26): "MIFARE Mini",
+    (0xF0, 0x04): "Topaz/Jewel",
+    (0xF0, 0x11): "FeliCa 212K",
+    (0xF0, 0x12): "FeliCa 424K",
+}
+DEFAULT_ATR = ACR122U_ATR_PREFIX + (0x03, 0x00, 0x01, 0x00, 0x00, 0x00, 0x00, 0x6A)
+
+
+class CardAbsentError(Exception):
+    """No hay tarjeta en el campo (o se retiró durante la operación)"""
+
+
+def card_type_from_atr(atr) -> str:
+    atr = tuple(atr)
+    if atr[:len(ACR122U_ATR_PREFIX)] == ACR122U_ATR_PREFIX and len(atr) >= 15:
+        return CARD_NAMES.get(atr[13:15], "Tarjeta PC/SC desconocida")
+    return "ISO 14443-4"
+
+
+class SimulatedTransport:
+    """Transporte de lector simulado para pruebas y benchmarks sin hardware.
+
+    Implementa la misma interfaz que ``PCSCTransport`` (``wait_for_card``,
+    ``connect``, ``transmit``, ``disconnect``, ``close``) con latencias
+    configurables: ``context_latency`` es el coste de establecer un contexto
+    PC/SC (``open``), ``connect_latency`` el de conectar con la tarjeta y
+    ``apdu_latency`` el de cada APDU.
+    """
+
+    name = "ACR122U Simulado"
+
+    def __init__(self, uid: str = None, atr=DEFAULT_ATR, context_latency: float = 0.03,
+                 connect_latency: float = 0.01, apdu_latency: float = 0.003):
+        self.atr = tuple(atr)
+        self.context_latency = context_latency
+        self.connect_latency = connect_latency
+        self.apdu_latency = apdu_latency
+        self.card_uid = None
+        self.connected = False
+        self.contexts_opened = 0
+        self.connects = 0
+        self.apdus = []
+        self._present = threading.Event()
+        self.open()
+        if uid:
+            self.place_card(uid)
+
+    # ---------- control de la simulación ----------
+    def place_card(self, uid: str, atr=None):
+        self.card_uid = uid
+        if atr is not None:
+            self.atr = tuple(atr)
+        self._present.set()
+
+    def remove_card(self):
+        self.card_uid = None
+        self.connected = False
+        self._present.clear()
+
+    # ---------- interfaz de transporte ----------
+    def open(self):
+        time.sleep(self.context_latency)
+        self.contexts_opened += 1
+
+    def wait_for_card(self, timeout: float) -> bool:
+        return self._present.wait(timeout)
+
+    def connect(self):
+        if self.card_uid is None:
+            raise CardAbsentError()
+        time.sleep(self.connect_latency)
+        self.connects += 1
+        self.connected = True
+        return self.atr
+
+    def transmit(self, apdu):
+        if not self.connected or self.card_uid is None:
+            self.connected = False
+            raise CardAbsentError()
+        time.sleep(self.apdu_latency)
+        self.apdus.append(list(apdu))
+        if list(apdu[:2]) == [0xFF, 0xCA]:
+            return list(bytes.fromhex(self.card_uid)), 0x90, 0x00
+        if list(apdu[:3]) in ([0xFF, 0x00, 0x52], [0xFF, 0x00, 0x40]):
+            return [], 0x90, 0x00
+        return [], 0x6A, 0x81
+
+    def disconnect(self):
+        self.connected = False
+
+    def close(self):
+        self.disconnect()
@@ -1,8 +1,16 @@
 from database import DatabaseManager
 from acr122u_reader import ACR122UReader
+from pin_hasher import PinHasher
+from bulk_users import BulkUserImporter
 import hashlib
 import secrets
 
+def _describe_pin(stored_pin: str) -> str:
+    """Describir la credencial almacenada sin mostrar el PIN"""
+    if PinHasher.is_hashed(stored_pin):
+        return "protegido (hash scrypt)"
+    return "texto plano heredado (se migrará al iniciar la base de datos)"
+
 def register_my_card():
     """Registrar tarjeta NFC física con LECTURA REAL Y PIN"""
     
@@ -127,7 +135,7 @@ def register_my_card():
             print(f"   🏢 Departamento: {usuario_registrado['department']}")
             print(f"   🔐 Nivel seguridad: {usuario_registrado['security_level']}")
             print(f"   🔑 Administrador: {'Sí' if usuario_registrado['is_admin'] else 'No'}")
-            print(f"   🔐 PIN: {usuario_registrado['pin']}")
+            print(f"   🔐 PIN: {_describe_pin(usuario_registrado['pin'])}")
         
         return True
     else:
@@ -147,21 +155,19 @@ def register_multiple_cards():
     
     print("🔄 Registrando tarjetas de ejemplo...")
     
+    # Un único lote en una transacción; las tarjetas existentes no se modifican
+    importer = BulkUserImporter(db, update_existing=False, show_progress=False)
+    resultado = importer.import_records(tarjetas_ejemplo)
+    ya_registradas = {c['nfc_id'] for c in resultado['conflicts'] if c['status'] == 'skipped'}
+    invalidas = {c['nfc_id']: c['reason'] for c in resultado['conflicts'] if c['status'] == 'invalid'}
+    
     for tarjeta in tarjetas_ejemplo:
-        success = db.register_nfc_user_with_pin(
-            nfc_id=tarjeta["nfc_id"],
-            username=tarjeta["username"],
-            full_name=tarjeta["full_name"],
-            department=tarjeta["department"],
-            security_level=tarjeta["security_level"],
-            is_admin=tarjeta["is_admin"],
-            pin=tarjeta["pin"]
-        )
-        
-        if success:
-            print(f"✅ {tarjeta['full_name']} - {tarjeta['nfc_id']} - PIN: {tarjeta['pin']}")
-        else:
+        if tarjeta['nfc_id'] in invalidas:
+            print(f"❌ {tarjeta['full_name']} - NO VÁLIDO: {invalidas[tarjeta['nfc_id']]}")
+        elif tarjeta['nfc_id'] in ya_registradas:
             print(f"❌ {tarjeta['full_name']} - YA REGISTRADO")
+        else:
+            print(f"✅ {tarjeta['full_name']} - {tarjeta['nfc_id']} - PIN: {tarjeta['pin']}")
     
     print("✅ Proceso de registro completado")
 
@@ -178,7 +184,7 @@ def show_registered_users():
         print(f"   🎫 {usuario['nfc_id']}")
         print(f"   👤 {usuario['full_name']} ({usuario['username']})")
         print(f"   🏢 {usuario['department']} - Nivel {usuario['security_level']}{admin_status}")
-        print(f"   🔐 PIN: {usuario['pin']}")
+        print(f"   🔐 PIN: {_describe_pin(usuario['pin'])}")
         print("   " + "-" * 50)
 
 def change_user_pin():
@@ -221,7 +227,7 @@ def change_user_pin():
     print(f"   🏢 Departamento: {usuario['department']}")
     print(f"   🔒 Nivel seguridad: {usuario['security_level']}")
     print(f"   🔑 Administrador: {'Sí' if usuario['is_admin'] else 'No'}")
-    print(f"   🔐 PIN actual: {usuario['pin']}")
+    print(f"   🔐 PIN actual: {_describe_pin(usuario['pin'])}")
     
     # Solicitar nuevo PIN
     nuevo_pin = input("\n🔐 Ingresa el nuevo PIN (4 dígitos): ").strip()
@@ -231,7 +237,7 @@ def change_user_pin():
         print("❌ El PIN debe ser de 4 dígitos numéricos")
         return False
     
-    if nuevo_pin == usuario['pin']:
+    if db.pin_hasher.verify(nuevo_pin, usuario['pin']):
         print("❌ El nuevo PIN no puede ser igual al actual")
         return False
     
@@ -239,7 +245,6 @@ def change_user_pin():
     print(f"\n📋 CONFIRMACIÓN:")
     print(f"   🎫 Tarjeta: {nfc_id}")
     print(f"   👤 Usuario: {usuario['full_name']}")
-    print(f"   🔐 PIN actual: {usuario['pin']}")
     print(f"   🔐 Nuevo PIN: {nuevo_pin}")
     
     confirmar = input("\n¿Confirmar cambio de PIN? (s/n): ").strip().lower()
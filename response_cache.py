@@ -0,0 +1,51 @@
+import hashlib
+from collections import OrderedDict
+
+import metrics
+
+
+class VersionedResponseCache:
+    """Caché de respuestas ya serializadas ligada a una generación de datos.
+
+    Cada entrada guarda ``(etag, cuerpo_bytes)`` para una clave de consulta.
+    Cuando la generación cambia (cualquier escritura en la tabla) la caché se
+    vacía entera, así que nunca se sirve un cuerpo obsoleto. El tamaño está
+    acotado con expulsión LRU.
+    """
+
+    def __init__(self, name: str, max_entries: int = 256):
+        self.name = name
+        self.max_entries = max_entries
+        self.generation = None
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def make_etag(generation: int, key) -> str:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:12]
+        return f'"{generation}-{digest}"'
+
+    def get(self, generation: int, key):
+        """Devuelve ``(etag, cuerpo)`` o None si no hay entrada vigente"""
+        if generation != self.generation:
+            self._entries.clear()
+            self.generation = generation
+        entry = self._entries.get(key)
+        if entry is None:
+            metrics.CACHE_REQUESTS.inc(self.name, "miss")
+            return None
+        self._entries.move_to_end(key)
+        metrics.CACHE_REQUESTS.inc(self.name, "hit")
+        return entry
+
+    def put(self, generation: int, key, body: bytes):
+        """Guardar un cuerpo serializado; devuelve ``(etag, cuerpo)``"""
+        entry = (self.make_etag(generation, key), body)
+        if generation == self.generation:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,257 @@
+import argparse
+import os
+import sqlite3
+import time
+
+UNREGISTERED = 'Sin registrar'
+_DEPARTMENT = f"COALESCE((SELECT department FROM nfc_users WHERE id = NEW.user_id), '{UNREGISTERED}')"
+_DURATION = "(julianday(NEW.logout_time) - julianday(NEW.login_time)) * 86400.0"
+# Las filas edge-filter agregan N lecturas descartadas en el lector (ya contadas en /metrics)
+_COUNTED_AUTH = "auth_source IS NOT 'edge-filter'"
+
+
+def _move_user_history(sign: str, department: str) -> str:
+    """Sumar (``+``) o restar (``-``) el histórico del usuario en ``department``"""
+    return f'''
+        INSERT INTO rollup_auth_department_daily (day, department, attempts, successes)
+        SELECT substr(auth_timestamp, 1, 10), COALESCE({department}, '{UNREGISTERED}'),
+               {sign}COUNT(*), {sign}SUM(auth_success = 1)
+        FROM auth_logs WHERE user_id = NEW.id AND {_COUNTED_AUTH}
+        GROUP BY 1
+        ON CONFLICT (day, department) DO UPDATE
+        SET attempts = attempts + excluded.attempts, successes = successes + excluded.successes;
+        INSERT INTO rollup_sessions_daily (day, department, sessions, closed, total_seconds)
+        SELECT substr(login_time, 1, 10), COALESCE({department}, '{UNREGISTERED}'),
+               {sign}COUNT(*), {sign}COUNT(logout_time),
+               {sign}COALESCE(SUM((julianday(logout_time) - julianday(login_time)) * 86400.0), 0)
+        FROM user_sessions WHERE user_id = NEW.id
+        GROUP BY 1
+        ON CONFLICT (day, department) DO UPDATE
+        SET sessions = sessions + excluded.sessions, closed = closed + excluded.closed,
+            total_seconds = total_seconds + excluded.total_seconds;
+    '''
+
+ROLLUP_TABLES = {
+    'rollup_auth_device_hourly': '''
+        CREATE TABLE IF NOT EXISTS rollup_auth_device_hourly (
+            bucket TEXT NOT NULL,
+            device_id TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            failures INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, device_id)
+        ) WITHOUT ROWID
+    ''',
+    'rollup_auth_department_daily': '''
+        CREATE TABLE IF NOT EXISTS rollup_auth_department_daily (
+            day TEXT NOT NULL,
+            department TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            successes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, department)
+        ) WITHOUT ROWID
+    ''',
+    'rollup_sessions_daily': '''
+        CREATE TABLE IF NOT EXISTS rollup_sessions_daily (
+            day TEXT NOT NULL,
+            department TEXT NOT NULL,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            closed INTEGER NOT NULL DEFAULT 0,
+            total_seconds REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, department)
+        ) WITHOUT ROWID
+    ''',
+}
+
+ROLLUP_TRIGGERS = {
+    'trg_rollup_auth_insert': f'''
+    AFTER INSERT ON auth_logs WHEN NEW.{_COUNTED_AUTH} BEGIN
+        INSERT INTO rollup_auth_device_hourly (bucket, device_id, attempts, failures)
+        VALUES (substr(NEW.auth_timestamp, 1, 13) || ':00:00', NEW.device_id, 1, NOT NEW.auth_success)
+        ON CONFLICT (bucket, device_id) DO UPDATE
+        SET attempts = attempts + 1, failures = failures + excluded.failures;
+        INSERT INTO rollup_auth_department_daily (day, department, attempts, successes)
+        VALUES (substr(NEW.auth_timestamp, 1, 10), {_DEPARTMENT}, 1, NEW.auth_success = 1)
+        ON CONFLICT (day, department) DO UPDATE
+        SET attempts = attempts + 1, successes = successes + excluded.successes;
+    END
+    ''',
+    'trg_rollup_sessions_insert': f'''
+    AFTER INSERT ON user_sessions BEGIN
+        INSERT INTO rollup_sessions_daily (day, department, sessions, closed, total_seconds)
+        VALUES (substr(NEW.login_time, 1, 10), {_DEPARTMENT}, 1, NEW.logout_time IS NOT NULL,
+                COALESCE({_DURATION}, 0))
+        ON CONFLICT (day, department) DO UPDATE
+        SET sessions = sessions + 1, closed = closed + excluded.closed,
+            total_seconds = total_seconds + excluded.total_seconds;
+    END
+    ''',
+    'trg_rollup_sessions_close': f'''
+    AFTER UPDATE OF logout_time ON user_sessions
+    WHEN OLD.logout_time IS NULL AND NEW.logout_time IS NOT NULL BEGIN
+        INSERT INTO rollup_sessions_daily (day, department, sessions, closed, total_seconds)
+        VALUES (substr(NEW.login_time, 1, 10), {_DEPARTMENT}, 0, 1, {_DURATION})
+        ON CONFLICT (day, department) DO UPDATE
+        SET closed = closed + 1, total_seconds = total_seconds + excluded.total_seconds;
+    END
+    ''',
+    # Los informes agrupan por el departamento actual: un cambio reasigna el histórico del usuario
+    'trg_rollup_user_department': f'''
+    AFTER UPDATE OF department ON nfc_users
+    WHEN OLD.department IS NOT NEW.department BEGIN
+        {_move_user_history('-', 'OLD.department')}
+        {_move_user_history('', 'NEW.department')}
+        DELETE FROM rollup_auth_department_daily
+        WHERE department = COALESCE(OLD.department, '{UNREGISTERED}') AND attempts = 0;
+        DELETE FROM rollup_sessions_daily
+        WHERE department = COALESCE(OLD.department, '{UNREGISTERED}') AND sessions = 0;
+    END
+    ''',
+}
+
+# Agregación completa desde las tablas base (reconstrucción y comprobación)
+ROLLUP_SOURCES = {
+    'rollup_auth_device_hourly': f'''
+        SELECT substr(auth_timestamp, 1, 13) || ':00:00', device_id, COUNT(*), SUM(NOT auth_success)
+        FROM auth_logs
+        WHERE {_COUNTED_AUTH}
+        GROUP BY 1, 2
+    ''',
+    'rollup_auth_department_daily': f'''
+        SELECT substr(al.auth_timestamp, 1, 10), COALESCE(u.department, '{UNREGISTERED}'),
+               COUNT(*), SUM(al.auth_success = 1)
+        FROM auth_logs al
+        LEFT JOIN nfc_users u ON u.id = al.user_id
+        WHERE al.{_COUNTED_AUTH}
+        GROUP BY 1, 2
+    ''',
+    'rollup_sessions_daily': f'''
+        SELECT substr(us.login_time, 1, 10), COALESCE(u.department, '{UNREGISTERED}'),
+               COUNT(*), COUNT(us.logout_time),
+               COALESCE(SUM((julianday(us.logout_time) - julianday(us.login_time)) * 86400.0), 0)
+        FROM user_sessions us
+        LEFT JOIN nfc_users u ON u.id = us.user_id
+        GROUP BY 1, 2
+    ''',
+}
+
+# Informe -> (tabla, columna de periodo, columna de clave, agregados, granularidades admitidas)
+REPORTS = {
+    'auth_by_device': (
+        'rollup_auth_device_hourly', 'bucket', 'device_id',
+        {'attempts': 'SUM(attempts)', 'failures': 'SUM(failures)'}, ('hour', 'day', 'month')),
+    'auth_by_department': (
+        'rollup_auth_department_daily', 'day', 'department',
+        {'attempts': 'SUM(attempts)', 'successes': 'SUM(successes)',
+         'failures': 'SUM(attempts) - SUM(successes)'}, ('day', 'month')),
+    'sessions_by_department': (
+        'rollup_sessions_daily', 'day', 'department',
+        {'sessions': 'SUM(sessions)', 'closed': 'SUM(closed)',
+         'avg_seconds': 'ROUND(SUM(total_seconds) / NULLIF(SUM(closed), 0), 1)'}, ('day', 'month')),
+}
+GRANULARITY_LENGTH = {'hour': 19, 'day': 10, 'month': 7}
+
+
+def create_rollup_tables(cursor):
+    """Tablas de agregados y triggers que las mantienen con cada escritura.
+
+    Los triggers cubren a cualquier escritor (API, ingesta por lotes,
+    conciliación edge, otros procesos). El departamento es el actual del
+    usuario, igual que en la reconstrucción: al cambiarlo se reasigna su
+    histórico. Las filas ``edge-filter`` (lecturas descartadas en el lector,
+    agregadas) no cuentan como intentos. Las tablas se rellenan la primera
+    vez a partir del histórico, y de nuevo si cambia la definición de los
+    triggers; tras borrados o cambios manuales en las tablas base,
+    ``python rollups.py --rebuild``.
+    """
+    existing = {row[0] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'rollup_%'")}
+    triggers = dict(cursor.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_rollup_%'").fetchall())
+    for ddl in ROLLUP_TABLES.values():
+        cursor.execute(ddl)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_rollup_auth_device_hourly_device
+        ON rollup_auth_device_hourly (device_id, bucket)
+    ''')
+    # Para reasignar el histórico de un usuario sin recorrer las tablas base
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_auth_logs_user ON auth_logs (user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_sessions_user ON user_sessions (user_id)')
+    outdated = False
+    for name, trigger in ROLLUP_TRIGGERS.items():
+        sql = f"CREATE TRIGGER {name} {trigger}"
+        if triggers.get(name) != sql:
+            outdated = outdated or bool(triggers)
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(sql)
+    for table in ROLLUP_TABLES:
+        if outdated:
+            cursor.execute(f"DELETE FROM {table}")
+        if outdated or table not in existing:
+            cursor.execute(f"INSERT INTO {table} {ROLLUP_SOURCES[table]}")
+
+
+def drop_rollup_triggers(cursor):
+    """Para cargas masivas: sin triggers y ``rebuild_rollups`` al terminar"""
+    for name in ROLLUP_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def rebuild_rollups(db_path: str) -> dict:
+    """Recalcular todos los agregados en una transacción (bloquea a los escritores mientras dura)"""
+    conn = sqlite3.connect(db_path, timeout=60)
+    started = time.perf_counter()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.cursor()
+        create_rollup_tables(cursor)
+        counts = {}
+        for table, source in ROLLUP_SOURCES.items():
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(f"INSERT INTO {table} {source}")
+            counts[table] = cursor.rowcount
+        conn.commit()
+        return {'rows': counts, 'seconds': round(time.perf_counter() - started, 2)}
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def check_rollups(db_path: str) -> dict:
+    """Filas de cada agregado que no coinciden con una agregación completa (0 = consistente)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        drift = {}
+        for table, source in ROLLUP_SOURCES.items():
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            stored = ", ".join(f"ROUND({c}, 1)" if c == 'total_seconds' else c for c in columns)
+            fresh = ", ".join(f"ROUND(c{i}, 1)" if c == 'total_seconds' else f"c{i}"
+                              for i, c in enumerate(columns))
+            aliases = ", ".join(f"c{i}" for i in range(len(columns)))
+            drift[table] = conn.execute(f'''
+                WITH fresh ({aliases}) AS MATERIALIZED ({source})
+                SELECT (SELECT COUNT(*) FROM (SELECT {fresh} FROM fresh EXCEPT SELECT {stored} FROM {table}))
+                     + (SELECT COUNT(*) FROM (SELECT {stored} FROM {table} EXCEPT SELECT {fresh} FROM fresh))
+            ''').fetchone()[0]
+        return drift
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agregados de informes (autenticaciones y sesiones)")
+    parser.add_argument("--db", default=os.environ.get("NFC_DB_PATH", "nfc_auth_system.db"))
+    parser.add_argument("--rebuild", action="store_true", help="Recalcular los agregados desde cero")
+    parser.add_argument("--check", action="store_true", help="Comparar los agregados con una agregación completa")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        result = rebuild_rollups(args.db)
+        print(f"✅ Agregados reconstruidos en {result['seconds']} s: {result['rows']}")
+    if args.check or not args.rebuild:
+        drift = check_rollups(args.db)
+        for table, rows in drift.items():
+            print(f"{'✅' if not rows else '❌'} {table}: {rows} filas distintas")
+        if any(drift.values()):
+            raise SystemExit(1)
@@ -0,0 +1,242 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+import metrics
+from ledger_store import compute_tx_hash
+
+
+class IngestQueueFull(Exception):
+    """La cola de eventos de sesión está llena (el consumidor no da abasto)"""
+
+
+class SessionIngest:
+    """Ingesta de actividades y cierres de sesión por lotes.
+
+    La petición solo valida el token contra una caché en memoria (con una
+    consulta a la BD la primera vez que se ve cada sesión), calcula el hash
+    de la transacción, encola el evento y responde. Un hilo consumidor
+    agrupa hasta ``batch_size`` eventos (o lo que llegue en ``max_delay``
+    segundos) y los escribe con un solo append al ledger y un
+    ``executemany`` por tabla. ``max_queue`` acota la memoria: con la cola
+    llena ``submit_*`` lanza ``IngestQueueFull`` (503 en la API).
+
+    El cliente ya recibió 202 y el hash, así que un lote que falla no se
+    descarta: se reintenta por etapas (ledger, actividades, cierres) sin
+    repetir las ya escritas, con espera creciente hasta ``max_retry_delay``.
+    Mientras tanto la cola se llena y los productores reciben 503. Solo al
+    apagar se abandona tras ``stop_retries`` intentos.
+
+    Los tokens validados caducan de la caché a los ``token_ttl`` segundos,
+    así que un cierre hecho en otro worker se nota como mucho tras ese
+    tiempo. ``listener(tipo, sesión, campos)`` se llama al encolar cada
+    evento (p. ej. para publicarlo en el EventHub).
+    """
+
+    def __init__(self, database, ledger, batch_size: int = 500, max_delay: float = 0.05,
+                 max_queue: int = 50000, token_ttl: float = 60.0, max_tokens: int = 100000,
+                 clock=time.monotonic, listener=None, start: bool = True,
+                 retry_delay: float = 0.1, max_retry_delay: float = 5.0, stop_retries: int = 3):
+        self.database = database
+        self.ledger = ledger
+        self.listener = listener
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.token_ttl = token_ttl
+        self.max_tokens = max_tokens
+        self.clock = clock
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.stop_retries = stop_retries
+        self._tokens = OrderedDict()  # token -> ({id, device_id, department} o None, caduca_en)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._writing = 0
+        self._stop = False
+        self._thread = None
+        if start:
+            self.start()
+
+    def start(self):
+        """Arrancar el hilo consumidor (una sola vez)"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    # ---------- tokens ----------
+    def remember(self, session_token: str, session):
+        """Anotar una sesión (None = cerrada, aunque la BD aún no lo refleje)"""
+        self._tokens[session_token] = (session, self.clock() + self.token_ttl)
+        self._tokens.move_to_end(session_token)
+        while len(self._tokens) > self.max_tokens:
+            self._tokens.popitem(last=False)
+
+    def lookup(self, session_token: str):
+        """Sesión activa (``id``, ``device_id``, ``department``) o None"""
+        entry = self._tokens.get(session_token)
+        if entry is not None and entry[1] > self.clock():
+            # También los cierres aún encolados: su UPDATE todavía no está en la BD
+            metrics.CACHE_REQUESTS.inc("session_token", "hit")
+            return entry[0]
+        metrics.CACHE_REQUESTS.inc("session_token", "miss")
+        session = self.database.get_session_by_token(session_token)
+        if session is None or not session['is_active']:
+            self._tokens.pop(session_token, None)
+            return None
+        session = {'id': session['id'], 'device_id': session['device_id'],
+                   'department': session.get('department')}
+        self.remember(session_token, session)
+        return session
+
+    # ---------- productores ----------
+    def submit_activity(self, session_token: str, activity_type: str, description: str):
+        """Encolar una actividad; devuelve su hash de transacción o None si el token no es válido"""
+        session = self.lookup(session_token)
+        if session is None:
+            metrics.SESSION_EVENTS.inc("activity", "invalid_token")
+            return None
+        timestamp = datetime.now().timestamp()
+        attempt = (f"session_{session['id']}", timestamp, "activity_log", activity_type, True)
+        self._enqueue("activity", (session['id'], activity_type, description, timestamp), attempt)
+        tx_hash = compute_tx_hash(*attempt)
+        if self.listener is not None:
+            self.listener("activity", session, {"activity_type": activity_type, "description": description,
+                                                "blockchain_tx": tx_hash})
+        return tx_hash
+
+    def submit_logout(self, session_token: str) -> bool:
+        """Encolar el cierre; el token deja de aceptarse en este worker al instante"""
+        session = self.lookup(session_token)
+        if session is None:
+            metrics.SESSION_EVENTS.inc("logout", "invalid_token")
+            return False
+        timestamp = datetime.now().timestamp()
+        # Mismo registro en el ledger que SessionManager.logout_user
+        attempt = (f"logout_{session_token[:8]}", timestamp, "session_management", "logout", True)
+        self._enqueue("logout", (session_token, timestamp), attempt)
+        self.remember(session_token, None)
+        if self.listener is not None:
+            self.listener("logout", session, {})
+        return True
+
+    def _enqueue(self, kind: str, row: tuple, attempt: tuple):
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                metrics.SESSION_EVENTS.inc(kind, "rejected")
+                raise IngestQueueFull("Cola de eventos de sesión llena")
+            self._queue.append((kind, row, attempt))
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+        metrics.SESSION_EVENTS.inc(kind, "accepted")
+
+    # ---------- consumidor ----------
+    def _consume(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stop:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                # Dar tiempo a que el lote se llene (salvo al apagar)
+                deadline = time.monotonic() + self.max_delay
+                while len(self._queue) < self.batch_size and not self._stop:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._writing = len(batch)
+            try:
+                self._write_batch(batch)
+            finally:
+                with self._cond:
+                    self._writing = 0
+                    self._cond.notify_all()
+
+    def _write_batch(self, batch: list):
+        started = time.perf_counter()
+        tx_hashes = activities = logouts = None
+        failures = 0
+        while True:
+            try:
+                # Cada etapa es una transacción: tras un fallo se reanuda en la que falló
+                if tx_hashes is None:
+                    tx_hashes = self.ledger.record_auth_attempts([attempt for _, _, attempt in batch])
+                    activities, logouts = [], []
+                    for (kind, row, _), tx_hash in zip(batch, tx_hashes):
+                        if kind == "activity":
+                            session_id, activity_type, description, timestamp = row
+                            activities.append((session_id, activity_type, description,
+                                               _utc_timestamp(timestamp), tx_hash))
+                        else:
+                            session_token, timestamp = row
+                            logouts.append((_utc_timestamp(timestamp), session_token))
+                if activities:
+                    self.database.log_session_activities(activities)
+                    activities = None
+                if logouts:
+                    self.database.close_sessions(logouts)
+                    logouts = None
+                break
+            except Exception as e:
+                failures += 1
+                if self._stop and failures >= self.stop_retries:
+                    if tx_hashes is None:
+                        unwritten = [row[0] for kind, row, _ in batch if kind == "logout"]
+                    else:
+                        unwritten = [session_token for _, session_token in logouts or ()]
+                    self._abandon(batch, tx_hashes is None, unwritten, e)
+                    return
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** (failures - 1))
+                print(f"⚠️ Error escribiendo un lote de {len(batch)} eventos de sesión "
+                      f"(intento {failures}, reintento en {delay:.1f} s): {e}")
+                for kind, _, _ in batch:
+                    metrics.SESSION_EVENTS.inc(kind, "retried")
+                with self._cond:
+                    self._cond.wait(delay)
+        metrics.SESSION_BATCH_LATENCY.observe(time.perf_counter() - started)
+        for kind in ("activity", "logout"):
+            count = sum(1 for event in batch if event[0] == kind)
+            if count:
+                metrics.SESSION_EVENTS.inc(kind, "written", amount=count)
+
+    def _abandon(self, batch: list, ledger_failed: bool, logout_tokens: list, error: Exception):
+        """Apagado con la BD caída: se pierde el lote y se olvidan los cierres no escritos"""
+        print(f"❌ Se descartan {len(batch)} eventos de sesión al apagar "
+              f"({'sin escribir' if ledger_failed else 'ya en el ledger'}): {error}")
+        for kind, _, _ in batch:
+            metrics.SESSION_EVENTS.inc(kind, "failed")
+        # El token deja de darse por cerrado: la próxima consulta irá a la BD
+        for session_token in logout_tokens:
+            self._tokens.pop(session_token, None)
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Esperar a que se escriba todo lo encolado hasta ahora"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify()
+            while self._queue or self._writing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout: float = 30.0):
+        """Vaciar la cola y parar el consumidor (apagado del servidor)"""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def __len__(self):
+        return len(self._queue)
+
+
+def _utc_timestamp(timestamp: float) -> str:
+    """Mismo formato que CURRENT_TIMESTAMP de SQLite"""
+    return datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
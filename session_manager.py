@@ -1,17 +1,17 @@
-import sqlite3
 import secrets
 from datetime import datetime
 from database import DatabaseManager
 from blockchain_simulated import BlockchainSimulated
 
 class SessionManager:
-    def __init__(self):
-        self.db = DatabaseManager()
-        self.blockchain = BlockchainSimulated()
+    def __init__(self, db: DatabaseManager = None, blockchain=None):
+        self.db = db or DatabaseManager()
+        # Comparación explícita: un ledger vacío tiene len() == 0 y sería falso
+        self.blockchain = blockchain if blockchain is not None else BlockchainSimulated()
     
     def create_session(self, user_id: int, device_id: str) -> str:
         """Crear nueva sesión para usuario"""
-        conn = sqlite3.connect(self.db.db_name)
+        conn = self.db._connect()
         cursor = conn.cursor()
         
         # Generar token único para la sesión
@@ -30,7 +30,7 @@ class SessionManager:
     
     def log_activity(self, session_token: str, activity_type: str, description: str):
         """Registrar actividad durante la sesión"""
-        conn = sqlite3.connect(self.db.db_name)
+        conn = self.db._connect()
         cursor = conn.cursor()
         
         # Obtener session_id
@@ -70,7 +70,7 @@ class SessionManager:
     
     def logout_user(self, session_token: str) -> bool:
         """Cerrar sesión de usuario"""
-        conn = sqlite3.connect(self.db.db_name)
+        conn = self.db._connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -100,7 +100,7 @@ class SessionManager:
     
     def get_session_activities(self, session_token: str):
         """Obtener todas las actividades de una sesión"""
-        conn = sqlite3.connect(self.db.db_name)
+        conn = self.db._connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -129,7 +129,7 @@ class SessionManager:
     
     def is_session_active(self, session_token: str) -> bool:
         """Verificar si una sesión está activa"""
-        conn = sqlite3.connect(self.db.db_name)
+        conn = self.db._connect()
         cursor = conn.cursor()
         
         cursor.execute('''
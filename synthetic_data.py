@@ -0,0 +1,221 @@
+import argparse
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from activity_search import create_fts_index
+from database import DatabaseManager
+from rollups import drop_rollup_triggers, rebuild_rollups
+
+SYNTHETIC_PIN = "0000"
+DEPARTMENTS = ["Inteligencia", "Analisis", "Operaciones", "Desarrollo", "Administración",
+               "Logistica", "Seguridad", "Comunicaciones"]
+FAILURE_REASONS = ["PIN incorrecto", "Tarjeta no registrada"]
+ACTIVITY_TYPES = ["LOGIN", "CONSULTA_DOCUMENTO", "EDITAR_INFORME", "IMPRIMIR",
+                  "EXPORTAR_DATOS", "DESCARGA_MASIVA", "ENVIO_CORREO", "LOGOUT"]
+ACTIVITY_TEXTS = ["Consulta de expediente {n}", "Edición del informe semanal {n}",
+                  "Impresión de documento confidencial {n}", "Exportar datos a USB externo {n}",
+                  "Descarga masiva del archivo {n}", "Envío de correo con adjunto {n}",
+                  "Revisión de acceso restringido {n}", "Copia de seguridad del lote {n}"]
+
+
+def synthetic_nfc_id(index: int) -> str:
+    """UID sintético determinista (10 hex) para el usuario ``index``"""
+    return f"5E{index:08X}"
+
+
+def _chunks(total: int, size: int):
+    done = 0
+    while done < total:
+        step = min(size, total - done)
+        yield done, step
+        done += step
+
+
+def _timestamps(start: datetime, span_seconds: float, offset: int, count: int, total: int, rng):
+    """Marcas de tiempo crecientes repartidas uniformemente con algo de ruido"""
+    step = span_seconds / max(total, 1)
+    for i in range(offset, offset + count):
+        yield (start + timedelta(seconds=i * step + rng.random() * step)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class SyntheticDataGenerator:
+    """Pobla la base de datos de autenticación a escala configurable.
+
+    Inserta con ``executemany`` por lotes y pragmas de carga masiva. Todos los
+    usuarios sintéticos comparten un único hash de ``SYNTHETIC_PIN`` para no
+    pasar horas en scrypt; la generación es reproducible con ``seed``.
+    """
+
+    def __init__(self, db_name: str, seed: int = 42, days: int = 90, chunk_size: int = 50000):
+        self.db_name = db_name
+        self.rng = random.Random(seed)
+        self.days = days
+        self.chunk_size = chunk_size
+        self.db = DatabaseManager(db_name)
+        self.end = datetime(2025, 11, 1)
+        self.start = self.end - timedelta(days=days)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA cache_size = -200000")
+        return conn
+
+    def _progress(self, table: str, done: int, total: int, started: float):
+        rate = done / max(time.perf_counter() - started, 1e-9)
+        print(f"   {table}: {done:,}/{total:,} ({rate:,.0f} filas/s)", end="\r", flush=True)
+
+    def generate_users(self, count: int) -> list:
+        """Insertar usuarios; devuelve sus ids"""
+        pin_hash = self.db.pin_hasher.hash_pin(SYNTHETIC_PIN)
+        conn = self._connect()
+        started = time.perf_counter()
+        try:
+            for offset, step in _chunks(count, self.chunk_size):
+                rows = []
+                for i in range(offset, offset + step):
+                    department = self.rng.choice(DEPARTMENTS)
+                    rows.append((synthetic_nfc_id(i), f"user{i}", f"Usuario Sintético {i}", department,
+                                 self.rng.choice((1, 1, 2, 2, 3)), i % 500 == 0, pin_hash))
+                conn.executemany('''
+                    INSERT OR IGNORE INTO nfc_users
+                    (nfc_id, username, full_name, department, security_level, is_admin, pin)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+                self._progress("nfc_users", offset + step, count, started)
+            print()
+            return [row[0] for row in conn.execute(
+                "SELECT id FROM nfc_users WHERE nfc_id LIKE '5E%' ORDER BY id")]
+        finally:
+            conn.close()
+
+    def generate_auth_logs(self, count: int, user_ids: list, devices: int = 200,
+                           failure_rate: float = 0.1, unknown_rate: float = 0.03):
+        """Insertar ``count`` intentos de autenticación en orden cronológico"""
+        conn = self._connect()
+        started = time.perf_counter()
+        span = (self.end - self.start).total_seconds()
+        rng = self.rng
+        try:
+            for offset, step in _chunks(count, self.chunk_size):
+                rows = []
+                for timestamp in _timestamps(self.start, span, offset, step, count, rng):
+                    device_id = f"ACR122U-SIM-{rng.randrange(devices):03d}"
+                    roll = rng.random()
+                    tx_hash = f"0x{rng.getrandbits(80):020x}"
+                    if roll < unknown_rate:
+                        rows.append((0, f"FF{rng.getrandbits(32):08X}", device_id, False,
+                                     timestamp, tx_hash, "Tarjeta no registrada"))
+                        continue
+                    user_index = rng.randrange(len(user_ids))
+                    success = roll >= unknown_rate + failure_rate
+                    rows.append((user_ids[user_index], synthetic_nfc_id(user_index), device_id, success,
+                                 timestamp, tx_hash, None if success else "PIN incorrecto"))
+                conn.executemany('''
+                    INSERT INTO auth_logs
+                    (user_id, nfc_id, device_id, auth_success, auth_timestamp, blockchain_tx_hash, failure_reason)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+                self._progress("auth_logs", offset + step, count, started)
+            print()
+        finally:
+            conn.close()
+
+    def generate_sessions(self, count: int, user_ids: list) -> list:
+        """Insertar sesiones; devuelve ``[(id, token)]``"""
+        conn = self._connect()
+        started = time.perf_counter()
+        span = (self.end - self.start).total_seconds()
+        rng = self.rng
+        try:
+            for offset, step in _chunks(count, self.chunk_size):
+                rows = []
+                for timestamp in _timestamps(self.start, span, offset, step, count, rng):
+                    login = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
+                    logout = (login + timedelta(minutes=rng.randint(5, 480))).strftime('%Y-%m-%d %H:%M:%S')
+                    rows.append((rng.choice(user_ids), f"{rng.getrandbits(128):032x}",
+                                 f"ACR122U-SIM-{rng.randrange(200):03d}", timestamp, logout, False))
+                conn.executemany('''
+                    INSERT INTO user_sessions
+                    (user_id, session_token, device_id, login_time, logout_time, is_active)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+                self._progress("user_sessions", offset + step, count, started)
+            print()
+            return conn.execute("SELECT id, session_token FROM user_sessions ORDER BY id").fetchall()
+        finally:
+            conn.close()
+
+    def generate_activities(self, count: int, sessions: list):
+        """Insertar actividades repartidas entre las sesiones"""
+        conn = self._connect()
+        started = time.perf_counter()
+        span = (self.end - self.start).total_seconds()
+        rng = self.rng
+        # Sin el trigger FTS durante la carga: reconstruir el índice al final es ~8 veces más rápido
+        conn.execute("DROP TRIGGER IF EXISTS trg_session_activities_fts_insert")
+        try:
+            for offset, step in _chunks(count, self.chunk_size):
+                rows = []
+                for timestamp in _timestamps(self.start, span, offset, step, count, rng):
+                    kind = rng.randrange(len(ACTIVITY_TYPES))
+                    rows.append((rng.choice(sessions)[0], ACTIVITY_TYPES[kind],
+                                 ACTIVITY_TEXTS[kind].format(n=rng.randrange(100000)),
+                                 timestamp, f"0x{rng.getrandbits(80):020x}"))
+                conn.executemany('''
+                    INSERT INTO session_activities
+                    (session_id, activity_type, activity_description, timestamp, blockchain_tx_hash)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', rows)
+                conn.commit()
+                self._progress("session_activities", offset + step, count, started)
+            print()
+        finally:
+            print("   Reconstruyendo el índice de búsqueda de actividades...", flush=True)
+            conn.execute("INSERT INTO session_activities_fts (session_activities_fts) VALUES ('rebuild')")
+            create_fts_index(conn.cursor(), 'session_activities', ('activity_type', 'activity_description'))
+            conn.commit()
+            conn.close()
+
+    def generate(self, users: int, auth_logs: int, sessions: int, activities: int) -> dict:
+        """Generar todas las tablas y devolver un resumen"""
+        started = time.perf_counter()
+        # Agregados de informes: se recalculan una vez al final en lugar de fila a fila
+        conn = self._connect()
+        drop_rollup_triggers(conn.cursor())
+        conn.close()
+        try:
+            user_ids = self.generate_users(users)
+            self.generate_auth_logs(auth_logs, user_ids)
+            session_rows = self.generate_sessions(sessions, user_ids) if sessions else []
+            if activities and session_rows:
+                self.generate_activities(activities, session_rows)
+        finally:
+            print("   Recalculando agregados de informes...", flush=True)
+            rebuild_rollups(self.db_name)
+        return {"users": users, "auth_logs": auth_logs, "sessions": sessions,
+                "activities": activities, "seconds": round(time.perf_counter() - started, 2)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generar datos sintéticos para benchmarks")
+    parser.add_argument("--db", default="bench_nfc_auth_system.db")
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--auth-logs", type=int, default=1000000)
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--activities", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    print(f"🧪 Generando datos sintéticos en {args.db}")
+    generator = SyntheticDataGenerator(args.db, seed=args.seed, days=args.days, chunk_size=args.chunk_size)
+    summary = generator.generate(args.users, args.auth_logs, args.sessions, args.activities)
+    print(f"✅ Generación completada en {summary['seconds']} s: {summary}")
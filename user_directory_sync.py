@@ -0,0 +1,146 @@
+import sqlite3
+import threading
+import time
+
+import requests
+
+
+class UserDirectoryReplica:
+    """Réplica local del directorio de usuarios para lectores y clientes edge.
+
+    Se mantiene al día con ``/users/changes?since=`` aplicando solo los
+    cambios desde la última secuencia conocida, de modo que cada sondeo
+    cuesta bytes por cambio en lugar de la tabla completa. El estado vive en
+    memoria para búsquedas O(1) y se persiste en SQLite para sobrevivir
+    reinicios sin resincronizar todo.
+    """
+
+    def __init__(self, api_url: str, db_name: str = "edge_user_directory.db",
+                 page_size: int = 1000, timeout: float = 5.0):
+        self.api_url = api_url.rstrip("/")
+        self.db_name = db_name
+        self.page_size = page_size
+        self.timeout = timeout
+        self.users = {}
+        self.last_seq = 0
+        self.last_sync = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._init_storage()
+
+    # ---------- almacenamiento local ----------
+    def _init_storage(self):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS directory_users (
+                    nfc_id TEXT PRIMARY KEY,
+                    username TEXT,
+                    full_name TEXT,
+                    department TEXT,
+                    security_level INTEGER,
+                    is_admin BOOLEAN
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS directory_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+            conn.commit()
+            for row in conn.execute('SELECT nfc_id, username, full_name, department, security_level, is_admin '
+                                    'FROM directory_users'):
+                self.users[row[0]] = {'nfc_id': row[0], 'username': row[1], 'full_name': row[2],
+                                      'department': row[3], 'security_level': row[4], 'is_admin': bool(row[5])}
+            result = conn.execute("SELECT value FROM directory_meta WHERE key = 'last_seq'").fetchone()
+            self.last_seq = int(result[0]) if result else 0
+        finally:
+            conn.close()
+
+    def _persist(self, changes: list, reset: bool, last_seq: int):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            if reset:
+                conn.execute('DELETE FROM directory_users')
+            upserts = [(c['nfc_id'], c.get('username'), c.get('full_name'), c.get('department'),
+                        c.get('security_level'), c.get('is_admin')) for c in changes if c['op'] == 'upsert']
+            removes = [(c['nfc_id'],) for c in changes if c['op'] == 'remove']
+            conn.executemany('INSERT OR REPLACE INTO directory_users VALUES (?, ?, ?, ?, ?, ?)', upserts)
+            conn.executemany('DELETE FROM directory_users WHERE nfc_id = ?', removes)
+            conn.execute("INSERT OR REPLACE INTO directory_meta (key, value) VALUES ('last_seq', ?)",
+                         (str(last_seq),))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ---------- sincronización ----------
+    def apply(self, delta: dict):
+        """Aplicar una respuesta de /users/changes a la réplica"""
+        changes = delta.get('changes', [])
+        reset = delta.get('reset', False)
+        with self._lock:
+            self._persist(changes, reset, delta['latest_seq'])
+            users = {} if reset else self.users
+            for change in changes:
+                if change['op'] == 'upsert':
+                    users[change['nfc_id']] = {k: v for k, v in change.items() if k not in ('op', 'seq')}
+                else:
+                    users.pop(change['nfc_id'], None)
+            self.users = users
+            self.last_seq = delta['latest_seq']
+
+    def sync(self) -> int:
+        """Traer y aplicar todos los cambios pendientes; devuelve cuántos se aplicaron"""
+        applied = 0
+        while True:
+            response = requests.get(f"{self.api_url}/users/changes",
+                                    params={"since": self.last_seq, "limit": self.page_size},
+                                    timeout=self.timeout)
+            response.raise_for_status()
+            delta = response.json()
+            self.apply(delta)
+            applied += len(delta.get('changes', []))
+            if not delta.get('has_more'):
+                break
+        self.last_sync = time.time()
+        return applied
+
+    def start_background_sync(self, interval: float = 30.0):
+        """Sincronizar periódicamente en un hilo daemon (los fallos de red se reintentan)"""
+        def loop():
+            while not self._stop.is_set():
+                try:
+                    self.sync()
+                except Exception:
+                    pass
+                self._stop.wait(interval)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------- consultas ----------
+    def get(self, nfc_id: str):
+        """Usuario de la réplica o None"""
+        return self.users.get(nfc_id)
+
+    def __contains__(self, nfc_id: str) -> bool:
+        return nfc_id in self.users
+
+    def __len__(self):
+        return len(self.users)
+
+
+# Prueba rápida
+if __name__ == "__main__":
+    import sys
+
+    replica = UserDirectoryReplica(sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8000")
+    print(f"📂 Réplica local: {len(replica)} usuarios (secuencia {replica.last_seq})")
+    applied = replica.sync()
+    print(f"✅ {applied} cambios aplicados - {len(replica)} usuarios (secuencia {replica.last_seq})")